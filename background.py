@@ -0,0 +1,89 @@
+import queue
+import threading
+from collections import deque
+from session import CompilationSession
+
+
+class CompileJob:
+    __slots__ = ('source', 'outputs', 'task', 'callback', 'cancelled', 'result', 'value', 'error')
+
+    def __init__(self, source, outputs, task, callback):
+        self.source = source
+        self.outputs = outputs  # CompilationResult outputs to compute before calling back
+        self.task = task  # Optional further work on the result, such as running it; its return becomes value
+        self.callback = callback  # Called with the job once it is done
+        self.cancelled = False
+        self.result = None
+        self.value = None
+        self.error = None
+
+
+class CompileWorker:
+    # Compiles on one background thread that owns the session. Finished jobs wait in a queue
+    # until poll() hands them to their callbacks on the caller's thread, which for the GUI is
+    # the Tk main loop. A job for an older buffer is dropped as soon as a newer one arrives;
+    # one already running stops at the next phase boundary.
+    def __init__(self, session=None, cache=None):
+        self.session = session or CompilationSession(cache=cache)
+        self.jobs = deque()
+        self.finished = queue.Queue()
+        self.condition = threading.Condition()
+        self.latest_source = None
+        self.current = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self.work, name="sylva-compiler", daemon=True)
+        self.thread.start()
+
+    def submit(self, source, outputs, callback, task=None):
+        job = CompileJob(source, list(outputs), task, callback)
+        with self.condition:
+            if source != self.latest_source:
+                self.latest_source = source
+                for stale in self.jobs:
+                    stale.cancelled = True
+                self.jobs.clear()
+                if self.current is not None:
+                    self.current.cancelled = True
+            self.jobs.append(job)
+            self.condition.notify()
+        return job
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.jobs and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                job = self.current = self.jobs.popleft()
+            try:
+                self.session.update(job.source)
+                job.result = self.session.result()
+                for name in job.outputs:
+                    if job.cancelled:
+                        break
+                    job.result.output(name)
+                if job.task is not None and not job.cancelled:
+                    job.value = job.task(job.result)
+            except Exception as error:
+                job.error = error
+            with self.condition:
+                self.current = None
+            if not job.cancelled:
+                self.finished.put(job)
+
+    def poll(self):
+        # Runs the callbacks of every job finished since the last poll
+        while True:
+            try:
+                job = self.finished.get_nowait()
+            except queue.Empty:
+                return
+            # A job that finished just before a newer buffer arrived is stale all the same
+            if not job.cancelled and job.source == self.latest_source:
+                job.callback(job)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
@@ -0,0 +1,3 @@
+from benchmarks.generator import ProgramGenerator, generate_program, shapes
+from benchmarks.harness import (compile_phases, measure, run_benchmarks, compare, save_report, load_report,
+                                format_report)
@@ -0,0 +1,54 @@
+import argparse
+import sys
+from instrumentation import profile
+from benchmarks.generator import shapes, generate_program
+from benchmarks.harness import (default_sizes, run_benchmarks, save_report, load_report, compare, format_report,
+                                compile_phases)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Time every compiler phase on generated Sylva programs.")
+    parser.add_argument('--shape', action='append', choices=list(shapes),
+                        help="program shape to benchmark; repeat for several (default: mixed)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help="statements per program")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per program; the fastest counts")
+    parser.add_argument('--save', metavar='PATH', help="write the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', help="flag regressions against a saved baseline")
+    parser.add_argument('--trace', metavar='PATH',
+                        help="profile compiling the largest program and write a Chrome trace")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    def progress(shape, result):
+        print(f"{shape}: {result['size']} statements, {result['tokens']} tokens, "
+              f"{result['total'] * 1000:.1f} ms", file=sys.stderr, flush=True)
+
+    report = run_benchmarks(args.shape or ['mixed'], args.sizes, args.seed, args.repeat, progress)
+    print(format_report(report))
+    if args.trace:
+        with profile() as profiler:
+            compile_phases(generate_program(max(args.sizes), args.seed, (args.shape or ['mixed'])[0]))
+        profiler.save(args.trace)
+        print(profiler)
+        print(f"Saved trace to {args.trace}")
+    if args.save:
+        save_report(report, args.save)
+        print(f"Saved baseline to {args.save}")
+    if args.compare:
+        baseline = load_report(args.compare)
+        regressions = compare(report, baseline, args.tolerance)
+        if baseline.get('compiler_version') != report['compiler_version']:
+            print(f"Comparing against compiler {baseline.get('compiler_version')}")
+        if regressions:
+            print(f"{len(regressions)} regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import random
+
+# ProgramGenerator methods that emit one statement, and how often each shape picks them
+statement_kinds = ['declaration', 'long_expression', 'if_chain', 'for_loop', 'while_loop', 'function', 'call']
+shapes = {
+    'mixed': [4, 2, 2, 1, 1, 1, 2],
+    'declarations': [12, 2, 1, 1, 1, 1, 1],
+    'nesting': [2, 6, 6, 1, 1, 1, 1],
+    'blocks': [2, 1, 3, 3, 3, 2, 1],
+    'functions': [2, 1, 1, 1, 1, 6, 8],
+}
+comparisons = ['<', '<=', '>', '>=', '!=']  # '==' lexes as two assignments
+operators = ['+', '-', '*', '/', '%']
+
+
+class ProgramGenerator:
+    # Emits valid Sylva programs: every name is declared before it is read, every declaration
+    # starts with a literal of its own type and every call names a function with the right
+    # number of arguments, so all phases run to the end without errors. The grammar has no
+    # statements inside then(...) blocks, so nesting shows up as long if / if not / else chains
+    # and deep operator expressions instead.
+    def __init__(self, seed=0, shape='mixed', block_length=4, chain_length=3, expression_depth=4,
+                 parameters=3):
+        if shape not in shapes:
+            raise ValueError(f"Unknown shape {shape}; expected one of {', '.join(shapes)}")
+        self.random = random.Random(seed)
+        self.shape = shape
+        self.block_length = block_length  # Assignments per then(...) block
+        self.chain_length = chain_length  # Branches after the first in an if chain
+        self.expression_depth = expression_depth  # Operators per expression
+        self.parameters = parameters  # Most parameters a function takes
+        self.names = {'num': [], 'point': [], 'line': [], 'binal': []}
+        self.functions = []  # (name, parameter count)
+        self.count = 0
+
+    def name(self, prefix):
+        self.count += 1
+        return f"{prefix}{self.count}"
+
+    def literal(self, datatype):
+        if datatype == 'num':
+            return str(self.random.randint(1, 99))
+        if datatype == 'point':
+            return f"{self.random.randint(0, 99)}.{self.random.randint(1, 9)}"
+        if datatype == 'line':
+            return f'"s{self.random.randint(0, 999)}"'
+        return self.random.choice(['True', 'False'])
+
+    def numeric_operand(self):
+        if self.names['num'] and self.random.random() < 0.6:
+            return self.random.choice(self.names['num'])
+        return self.literal('num')
+
+    def expression(self, depth):
+        # Starts with a literal, as the semantic analyzer checks the first operand's type
+        parts = [self.literal('num')]
+        for _ in range(depth):
+            operator = self.random.choice(operators)
+            parts.append(operator)
+            parts.append(self.literal('num') if operator in '/%' else self.numeric_operand())
+        return ' '.join(parts)
+
+    def variable(self):
+        datatypes = [datatype for datatype, names in self.names.items() if names]
+        datatype = self.random.choice(datatypes)
+        return datatype, self.random.choice(self.names[datatype])
+
+    def block(self, extra=()):
+        lines = []
+        for _ in range(self.block_length):
+            if extra and self.random.random() < 0.3:
+                datatype, target = 'num', self.random.choice(extra)
+            else:
+                datatype, target = self.variable()
+            lines.append(f"    {target} = {self.literal(datatype)};")
+        return lines
+
+    def condition(self):
+        return f"{self.random.choice(self.names['num'])} {self.random.choice(comparisons)} {self.random.randint(0, 99)}"
+
+    def declaration(self):
+        datatype = self.random.choice(['num', 'num', 'point', 'line', 'binal'])
+        name = self.name({'num': 'n', 'point': 'p', 'line': 's', 'binal': 'b'}[datatype])
+        value = self.expression(self.random.randint(0, 2)) if datatype == 'num' else self.literal(datatype)
+        self.names[datatype].append(name)
+        return [f"{datatype} {name} = {value};"]
+
+    def long_expression(self):
+        name = self.name('e')
+        line = f"num {name} = {self.expression(self.expression_depth)};"
+        self.names['num'].append(name)
+        return [line]
+
+    def if_chain(self):
+        lines = [f"if({self.condition()}):", "then("] + self.block() + [")"]
+        for index in range(self.chain_length):
+            if index == self.chain_length - 1 and self.random.random() < 0.5:
+                lines += ["else:", "then("] + self.block() + [")"]
+            else:
+                lines += [f"if not({self.condition()}):", "then("] + self.block() + [")"]
+        lines[-1] += ";"
+        return lines
+
+    def for_loop(self):
+        counter = self.name('i')
+        header = f"for(num {counter} = 0, {counter} < {self.random.randint(1, 9)}, {counter}++):"
+        lines = [header, "then("] + self.block() + [");"]
+        self.names['num'].append(counter)
+        return lines
+
+    def while_loop(self):
+        counter = self.random.choice(self.names['num'])
+        return [f"while({counter} < {self.random.randint(1, 9)}):", "then("] + self.block() + [f"    {counter} = 99;", ");"]
+
+    def function(self):
+        name = self.name('f')
+        parameters = [self.name('a') for _ in range(self.random.randint(0, self.parameters))]
+        signature = ', '.join(f"num {parameter}" for parameter in parameters)
+        lines = [f"func {name}({signature}):", "then("] + self.block(parameters) + [");"]
+        self.functions.append((name, len(parameters)))
+        return lines
+
+    def call(self):
+        name, count = self.random.choice(self.functions)
+        return [f"{name}({', '.join(self.numeric_operand() for _ in range(count))});"]
+
+    def statement(self):
+        kind = self.random.choices(statement_kinds, shapes[self.shape])[0]
+        if kind == 'call' and not self.functions:
+            kind = 'function'
+        return getattr(self, {'declaration': 'declaration', 'long_expression': 'long_expression', 'if_chain': 'if_chain',
+                              'for_loop': 'for_loop', 'while_loop': 'while_loop', 'function': 'function',
+                              'call': 'call'}[kind])()
+
+    def generate(self, statements):
+        lines = []
+        # A few of every type up front, so blocks and conditions always have something to use
+        for datatype in self.names:
+            for _ in range(2):
+                name = self.name(datatype[0])
+                self.names[datatype].append(name)
+                lines.append(f"{datatype} {name} = {self.literal(datatype)};")
+        for _ in range(statements):
+            lines.extend(self.statement())
+        return '\n'.join(lines) + '\n'
+
+
+def generate_program(statements, seed=0, shape='mixed', **options):
+    return ProgramGenerator(seed, shape, **options).generate(statements)
@@ -0,0 +1,176 @@
+import gc
+import json
+import math
+import platform
+import time
+import tracemalloc
+from tabulate import tabulate
+from sylvalexical import lex
+from sylvasyntax import SyntaxAnalyzer
+from sylvasemantic import SemanticAnalyzer
+from intermediatecode import IntermediateCodeGenerator
+from optimizer import PassManager
+from codegeneration import CodeGenerator
+from compilecache import compiler_version
+from benchmarks.generator import generate_program
+
+phases = ['lex', 'parse', 'analyze', 'optimize', 'generate']
+default_sizes = [250, 500, 1000, 2000]
+noise_floor = 0.002  # Seconds; slower phases under this are timer noise, not regressions
+
+
+def compile_phases(code):
+    # Runs the compiler one phase at a time; returns seconds per phase and the token count
+    timings = {}
+    start = time.perf_counter()
+    tokens, symbol_table = lex(code)
+    timings['lex'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    analyzer = SyntaxAnalyzer(tokens, symbol_table)
+    syntax_results = analyzer.parse()
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    semantic_results = SemanticAnalyzer(analyzer.program, symbol_table).analyze()
+    timings['analyze'] = time.perf_counter() - start
+    errors = syntax_results or [result for result in semantic_results if result.severity == 'error']
+    if errors:
+        raise ValueError(f"Benchmark program does not compile: {errors[0]}")
+
+    start = time.perf_counter()
+    intermediate_code = IntermediateCodeGenerator(analyzer.program).generate()
+    intermediate_code = PassManager(symbol_table=symbol_table, measure=False).run(intermediate_code)
+    timings['optimize'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    CodeGenerator(intermediate_code, symbol_table).generate_code()
+    timings['generate'] = time.perf_counter() - start
+    return timings, len(tokens)
+
+
+def peak_memory(code):
+    # Measured in a run of its own, since tracing allocations slows everything down
+    gc.collect()
+    tracemalloc.start()
+    try:
+        compile_phases(code)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(code, repeat=3):
+    # Best of repeat runs per phase, which is the least disturbed by whatever else the machine does
+    best = {phase: math.inf for phase in phases}
+    for _ in range(repeat):
+        timings, tokens = compile_phases(code)
+        for phase, seconds in timings.items():
+            best[phase] = min(best[phase], seconds)
+    total = sum(best.values())
+    return {
+        'lines': code.count('\n'),
+        'tokens': tokens,
+        'timings': best,
+        'total': total,
+        'tokens_per_second': tokens / total if total else 0.0,
+        'peak_bytes': peak_memory(code),
+    }
+
+
+def growth_exponent(sizes, seconds):
+    # Slope of log(time) against log(size): about 1 for linear work, 2 for quadratic
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, seconds) if value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, y in points) / len(points)
+    mean_y = sum(y for x, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, y in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def run_benchmarks(shapes=('mixed',), sizes=None, seed=0, repeat=3, progress=None):
+    sizes = sorted(sizes or default_sizes)
+    report = {
+        'compiler_version': compiler_version(),
+        'python': platform.python_version(),
+        'seed': seed,
+        'repeat': repeat,
+        'shapes': {},
+    }
+    for shape in shapes:
+        results = []
+        for size in sizes:
+            result = measure(generate_program(size, seed, shape), repeat)
+            result['size'] = size
+            results.append(result)
+            if progress:
+                progress(shape, result)
+        exponents = {phase: growth_exponent(sizes, [result['timings'][phase] for result in results])
+                     for phase in phases}
+        exponents['total'] = growth_exponent(sizes, [result['total'] for result in results])
+        report['shapes'][shape] = {'results': results, 'exponents': exponents}
+    return report
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def compare(report, baseline, tolerance=0.25, exponent_margin=0.25):
+    # Regressions of report against baseline: phases more than tolerance slower at the same size,
+    # higher peak memory, or times that grow with size faster than they used to
+    regressions = []
+    for shape, current in report['shapes'].items():
+        previous = baseline.get('shapes', {}).get(shape)
+        if previous is None:
+            continue
+        previous_results = {result['size']: result for result in previous['results']}
+        for result in current['results']:
+            old = previous_results.get(result['size'])
+            if old is None:
+                continue
+            for phase in phases:
+                seconds, old_seconds = result['timings'][phase], old['timings'].get(phase)
+                if old_seconds is None:
+                    continue
+                if seconds > old_seconds * (1 + tolerance) and seconds - old_seconds > noise_floor:
+                    regressions.append(f"{shape} size {result['size']}: {phase} took {seconds * 1000:.1f} ms, "
+                                       f"baseline {old_seconds * 1000:.1f} ms")
+            if result['peak_bytes'] > old['peak_bytes'] * (1 + tolerance):
+                regressions.append(f"{shape} size {result['size']}: peak memory {result['peak_bytes'] / 2 ** 20:.1f} MB, "
+                                   f"baseline {old['peak_bytes'] / 2 ** 20:.1f} MB")
+        for phase, exponent in current['exponents'].items():
+            old_exponent = previous['exponents'].get(phase)
+            if exponent is not None and old_exponent is not None and exponent > old_exponent + exponent_margin:
+                regressions.append(f"{shape}: {phase} now grows as size^{exponent:.2f}, baseline size^{old_exponent:.2f}")
+    return regressions
+
+
+def format_report(report):
+    tables = []
+    for shape, data in report['shapes'].items():
+        headers = ["Size", "Lines", "Tokens"] + [f"{phase} (ms)" for phase in phases] + ["Total (ms)", "Tokens/s", "Peak (MB)"]
+        rows = []
+        for result in data['results']:
+            rows.append([result['size'], result['lines'], result['tokens']] +
+                        [round(result['timings'][phase] * 1000, 1) for phase in phases] +
+                        [round(result['total'] * 1000, 1), round(result['tokens_per_second']),
+                         round(result['peak_bytes'] / 2 ** 20, 2)])
+        exponents = data['exponents']
+        rows.append(["Growth", "", ""] + [format_exponent(exponents[phase]) for phase in phases] +
+                    [format_exponent(exponents['total']), "", ""])
+        tables.append(f"Shape: {shape}\n" + tabulate(rows, headers, tablefmt='grid'))
+    return "\n\n".join(tables)
+
+
+def format_exponent(exponent):
+    return "" if exponent is None else f"n^{exponent:.2f}"
@@ -0,0 +1,142 @@
+import struct
+import sys
+from array import array
+from intermediatecode import Const
+from instructions import Instruction, Opcode, Register, operand_slots, register_numbers, literal
+from instrumentation import span
+
+# Layout: header, the memory names, the constant pool as source text, padding to a word
+# boundary, then three little-endian int32 words per instruction: opcode, operand, operand.
+# An operand word is an index shifted left two bits with the operand kind in the low bits.
+# Operands are encoded by their slot: a 'memory' slot is always a name, and a 'value' slot
+# holds a register only when the operand is a Register.
+magic = b'SYLV'
+version = 1
+header = struct.Struct('<4sHHIII')  # magic, version, reserved, names, constants, instructions
+words_per_instruction = 3
+
+REGISTER = 0
+MEMORY = 1
+CONSTANT = 2
+ADDRESS = 3
+
+
+def resolve_labels(instructions):
+    # Labels take no space, so each one is the index of the instruction that follows it
+    addresses = {}
+    address = 0
+    for instruction in instructions:
+        if instruction.opcode == Opcode.LABEL:
+            addresses[instruction.operands[0]] = address
+        else:
+            address += 1
+    return addresses
+
+
+@span('encode')
+def encode(instructions):
+    addresses = resolve_labels(instructions)
+    names = {}
+    constants = {}
+    words = array('i')
+    for instruction in instructions:
+        if instruction.opcode == Opcode.LABEL:
+            continue
+        encoded = [0, 0]
+        for slot, (kind, value) in enumerate(zip(operand_slots[instruction.opcode], instruction.operands)):
+            if kind in ('label', 'function'):
+                label = f"{value}_start" if kind == 'function' else value
+                if label not in addresses:
+                    raise ValueError(f"Undefined label {label} in {instruction}")
+                encoded[slot] = addresses[label] << 2 | ADDRESS
+            elif kind == 'register' or (kind == 'value' and isinstance(value, Register)):
+                if value not in register_numbers:
+                    raise ValueError(f"{value} is not a register in {instruction}")
+                encoded[slot] = register_numbers[value] << 2 | REGISTER
+            elif isinstance(value, Const):
+                encoded[slot] = constants.setdefault(value.text, len(constants)) << 2 | CONSTANT
+            else:
+                encoded[slot] = names.setdefault(value, len(names)) << 2 | MEMORY
+        words.append(instruction.opcode)
+        words.extend(encoded)
+    if sys.byteorder != 'little':
+        words.byteswap()
+
+    data = bytearray(header.pack(magic, version, 0, len(names), len(constants), len(words) // words_per_instruction))
+    for text in list(names) + list(constants):
+        encoded_text = text.encode('utf-8')
+        data += struct.pack('<H', len(encoded_text)) + encoded_text
+    data += bytes(-len(data) % 4)
+    data += words.tobytes()
+    return bytes(data)
+
+
+class Bytecode:
+    # A decoded program. On little-endian machines code is a view into the original bytes
+    def __init__(self, names, constants, code):
+        self.names = names
+        self.constants = constants
+        self.code = code
+
+    def __len__(self):
+        return len(self.code) // words_per_instruction
+
+
+def decode(data):
+    view = memoryview(data)
+    found, file_version, _, name_count, constant_count, count = header.unpack_from(view)
+    if found != magic:
+        raise ValueError("Not a Sylva bytecode file")
+    if file_version != version:
+        raise ValueError(f"Unsupported bytecode version {file_version}")
+    offset = header.size
+    strings = []
+    for _ in range(name_count + constant_count):
+        (length,) = struct.unpack_from('<H', view, offset)
+        offset += 2
+        strings.append(str(view[offset:offset + length], 'utf-8'))
+        offset += length
+    offset += -offset % 4
+    code = view[offset:offset + count * words_per_instruction * 4]
+    if sys.byteorder == 'little':
+        code = code.cast('i')
+    else:
+        code = array('i', code)
+        code.byteswap()
+    constants = [literal(text) for text in strings[name_count:]]
+    return Bytecode(strings[:name_count], constants, code)
+
+
+def disassemble(bytecode):
+    # Back to instruction objects. Jump targets are labelled "@<address>" and called
+    # addresses "@<address>_start", so the result encodes to the same bytes again.
+    def operand(word):
+        kind, index = word & 3, word >> 2
+        if kind == REGISTER:
+            return Register(f"R{index}")
+        if kind == MEMORY:
+            return bytecode.names[index]
+        if kind == CONSTANT:
+            return bytecode.constants[index]
+        return f"@{index}"
+
+    decoded = []
+    labels = {}  # address -> label names
+    for address in range(len(bytecode)):
+        base = address * words_per_instruction
+        opcode = Opcode(bytecode.code[base])
+        operands = []
+        for slot, kind in enumerate(operand_slots[opcode]):
+            value = operand(bytecode.code[base + 1 + slot])
+            if kind in ('label', 'function'):
+                label = f"{value}_start" if kind == 'function' else value
+                labels.setdefault(int(value[1:]), set()).add(label)
+            operands.append(value)
+        decoded.append(Instruction(opcode, *operands))
+    instructions = []
+    for address in range(len(decoded) + 1):
+        for label in sorted(labels.get(address, ())):
+            instructions.append(Instruction(Opcode.LABEL, label))
+        if address < len(decoded):
+            instructions.append(decoded[address])
+    return instructions
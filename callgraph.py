@@ -0,0 +1,155 @@
+from tabulate import tabulate
+from intermediatecode import Quad, renamed_copy
+
+
+class FunctionDefinition:
+    # One func body in the intermediate code: code[start] is its func quad, code[end] the
+    # return closing it, and body everything between its receives and that return
+    __slots__ = ('name', 'start', 'end', 'params', 'body', 'nested')
+
+    def __init__(self, name, start):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.params = []  # Parameter names, in argument order
+        self.body = []
+        self.nested = False  # Defines another function inside itself
+
+    @property
+    def size(self):
+        return len(self.params) + len(self.body)
+
+
+class CallGraph:
+    # Which function calls which, over the functions the lexer declared in the symbol table.
+    # None stands for the top-level code, the only caller that runs without being called.
+    # Functions defined more than once, or not declared, are left out: a call to one could
+    # land on either body.
+    def __init__(self, code, symbol_table=None):
+        self.code = code
+        self.definitions = {}  # name -> FunctionDefinition
+        self.calls = {None: {}}  # caller -> {callee: call sites}
+        self.sites = {}  # callee -> [(position of the call quad, caller)]
+        self.frequency = {}  # callee -> estimated calls per run, ten for each loop around a site
+        declared = None
+        if symbol_table is not None:
+            declared = {entry['Name'] for entry in symbol_table.get_all_entries()
+                        if entry['Entry Type'] == 'function'}
+        repeated = set()
+        open_functions = []
+        depths = loop_depths(code)
+        for position, quad in enumerate(code):
+            if quad.op == 'func':
+                if open_functions:
+                    open_functions[-1].nested = True
+                if quad.dest in self.definitions:
+                    repeated.add(quad.dest)
+                definition = FunctionDefinition(quad.dest, position)
+                self.definitions.setdefault(quad.dest, definition)
+                self.calls.setdefault(quad.dest, {})
+                open_functions.append(definition)
+            elif not open_functions:
+                if quad.op == 'call':
+                    self.add_call(None, quad.dest, position, depths[position])
+            elif quad.op == 'return':
+                open_functions.pop().end = position
+            elif quad.op == 'receive' and not open_functions[-1].body:
+                open_functions[-1].params.append(quad.dest)
+            else:
+                open_functions[-1].body.append(quad)
+                if quad.op == 'call':
+                    self.add_call(open_functions[-1].name, quad.dest, position, depths[position])
+        for name in list(self.definitions):
+            definition = self.definitions[name]
+            if name in repeated or definition.end is None or (declared is not None and name not in declared):
+                del self.definitions[name]
+
+    def add_call(self, caller, callee, position, depth):
+        calls = self.calls[caller]
+        calls[callee] = calls.get(callee, 0) + 1
+        self.sites.setdefault(callee, []).append((position, caller))
+        self.frequency[callee] = self.frequency.get(callee, 0) + 10 ** min(depth, 6)
+
+    def callees(self, caller):
+        return self.calls.get(caller, {})
+
+    def reachable(self, start=None):
+        # Functions a call from start can end up running, directly or through other calls
+        reached = set()
+        worklist = list(self.callees(start))
+        while worklist:
+            name = worklist.pop()
+            if name not in reached:
+                reached.add(name)
+                worklist.extend(self.callees(name))
+        return reached
+
+    def recursive(self, name):
+        return name in self.reachable(name)
+
+    def unreachable(self):
+        # Functions nothing the top-level code calls can run; every one is safe to drop
+        reached = self.reachable()
+        return [name for name in self.definitions if name not in reached]
+
+    def inlinable(self, name):
+        # A body can be copied to its call sites if it is defined once, holds no function of
+        # its own and never ends up calling itself
+        definition = self.definitions.get(name)
+        return definition is not None and not definition.nested and not self.recursive(name)
+
+    def region(self, name):
+        # The positions a function takes up, with the jump over it and the label after it
+        definition = self.definitions[name]
+        start, end = definition.start, definition.end
+        end_label = f"{name}_end"
+        if (start > 0 and self.code[start - 1].op == 'jump' and self.code[start - 1].dest == end_label
+                and end + 1 < len(self.code) and self.code[end + 1].op == 'label'
+                and self.code[end + 1].dest == end_label):
+            return start - 1, end + 1
+        return start, end
+
+    def __str__(self):
+        headers = ["Function", "Size", "Call Sites", "Estimated Calls", "Callers", "Calls"]
+        rows = []
+        for name, definition in self.definitions.items():
+            callers = sorted({'(top level)' if caller is None else caller for _, caller in self.sites.get(name, ())})
+            rows.append([name, definition.size, len(self.sites.get(name, ())), self.frequency.get(name, 0),
+                         ", ".join(callers), ", ".join(sorted(self.callees(name)))])
+        return tabulate(rows, headers, tablefmt='grid')
+
+
+def loop_depths(code):
+    # How many loops enclose each position: a jump back to an earlier label closes a loop
+    # over everything in between
+    labels = {}
+    delta = [0] * (len(code) + 1)
+    for position, quad in enumerate(code):
+        if quad.op == 'label':
+            labels[quad.dest] = position
+        elif quad.op in ('jump', 'iffalse') and quad.dest in labels:
+            delta[labels[quad.dest]] += 1
+            delta[position + 1] -= 1
+    depths = []
+    depth = 0
+    for position in range(len(code)):
+        depth += delta[position]
+        depths.append(depth)
+    return depths
+
+
+def inline_call(definition, args, fresh):
+    # The code that does what calling definition with args does: the arguments copied into
+    # the parameters, then a renamed copy of the body. An argument naming another parameter
+    # is read into a temporary first, as the call read them all before assigning any.
+    code = []
+    staged = []
+    for name, value in zip(definition.params, args):
+        if isinstance(value, str) and value in definition.params and value != name:
+            temp = fresh.temp()
+            code.append(Quad('copy', temp, value))
+            value = temp
+        staged.append(Quad('copy', name, value))
+    code.extend(staged)
+    code.extend(renamed_copy(definition.body, fresh))
+    return code
@@ -0,0 +1,179 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tabulate import tabulate
+from pipeline import compile_source
+from compilecache import CompilationCache, default_directory
+
+source_suffix = '.sylva'
+phases = ['lex', 'parse', 'analyze', 'generate', 'render', 'assemble']
+
+cache = None  # Each worker process opens the cache once
+
+
+def open_cache(directory):
+    global cache
+    cache = CompilationCache(directory) if directory else None
+
+
+def find_sources(paths):
+    # Every source file named or found under a directory, once each
+    sources = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for directory, subdirectories, files in os.walk(path):
+                subdirectories.sort()
+                found.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith(source_suffix))
+        else:
+            found = [path]
+        for source in found:
+            if os.path.abspath(source) not in seen:
+                seen.add(os.path.abspath(source))
+                sources.append(source)
+    return sources
+
+
+def output_root(paths):
+    # The deepest directory holding every path given; sources keep their place below it
+    # when their outputs go to another directory
+    return os.path.commonpath([os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path))
+                               for path in paths])
+
+
+def output_path(path, output_dir=None, root=None):
+    # Where a source's outputs go, without their suffix: next to it, or at the same place
+    # below output_dir as the source is below root
+    stem = os.path.splitext(path)[0]
+    if output_dir is None:
+        return stem
+    return os.path.join(output_dir, os.path.relpath(os.path.abspath(stem), root or os.getcwd()))
+
+
+def compile_file(path, output=None, diagnostics_format='text'):
+    # Compiles one file and writes its assembly and diagnostics to output with their suffixes,
+    # next to the source by default; returns a summary for the report
+    output = output or output_path(path)
+    start = time.perf_counter()
+    summary = {'path': path, 'errors': 0, 'tokens': 0, 'timings': {}, 'cached': False, 'failure': None}
+    try:
+        with open(path, encoding='utf-8') as file:
+            code = file.read()
+        result = compile_source(code, cache)
+        diagnostics = result.diagnostics.unique()
+        with open(output + '.asm', 'w', encoding='utf-8') as file:
+            file.write(result.assembly + "\n")
+        diagnostics_path = output + '.diag'
+        if diagnostics:
+            with open(diagnostics_path, 'w', encoding='utf-8') as file:
+                if diagnostics_format == 'json':
+                    file.write(diagnostics.to_json() + "\n")
+                else:
+                    file.write(diagnostics.format(path) + "\n")
+        elif os.path.exists(diagnostics_path):
+            os.remove(diagnostics_path)  # Left over from an earlier build that had errors
+        summary.update(errors=len(diagnostics.errors), tokens=len(result.tokens), timings=result.timings,
+                       cached=not result.timings)
+    except Exception as error:
+        summary['failure'] = f"{type(error).__name__}: {error}"
+    summary['elapsed'] = time.perf_counter() - start
+    return summary
+
+
+def compile_chunk(jobs, diagnostics_format):
+    return [compile_file(path, output, diagnostics_format) for path, output in jobs]
+
+
+def chunked(items, size):
+    return [items[index:index + size] for index in range(0, len(items), size)]
+
+
+def report(summaries, wall_time, jobs):
+    totals = {phase: 0.0 for phase in phases}
+    for summary in summaries:
+        for phase, seconds in summary['timings'].items():
+            totals[phase] += seconds
+    cpu_time = sum(summary['elapsed'] for summary in summaries)
+    tokens = sum(summary['tokens'] for summary in summaries)
+    rows = [[phase, round(totals[phase] * 1000, 1)] for phase in phases]
+    rows.append(['Total (all workers)', round(cpu_time * 1000, 1)])
+    rows.append(['Wall clock', round(wall_time * 1000, 1)])
+    print(tabulate(rows, ["Phase", "Time (ms)"], tablefmt='grid'))
+    failed = sum(1 for summary in summaries if summary['failure'])
+    with_errors = sum(1 for summary in summaries if summary['errors'])
+    cached = sum(1 for summary in summaries if summary['cached'])
+    rate = tokens / wall_time if wall_time else 0
+    print(f"{len(summaries)} files, {with_errors} with errors, {failed} failed, {cached} from cache, "
+          f"{jobs} workers, {rate:,.0f} tokens/s, {cpu_time / wall_time if wall_time else 0:.1f}x parallel speedup")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile Sylva source files in parallel.")
+    parser.add_argument('paths', nargs='+', help=f"{source_suffix} files or directories to search")
+    parser.add_argument('-o', '--output-dir', help="where to write .asm and .diag files (default: next to each source)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument('--chunk-size', type=int, default=0, help="files per task (default: spread evenly)")
+    parser.add_argument('--cache-dir', default=None, help="compilation cache directory")
+    parser.add_argument('--no-cache', action='store_true', help="always compile from scratch")
+    parser.add_argument('--diagnostics-format', choices=['text', 'json'], default='text',
+                        help="how .diag files list problems: path:line:column lines or JSON")
+    parser.add_argument('-q', '--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args(argv)
+
+    sources = find_sources(args.paths)
+    if not sources:
+        print("No source files found")
+        return 1
+    root = output_root(args.paths) if args.output_dir else None
+    tasks = [(path, output_path(path, args.output_dir, root)) for path in sources]
+    writers = {}  # output path -> the source writing it
+    for path, output in tasks:
+        other = writers.setdefault(os.path.abspath(output), path)
+        if other != path:
+            print(f"{other} and {path} would both write {output}.asm")
+            return 1
+    for path, output in tasks:
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    cache_dir = None if args.no_cache else (args.cache_dir or default_directory())
+    jobs = max(1, min(args.jobs, len(sources)))
+    chunk_size = args.chunk_size or max(1, len(sources) // (jobs * 4))
+
+    summaries = []
+
+    def progress(summary):
+        summaries.append(summary)
+        if args.quiet:
+            return
+        if summary['failure']:
+            status = f"failed: {summary['failure']}"
+        elif summary['errors']:
+            status = f"{summary['errors']} errors"
+        else:
+            status = "ok"
+        cached = ", cached" if summary['cached'] else ""
+        print(f"[{len(summaries)}/{len(sources)}] {summary['path']}: {status} "
+              f"({summary['elapsed'] * 1000:.1f} ms{cached})", flush=True)
+
+    start = time.perf_counter()
+    if jobs == 1:
+        open_cache(cache_dir)
+        for path, output in tasks:
+            progress(compile_file(path, output, args.diagnostics_format))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=open_cache, initargs=(cache_dir,)) as executor:
+            futures = [executor.submit(compile_chunk, chunk, args.diagnostics_format)
+                       for chunk in chunked(tasks, chunk_size)]
+            for future in as_completed(futures):
+                for summary in future.result():
+                    progress(summary)
+    wall_time = time.perf_counter() - start
+
+    report(summaries, wall_time, jobs)
+    return 1 if any(summary['errors'] or summary['failure'] for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
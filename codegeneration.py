@@ -1,115 +1,123 @@
+from intermediatecode import binary_operators, is_temporary
+from registerallocation import LinearScanAllocator, argument_registers
+from instructions import Instruction, Opcode, register_numbers, render_assembly
+from instrumentation import span, count
+
+opcodes = {'+': Opcode.ADD, '-': Opcode.SUB, '*': Opcode.MUL, '/': Opcode.DIV, '%': Opcode.MOD,
+           '<': Opcode.LT, '<=': Opcode.LE, '>': Opcode.GT, '>=': Opcode.GE, '==': Opcode.EQ, '!=': Opcode.NE}
+
+
 class CodeGenerator:
-    def __init__(self, tokens, symbol_table):
-        self.tokens = tokens
+    def __init__(self, code, symbol_table, allocate_registers=True):
+        self.code = code
         self.symbol_table = symbol_table
-        self.assembly_code = []
-        self.label_count = 0
-        self.registers = {
-            'R0': None, 'R1': None, 'R2': None, 'R3': None, 'R4': None,
-            'R5': None, 'R6': None, 'R7': None
-        }
+        self.instructions = []
+        self.registers = {register: None for register in register_numbers}
+        self.allocate_registers = allocate_registers
+        self.allocation = {}  # variable -> register holding it; everything else lives in memory
 
-    def generate_code(self):
-        i = 0
-        while i < len(self.tokens):
-            token = self.tokens[i]
-            if token.type == 'DATA_TYPE':
-                # Handle variable declarations and assignments
-                datatype = token.value
-                variable_name = self.tokens[i + 1].value
-                if self.tokens[i + 2].type == 'ASSIGNMENT':
-                    value_token = self.tokens[i + 3]
-                    self.assembly_code.append(f"LOAD R0, {value_token.value}")
-                    self.assembly_code.append(f"STORE R0, {variable_name}")
-                i += 4
-            elif token.type == 'IDENTIFIER':
-                if self.is_function_call(i):
-                    # Handle function calls
-                    function_name = token.value
-                    arguments = self.get_function_arguments(i + 1)
-                    for j, arg in enumerate(arguments):
-                        self.assembly_code.append(f"LOAD R{j}, {arg}")
-                    self.assembly_code.append(f"CALL {function_name}")
-                else:
-                    # Handle variable usage
-                    variable_name = token.value
-                    self.assembly_code.append(f"LOAD R0, {variable_name}")
-                i += 1
-            elif token.type == 'KEYWORD' and token.value in ['if', 'while', 'for']:
-                # Handle control structures
-                if token.value == 'if':
-                    condition = self.tokens[i + 1]
-                    self.label_count += 1
-                    label = f"L{self.label_count}"
-                    self.assembly_code.append(f"LOAD R0, {condition.value}")
-                    self.assembly_code.append(f"JZ R0, {label}")
-                    i += self.handle_block(i + 2)
-                    self.assembly_code.append(f"{label}:")
-                elif token.value == 'while':
-                    condition = self.tokens[i + 1]
-                    self.label_count += 1
-                    start_label = f"L{self.label_count}"
-                    self.label_count += 1
-                    end_label = f"L{self.label_count}"
-                    self.assembly_code.append(f"{start_label}:")
-                    self.assembly_code.append(f"LOAD R0, {condition.value}")
-                    self.assembly_code.append(f"JZ R0, {end_label}")
-                    i += self.handle_block(i + 2)
-                    self.assembly_code.append(f"JMP {start_label}")
-                    self.assembly_code.append(f"{end_label}:")
-                elif token.value == 'for':
-                    init = self.tokens[i + 1]
-                    condition = self.tokens[i + 3]
-                    increment = self.tokens[i + 5]
-                    self.label_count += 1
-                    start_label = f"L{self.label_count}"
-                    self.label_count += 1
-                    end_label = f"L{self.label_count}"
-                    self.assembly_code.append(f"LOAD R0, {init.value}")
-                    self.assembly_code.append(f"{start_label}:")
-                    self.assembly_code.append(f"LOAD R0, {condition.value}")
-                    self.assembly_code.append(f"JZ R0, {end_label}")
-                    i += self.handle_block(i + 6)
-                    self.assembly_code.append(f"LOAD R0, {increment.value}")
-                    self.assembly_code.append(f"JMP {start_label}")
-                    self.assembly_code.append(f"{end_label}:")
-            elif token.type == 'KEYWORD' and token.value == 'func':
-                # Handle function definitions
-                function_name = self.tokens[i + 1].value
-                self.label_count += 1
-                start_label = f"{function_name}_start"
-                self.assembly_code.append(f"{start_label}:")
-                i += self.handle_block(i + 4)
-                self.assembly_code.append("RET")
-            i += 1
-        return "\n".join(self.assembly_code)
+    def allocate(self):
+        # R0-R3 carry call arguments and R0 is scratch, so values only live in the rest
+        allocator = LinearScanAllocator([r for r in self.registers if r not in argument_registers])
+        self.allocation = allocator.allocate(self.code)
+        for name, register in self.allocation.items():
+            if self.registers[register] is None:
+                self.registers[register] = []
+            self.registers[register].append(name)
+        return allocator
+
+    def emit(self, opcode, *operands):
+        self.instructions.append(Instruction(opcode, *operands))
 
-    def is_function_call(self, index):
-        return index + 1 < len(self.tokens) and self.tokens[index + 1].type == 'LEFT_PAREN'
+    def allocated(self, value):
+        # The register holding value, or None for a constant or a variable in memory
+        return self.allocation.get(value) if isinstance(value, str) else None
 
-    def get_function_arguments(self, index):
-        args = []
-        i = index + 1  # Skip the opening parenthesis
-        while self.tokens[i].type != 'RIGHT_PAREN':
-            if self.tokens[i].type == 'IDENTIFIER' or self.tokens[i].type == 'NUMERIC_LITERAL' or self.tokens[i].type == 'STRING_LITERAL' or self.tokens[i].type == 'FLOAT_LITERAL' or self.tokens[i].type == 'BOOL_LITERAL':
-                args.append(self.tokens[i].value)
-            i += 1
-        return args
+    def location(self, value):
+        register = self.allocated(value)
+        return value if register is None else register
 
-    def handle_block(self, index):
-        # Handle the block of code inside control structures or function definitions
-        i = index
-        while self.tokens[i].type != 'RIGHT_PAREN':
-            if self.tokens[i].type == 'IDENTIFIER':
-                if self.is_function_call(i):
-                    function_name = self.tokens[i].value
-                    arguments = self.get_function_arguments(i + 1)
-                    for j, arg in enumerate(arguments):
-                        self.assembly_code.append(f"LOAD R{j}, {arg}")
-                    self.assembly_code.append(f"CALL {function_name}")
+    def move(self, register, value):
+        source = self.allocated(value)
+        if source is None:
+            self.emit(Opcode.LOAD, register, value)
+        elif source != register:
+            self.emit(Opcode.MOV, register, source)
+
+    def store(self, register, name):
+        target = self.allocation.get(name)
+        if target is None:
+            self.emit(Opcode.STORE, register, name)
+        elif target != register:
+            self.emit(Opcode.MOV, target, register)
+
+    @span('CodeGenerator.generate')
+    def generate(self):
+        allocator = self.allocate() if self.allocate_registers else None
+        if allocator:
+            for name in sorted(allocator.live_at_entry):
+                if name in self.allocation and not is_temporary(name):
+                    self.emit(Opcode.LOAD, self.allocation[name], name)
+        pushed = []  # arguments past the argument registers, pushed right before the call
+        for quad in self.code:
+            op = quad.op
+            if op == 'copy':
+                source = self.allocated(quad.arg1)
+                target = self.allocation.get(quad.dest)
+                if target:
+                    self.move(target, quad.arg1)
+                elif source is not None:
+                    self.emit(Opcode.STORE, source, quad.dest)
+                else:
+                    self.move('R0', quad.arg1)
+                    self.store('R0', quad.dest)
+            elif op in binary_operators:
+                # Work in the destination's register unless that would overwrite the right operand
+                target = self.allocation.get(quad.dest)
+                right = self.location(quad.arg2)
+                work = target if target and target != right else 'R0'
+                self.move(work, quad.arg1)
+                self.emit(opcodes[op], work, right)
+                self.store(work, quad.dest)
+            elif op == 'iffalse':
+                condition = self.allocated(quad.arg1)
+                if condition is None:
+                    self.move('R0', quad.arg1)
+                    condition = 'R0'
+                self.emit(Opcode.JZ, condition, quad.dest)
+            elif op == 'label':
+                self.emit(Opcode.LABEL, quad.dest)
+            elif op == 'jump':
+                self.emit(Opcode.JMP, quad.dest)
+            elif op == 'param':
+                if quad.arg2 < len(argument_registers):
+                    self.move(argument_registers[quad.arg2], quad.arg1)
                 else:
-                    variable_name = self.tokens[i].value
-                    self.assembly_code.append(f"LOAD R0, {variable_name}")
-                i += 1
-            i += 1
-        return i - index + 1
+                    pushed.append(self.location(quad.arg1))
+            elif op == 'call':
+                # Extra arguments go on the stack last first, so the callee pops them in order
+                for value in reversed(pushed):
+                    self.emit(Opcode.PUSH, value)
+                pushed = []
+                self.emit(Opcode.CALL, quad.dest)
+            elif op == 'func':
+                self.emit(Opcode.LABEL, f"{quad.dest}_start")
+            elif op == 'receive':
+                if quad.arg1 < len(argument_registers):
+                    self.store(argument_registers[quad.arg1], quad.dest)
+                else:
+                    self.emit(Opcode.POP, 'R0')
+                    self.store('R0', quad.dest)
+            elif op == 'return':
+                self.emit(Opcode.RET)
+        # Named variables are observable once the program ends, so registers are written back
+        for name, register in self.allocation.items():
+            if not is_temporary(name):
+                self.emit(Opcode.STORE, register, name)
+        count('instructions emitted', len(self.instructions))
+        return self.instructions
+
+    @span('CodeGenerator.generate_code')
+    def generate_code(self):
+        # The same program as assembly text
+        return render_assembly(self.generate())
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from collections import OrderedDict
+
+# Any change to these modules can change what a source compiles to, so their text is part
+# of every cache key and an edited compiler never reads artifacts written by an older one
+compiler_modules = ['sylvalexical', 'sylvasyntax', 'sylvaast', 'sylvasemantic', 'dataflow', 'intermediatecode',
+                    'callgraph', 'loops', 'optimizer', 'registerallocation', 'codegeneration', 'instructions', 'peephole',
+                    'bytecode', 'diagnostics', 'pipeline']
+entry_suffix = '.sylc'
+
+
+def compiler_version():
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in compiler_modules:
+        with open(os.path.join(directory, f"{module}.py"), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+
+def default_directory():
+    return os.environ.get('SYLVA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'sylva')
+
+
+class CompilationCache:
+    # Compiled artifacts on disk, one zlib-compressed pickle per source, evicted least
+    # recently used first once the directory grows past max_bytes
+    def __init__(self, directory=None, max_bytes=64 * 1024 * 1024, version=None):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.version = version or compiler_version()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(entry_suffix) and entry.is_file():
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len(entry_suffix)], stat.st_size))
+        for mtime, key, size in sorted(found):
+            self.entries[key] = size
+        self.size = sum(self.entries.values())
+
+    def key(self, source):
+        return hashlib.sha256(f"{self.version}\0{source}".encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + entry_suffix)
+
+    def get(self, source):
+        key = self.key(source)
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as file:
+                artifact = pickle.loads(zlib.decompress(file.read()))
+            os.utime(path)  # Recency survives into the next session through the mtime
+        except FileNotFoundError:
+            self.forget(key)
+            self.misses += 1
+            return None
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # A damaged entry is as good as a missing one
+            self.remove(key)
+            self.misses += 1
+            return None
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.hits += 1
+        return artifact
+
+    def put(self, source, artifact):
+        key = self.key(source)
+        data = zlib.compress(pickle.dumps(artifact, pickle.HIGHEST_PROTOCOL))
+        # Written under a temporary name and renamed, so readers never see half an entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self.forget(key)
+        self.entries[key] = len(data)
+        self.size += len(data)
+        self.evict()
+
+    def forget(self, key):
+        self.size -= self.entries.pop(key, 0)
+
+    def remove(self, key):
+        self.forget(key)
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+
+    def clear(self):
+        for key in list(self.entries):
+            self.remove(key)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,669 @@
+import heapq
+from intermediatecode import Const, split_blocks, block_successors, binary_operators, constant, evaluate, is_temporary
+from sylvaast import NodeVisitor, BinaryOp, Assignment, Declaration, Function
+from sylvalexical import Token
+from instrumentation import span
+
+
+class ControlFlowGraph:
+    # Basic blocks of instructions that each have uses() and defines(), and the edges between
+    # them. Entries are where control arrives from outside the graph (the program start and
+    # every function), exits the blocks with nowhere else to go.
+    def __init__(self, blocks, successors, entries, exits=None):
+        self.blocks = blocks
+        self.successors = successors
+        self.entries = [entry for entry in entries if entry < len(blocks)]
+        self.predecessors = [[] for _ in blocks]
+        for index, targets in enumerate(successors):
+            for target in targets:
+                self.predecessors[target].append(index)
+        if exits is None:
+            exits = [index for index, targets in enumerate(successors) if not targets]
+        self.exits = exits
+        self.order = self.reverse_postorder()
+
+    @classmethod
+    def from_code(cls, code):
+        # Function bodies are entered by calls, which the straight-line graph steps over
+        blocks = split_blocks(code)
+        entries = [0] + [index for index, block in enumerate(blocks) if block[0].op == 'func']
+        return cls(blocks, block_successors(blocks), entries)
+
+    def reverse_postorder(self):
+        # Every block before the blocks it flows into, loops aside; blocks nothing reaches go
+        # last. The last successor of a block is searched last and so ordered right after it.
+        seen = [False] * len(self.blocks)
+        postorder = []
+        for entry in self.entries:
+            if seen[entry]:
+                continue
+            seen[entry] = True
+            stack = [(entry, iter(self.successors[entry]))]
+            while stack:
+                index, targets = stack[-1]
+                for target in targets:
+                    if not seen[target]:
+                        seen[target] = True
+                        stack.append((target, iter(self.successors[target])))
+                        break
+                else:
+                    stack.pop()
+                    postorder.append(index)
+        order = postorder[::-1]
+        order.extend(index for index in range(len(self.blocks)) if not seen[index])
+        return order
+
+    def reachable(self, starts, removed=()):
+        # Blocks control can get to from starts without taking any (source, target) edge in removed
+        reached = set()
+        worklist = list(starts)
+        while worklist:
+            index = worklist.pop()
+            if index in reached:
+                continue
+            reached.add(index)
+            worklist.extend(target for target in self.successors[index] if (index, target) not in removed)
+        return reached
+
+
+@span('dataflow.solve', 'dataflow')
+def solve(cfg, gen, kill, forward=True, union=True, boundary=None, top=0):
+    # Worklist solver for bit-vector problems: each block turns the value flowing into it into
+    # gen | (value & ~kill), and values meet by union or intersection where paths join. Blocks
+    # in boundary also take that value from outside the graph; everything else starts at the
+    # identity of the meet (0 for union, top for intersection). Blocks are taken in reverse
+    # postorder (postorder going backward), so most problems settle in a pass or two plus one
+    # per loop nesting level. Returns the values at the start and at the end of every block.
+    count = len(cfg.blocks)
+    boundary = boundary or {}
+    empty = 0 if union else top
+    inputs = cfg.predecessors if forward else cfg.successors
+    outputs = cfg.successors if forward else cfg.predecessors
+    order = cfg.order if forward else cfg.order[::-1]
+    rank = [0] * count
+    for position, index in enumerate(order):
+        rank[index] = position
+    incoming = [empty] * count
+    outgoing = [empty] * count
+    worklist = list(range(count))  # Ranks, which are already a heap
+    queued = [True] * count
+    while worklist:
+        index = order[heapq.heappop(worklist)]
+        queued[index] = False
+        value = boundary.get(index, empty)
+        for source in inputs[index]:
+            value = value | outgoing[source] if union else value & outgoing[source]
+        incoming[index] = value
+        value = gen[index] | (value & ~kill[index])
+        if value != outgoing[index]:
+            outgoing[index] = value
+            for target in outputs[index]:
+                if not queued[target]:
+                    queued[target] = True
+                    heapq.heappush(worklist, rank[target])
+    if forward:
+        return incoming, outgoing
+    return outgoing, incoming
+
+
+def name_bits(cfg, names=None):
+    # One bit per variable, in the order they first appear unless names gives the order
+    if names is None:
+        names = {}
+        for block in cfg.blocks:
+            for instruction in block:
+                for value in instruction.uses():
+                    if isinstance(value, str):
+                        names.setdefault(value)
+                defined = instruction.defines()
+                if defined is not None:
+                    names.setdefault(defined)
+    return {name: 1 << index for index, name in enumerate(names)}
+
+
+class ReachingDefinitions:
+    # Which definitions may reach each point, one bit per instruction that defines a name,
+    # or only one of those in names when given. Nothing reaches an entry from outside, except
+    # at open_entries, which any may reach.
+    def __init__(self, cfg, open_entries=(), names=None):
+        self.cfg = cfg
+        self.sites = []  # bit index -> (block, offset, instruction)
+        self.first_site = []  # block -> bit index of its first definition
+        positions = {}
+        gen = []
+        kill = []
+        for index, block in enumerate(cfg.blocks):
+            self.first_site.append(len(self.sites))
+            last = {}
+            for offset, instruction in enumerate(block):
+                defined = instruction.defines()
+                if defined is not None and (names is None or defined in names):
+                    last[defined] = len(self.sites)
+                    positions.setdefault(defined, []).append(len(self.sites))
+                    self.sites.append((index, offset, instruction))
+            gen.append(sum(1 << position for position in last.values()))
+            kill.append(last)
+        self.by_name = {name: sum(1 << position for position in found) for name, found in positions.items()}
+        kill = [sum(self.by_name[name] for name in last) for last in kill]
+        self.all = (1 << len(self.sites)) - 1
+        self.gen = gen
+        self.kill = kill
+        self.tracked = names
+        self.before, self.after = solve(cfg, gen, kill, boundary={entry: self.all for entry in open_entries})
+
+    def walk(self, index):
+        # Each instruction of a block with the definitions reaching it
+        reaching = self.before[index]
+        bit = 1 << self.first_site[index]
+        for instruction in self.cfg.blocks[index]:
+            yield instruction, reaching
+            defined = instruction.defines()
+            if defined is not None and (self.tracked is None or defined in self.tracked):
+                reaching = (reaching & ~self.by_name[defined]) | bit
+                bit <<= 1
+
+    def definitions(self, name, reaching):
+        # The instructions among reaching that define name
+        found = []
+        bits = reaching & self.by_name.get(name, 0)
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            found.append(self.sites[low.bit_length() - 1][2])
+        return found
+
+
+class Liveness:
+    # Which variables may still be read after each point: backward, meeting by union. bits maps
+    # the variables tracked to their bits; exit_live is live wherever the graph is left, at the
+    # blocks in exits (every block without successors by default).
+    def __init__(self, cfg, bits, exit_live=0, exits=None):
+        self.cfg = cfg
+        self.bits = bits
+        gen = []
+        kill = []
+        for block in cfg.blocks:
+            used = set()
+            defined = set()
+            for instruction in block:
+                for value in instruction.uses():
+                    if isinstance(value, str) and value not in defined:
+                        used.add(value)
+                target = instruction.defines()
+                if target is not None:
+                    defined.add(target)
+            gen.append(sum(bits[name] for name in used if name in bits))
+            kill.append(sum(bits[name] for name in defined if name in bits))
+        exits = cfg.exits if exits is None else exits
+        self.live_in, self.live_out = solve(cfg, gen, kill, forward=False,
+                                            boundary={index: exit_live for index in exits})
+
+
+class DefiniteAssignment:
+    # Which variables are assigned on every path to each point: forward, meeting by
+    # intersection. Nothing is assigned on arriving at an entry, except at open_entries,
+    # where everything counts as assigned. With every_path off, those assigned on at least one
+    # path instead, meeting by union.
+    def __init__(self, cfg, bits, open_entries=(), every_path=True):
+        self.cfg = cfg
+        self.bits = bits
+        self.all = (1 << len(bits)) - 1
+        gen = []
+        for block in cfg.blocks:
+            assigned = 0
+            for instruction in block:
+                assigned |= bits.get(instruction.defines(), 0)
+            gen.append(assigned)
+        boundary = {entry: 0 for entry in cfg.entries}
+        boundary.update((entry, self.all) for entry in open_entries)
+        self.before, self.after = solve(cfg, gen, [0] * len(gen), union=not every_path, boundary=boundary,
+                                        top=self.all)
+
+    def walk(self, index):
+        # Each instruction of a block with the variables certainly assigned before it
+        assigned = self.before[index]
+        for instruction in self.cfg.blocks[index]:
+            yield instruction, assigned
+            assigned |= self.bits.get(instruction.defines(), 0)
+
+
+class Dominators:
+    # Immediate dominators, by iterating over the blocks in reverse postorder until nothing
+    # changes (Cooper, Harvey and Kennedy). The entries hang off one made-up root, so a block
+    # reached from more than one entry is dominated only by itself, and a block no entry
+    # reaches by nothing at all. Numbering the resulting tree depth first answers dominates()
+    # without walking it.
+    def __init__(self, cfg):
+        count = len(cfg.blocks)
+        root = count
+        rank = [0] * (count + 1)
+        for position, index in enumerate(cfg.order):
+            rank[index] = position + 1
+        idom = [None] * (count + 1)
+        idom[root] = root
+        for entry in cfg.entries:
+            idom[entry] = root
+
+        def intersect(first, second):
+            while first != second:
+                while rank[first] > rank[second]:
+                    first = idom[first]
+                while rank[second] > rank[first]:
+                    second = idom[second]
+            return first
+
+        entries = set(cfg.entries)
+        changed = True
+        while changed:
+            changed = False
+            for index in cfg.order:
+                if index in entries:
+                    continue
+                new = None
+                for source in cfg.predecessors[index]:
+                    if idom[source] is not None:
+                        new = source if new is None else intersect(source, new)
+                if new != idom[index]:
+                    idom[index] = new
+                    changed = True
+        self.idom = [None if parent == root else parent for parent in idom[:count]]
+        children = [[] for _ in range(count + 1)]
+        for index in range(count):
+            if idom[index] is not None:
+                children[idom[index]].append(index)
+        self.enter = [None] * (count + 1)
+        self.leave = [None] * (count + 1)
+        clock = 0
+        stack = [(root, iter(children[root]))]
+        self.enter[root] = clock
+        while stack:
+            index, pending = stack[-1]
+            child = next(pending, None)
+            clock += 1
+            if child is None:
+                self.leave[index] = clock
+                stack.pop()
+            else:
+                self.enter[child] = clock
+                stack.append((child, iter(children[child])))
+
+    def dominates(self, first, second):
+        # Whether every path from an entry to second passes through first
+        if self.enter[first] is None or self.enter[second] is None:
+            return False
+        return self.enter[first] <= self.enter[second] and self.leave[second] <= self.leave[first]
+
+
+class NaturalLoop:
+    # The blocks of a loop with one way in: the header, the latches jumping back to it, and
+    # every block that reaches a latch without passing through the header
+    __slots__ = ('header', 'latches', 'blocks')
+
+    def __init__(self, header, latches, blocks):
+        self.header = header
+        self.latches = latches
+        self.blocks = blocks
+
+    def __repr__(self):
+        return f"NaturalLoop({self.header}, {self.latches}, {sorted(self.blocks)})"
+
+
+def natural_loops(cfg, dominators=None):
+    # Every natural loop, one per header however many edges lead back to it, innermost first
+    dominators = dominators or Dominators(cfg)
+    latches = {}
+    for index, targets in enumerate(cfg.successors):
+        for target in targets:
+            if dominators.dominates(target, index):
+                latches.setdefault(target, []).append(index)
+    loops = []
+    for header, sources in latches.items():
+        blocks = {header}
+        worklist = list(sources)
+        while worklist:
+            index = worklist.pop()
+            if index not in blocks:
+                blocks.add(index)
+                worklist.extend(cfg.predecessors[index])
+        loops.append(NaturalLoop(header, sources, blocks))
+    loops.sort(key=lambda loop: (len(loop.blocks), loop.header))
+    return loops
+
+
+class Lattice:
+    # The two values of constant propagation besides a Const: a definition not known to run
+    # yet, and one that can give more than one value
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+unreached = Lattice('unreached')
+varying = Lattice('varying')
+
+
+def meet(first, second):
+    if first is unreached:
+        return second
+    if second is unreached or first == second:
+        return first
+    return varying
+
+
+def folded(operator, left, right):
+    # The Const a binary operator gives on two Consts, or varying if it cannot be worked out here
+    if isinstance(left.value, bool) or isinstance(right.value, bool):
+        return varying
+    try:
+        return constant(evaluate(operator, left.value, right.value))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return varying
+
+
+class ConstantPropagation:
+    # Sparse conditional constant propagation (Wegman and Zadeck) over use-def chains from
+    # reaching definitions, for the names given; anything else counts as varying. Temporaries
+    # are read in the block that assigns them, so theirs come from that block alone. Only
+    # blocks control can reach run, and a test whose value is known lets control take one way
+    # out, so definitions on paths that never run do not spoil the values of those that do.
+    def __init__(self, cfg, names):
+        self.cfg = cfg
+        variables = {name for name in names if not is_temporary(name)}
+        self.reaching = reaching = ReachingDefinitions(cfg, names=variables)
+        self.site_blocks = [site[0] for site in reaching.sites]  # definition -> its block
+        self.site_of = {}  # (block, offset) -> the definition it makes
+        for position, (index, offset, _) in enumerate(reaching.sites):
+            self.site_of[index, offset] = position
+        self.chains = {}  # (block, offset) -> definitions each operand may read, None if untracked
+        self.users = [[] for _ in reaching.sites]  # definition -> (block, offset) of each reader
+        for index in range(len(cfg.blocks)):
+            local = {}  # temporary -> its definition in this block so far
+            for offset, (instruction, bits) in enumerate(reaching.walk(index)):
+                chain = []
+                for value in instruction.uses():
+                    if value in local:
+                        found = [local[value]]
+                    elif isinstance(value, str) and value in variables:
+                        found = []
+                        bits_read = bits & reaching.by_name.get(value, 0)
+                        while bits_read:
+                            low = bits_read & -bits_read
+                            bits_read ^= low
+                            found.append(low.bit_length() - 1)
+                    else:
+                        chain.append(None)
+                        continue
+                    chain.append(found)
+                    for site in found:
+                        self.users[site].append((index, offset))
+                self.chains[index, offset] = chain
+                defined = instruction.defines()
+                if is_temporary(defined) and defined in names:
+                    local[defined] = self.site_of[index, offset] = len(self.site_blocks)
+                    self.site_blocks.append(index)
+                    self.users.append([])
+        self.values = [unreached] * len(self.site_blocks)
+        self.executable = [False] * len(cfg.blocks)
+        self.run()
+
+    def run(self):
+        blocks = []
+        definitions = []
+        self.undecided = set()  # Blocks ending in a test with no value yet
+        for entry in self.cfg.entries:
+            self.reach(entry, blocks)
+        while blocks:
+            while blocks or definitions:
+                if blocks:
+                    index = blocks.pop()
+                    for offset in range(len(self.cfg.blocks[index])):
+                        self.visit(index, offset, blocks, definitions)
+                else:
+                    for index, offset in self.users[definitions.pop()]:
+                        if self.executable[index]:
+                            self.visit(index, offset, blocks, definitions)
+            # A test still without a value reads a variable nothing that runs assigns, which
+            # fails at run time; either way out has to stay
+            for index in sorted(self.undecided):
+                for target in self.cfg.successors[index]:
+                    self.reach(target, blocks)
+            self.undecided.clear()
+
+    def reach(self, index, blocks):
+        if not self.executable[index]:
+            self.executable[index] = True
+            blocks.append(index)
+
+    def operand(self, index, offset, position, value):
+        # The lattice value an operand has where it is read
+        chain = self.chains[index, offset][position]
+        if chain is None:
+            return value if isinstance(value, Const) else varying
+        if not chain:
+            return varying  # Read before anything assigns it
+        result = unreached
+        for site in chain:
+            if self.executable[self.site_blocks[site]]:
+                result = meet(result, self.values[site])
+        return result
+
+    def visit(self, index, offset, blocks, definitions):
+        quad = self.cfg.blocks[index][offset]
+        site = self.site_of.get((index, offset))
+        if site is not None:
+            if quad.op == 'copy':
+                value = self.operand(index, offset, 0, quad.arg1)
+            elif quad.op in binary_operators:
+                left = self.operand(index, offset, 0, quad.arg1)
+                right = self.operand(index, offset, 1, quad.arg2)
+                if left is varying or right is varying:
+                    value = varying
+                elif left is unreached or right is unreached:
+                    value = unreached
+                else:
+                    value = folded(quad.op, left, right)
+            else:
+                value = varying
+            value = meet(self.values[site], value)
+            if value != self.values[site]:
+                self.values[site] = value
+                definitions.append(site)
+        if offset == len(self.cfg.blocks[index]) - 1:
+            successors = self.cfg.successors[index]
+            if quad.op == 'iffalse' and len(successors) == 2:
+                test = self.operand(index, offset, 0, quad.arg1)
+                if test is unreached:
+                    self.undecided.add(index)
+                    return
+                self.undecided.discard(index)
+                if isinstance(test, Const):
+                    successors = successors[1:] if test.value else successors[:1]
+            for target in successors:
+                self.reach(target, blocks)
+
+    def value(self, index, offset, position):
+        # What an operand of an instruction that can run is known to hold: a Const, or varying
+        quad = self.cfg.blocks[index][offset]
+        value = self.operand(index, offset, position, quad.uses()[position])
+        return varying if value is unreached else value
+
+    def value_after(self, index, name):
+        # What name holds when control leaves a block
+        result = unreached
+        bits = self.reaching.after[index] & self.reaching.by_name.get(name, 0)
+        if not bits:
+            return varying
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            site = low.bit_length() - 1
+            if self.executable[self.reaching.sites[site][0]]:
+                result = meet(result, self.values[site])
+        return varying if result is unreached else result
+
+
+class Step:
+    # One action of the syntax tree in a flow graph: the name it assigns, if any, the name
+    # tokens it reads, and the literal token assigned when the value is a single literal
+    __slots__ = ('node', 'defined', 'reads', 'value')
+
+    def __init__(self, node, defined=None, reads=(), value=None):
+        self.node = node
+        self.defined = defined
+        self.reads = list(reads)
+        self.value = value
+
+    def uses(self):
+        return [token.value for token in self.reads]
+
+    def defines(self):
+        return self.defined
+
+
+def identifiers(expression):
+    # The name tokens an expression reads, left to right
+    if isinstance(expression, BinaryOp):
+        return identifiers(expression.left) + identifiers(expression.right)
+    if isinstance(expression, Token) and expression.type == 'IDENTIFIER':
+        return [expression]
+    return []
+
+
+def literal(expression):
+    if isinstance(expression, Token) and expression.type != 'IDENTIFIER':
+        return expression
+    return None
+
+
+def function_assignments(function):
+    # What a call certainly assigns, since memory is global: the parameters and whatever the
+    # body assigns, which the grammar only allows as a straight run of assignments
+    names = [param.name.value for param in function.params]
+    for statement in function.body:
+        if isinstance(statement, Assignment):
+            names.append(statement.target.value)
+        elif isinstance(statement, Declaration):
+            names.append(statement.name.value)
+    return names
+
+
+class FlowGraphBuilder(NodeVisitor):
+    # Lowers a syntax tree to a ControlFlowGraph of Steps, splitting blocks at the same tests
+    # and loops IntermediateCodeGenerator does. A call steps over the function: it reads its
+    # arguments and then assigns everything the function assigns.
+    def __init__(self, program):
+        self.program = program
+        self.blocks = []
+        self.successors = []
+        self.entries = []
+        self.current = None
+        self.starts = {}  # statement -> block it starts in; a function's is its entry
+        self.branches = []  # (test block, condition, passes when true, target when it passes, otherwise)
+        self.calls = {}  # block -> names of the functions called in it
+        self.functions = {}  # name -> entry block of the last function by that name
+        self.assignments = {}  # function name -> names a call to it assigns
+
+    @span('FlowGraphBuilder.build', 'dataflow')
+    def build(self):
+        for statement in self.program.body:
+            if isinstance(statement, Function):
+                self.assignments[statement.name.value] = function_assignments(statement)
+        self.current = self.new_block()
+        self.entries.append(self.current)
+        self.lower(self.program.body)
+        return ControlFlowGraph(self.blocks, self.successors, self.entries)
+
+    def new_block(self):
+        self.blocks.append([])
+        self.successors.append([])
+        return len(self.blocks) - 1
+
+    def jump(self, source, target):
+        self.successors[source].append(target)
+
+    def add(self, step):
+        self.blocks[self.current].append(step)
+
+    def lower(self, statements):
+        for statement in statements:
+            self.starts[statement] = self.current
+            self.visit(statement)
+
+    def test(self, condition, passes_when):
+        # Ends the current block with a condition and returns the blocks for each outcome
+        test = self.current
+        reads = identifiers(condition.left) + identifiers(condition.right) if condition else []
+        self.add(Step(condition, reads=reads))
+        passed = self.new_block()
+        failed = self.new_block()
+        self.jump(test, failed)  # Last the way iffalse has it, so a loop body is ordered right after its test
+        self.jump(test, passed)
+        if condition:
+            self.branches.append((test, condition, passes_when, passed, failed))
+        return passed, failed
+
+    def visit_Declaration(self, node):
+        self.add(Step(node, node.name.value, identifiers(node.value), literal(node.value)))
+
+    def visit_Assignment(self, node):
+        self.add(Step(node, node.target.value, identifiers(node.value), literal(node.value)))
+
+    def visit_IfStatement(self, node):
+        ends = []
+        for branch in node.branches:
+            if branch.condition:
+                passed, failed = self.test(branch.condition, branch.kind != 'if not')
+                self.current = passed
+                self.lower(branch.body)
+                ends.append(self.current)
+                self.current = failed
+            else:
+                self.lower(branch.body)
+        ends.append(self.current)
+        self.current = self.new_block()
+        for end in ends:
+            self.jump(end, self.current)
+
+    def visit_WhileLoop(self, node):
+        start = self.new_block()
+        self.jump(self.current, start)
+        self.current = start
+        passed, failed = self.test(node.condition, True)
+        self.current = passed
+        self.lower(node.body)
+        self.jump(self.current, start)
+        self.current = failed
+
+    def visit_ForLoop(self, node):
+        if node.init:
+            self.visit(node.init)
+        start = self.new_block()
+        self.jump(self.current, start)
+        self.current = start
+        passed, failed = self.test(node.condition, True)
+        self.current = passed
+        self.lower(node.body)
+        if node.variable:
+            self.add(Step(node, node.variable.value, [node.variable]))
+        self.jump(self.current, start)
+        self.current = failed
+
+    def visit_Function(self, node):
+        outside = self.current
+        self.current = self.new_block()
+        self.entries.append(self.current)
+        self.functions[node.name.value] = self.starts[node] = self.current
+        for param in node.params:
+            self.add(Step(param, param.name.value))
+        self.lower(node.body)
+        self.current = outside
+
+    def visit_Call(self, node):
+        self.add(Step(node, reads=[arg for arg in node.args if isinstance(arg, Token) and arg.type == 'IDENTIFIER']))
+        self.calls.setdefault(self.current, []).append(node.name.value)
+        for name in self.assignments.get(node.name.value, ()):
+            self.add(Step(node, name))
@@ -0,0 +1,134 @@
+import json
+
+severities = ['error', 'warning', 'note']  # Most serious first
+
+# Every diagnostic code, with what it means
+codes = {
+    'L001': "invalid token",
+    'P001': "expected a different token",
+    'P002': "unexpected end of input",
+    'P003': "unexpected statement",
+    'P004': "invalid expression",
+    'P005': "unexpected token",
+    'P006': "too many syntax errors",
+    'S001': "variable redeclared with another type",
+    'S002': "value does not match the declared type",
+    'S003': "variable not declared",
+    'S004': "function not declared",
+    'S005': "not a function",
+    'S006': "variable used before it is assigned",
+    'S007': "variable may be used before it is assigned",
+    'S008': "code is never reached",
+}
+
+
+class Diagnostic:
+    # One problem found in a source, by the phase that found it ('lex', 'parse' or 'analyze').
+    # Lines and columns are the source's own, counting from 1, and end_column is the column just
+    # past the span, so editors and other tools can use them as they are.
+    __slots__ = ('severity', 'code', 'phase', 'message', 'line', 'column', 'end_line', 'end_column')
+
+    def __init__(self, severity, code, phase, message, line=None, column=None, end_line=None, end_column=None):
+        self.severity = severity
+        self.code = code
+        self.phase = phase
+        self.message = message
+        self.line = line
+        self.column = column
+        self.end_line = line if end_line is None else end_line
+        self.end_column = column if end_column is None else end_column
+
+    @classmethod
+    def spanning(cls, severity, code, phase, message, first=None, last=None):
+        # A diagnostic covering the tokens from first to last, or just first
+        if first is None:
+            return cls(severity, code, phase, message)
+        last = last or first
+        return cls(severity, code, phase, message, first.line, first.column, last.line, token_end(last))
+
+    def key(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return isinstance(other, Diagnostic) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"Diagnostic({', '.join(repr(value) for value in self.key())})"
+
+    def __str__(self):
+        return self.message
+
+    def location(self):
+        if self.line is None:
+            return ""
+        return f"{self.line}:{self.column}" if self.column is not None else f"{self.line}"
+
+    def format(self, path=None):
+        # One line in the usual compiler form, path:line:column: severity code: message
+        prefix = ":".join(part for part in (path, self.location()) if part)
+        return f"{prefix + ': ' if prefix else ''}{self.severity} {self.code}: {self.message}"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def token_end(token):
+    # The column just past a token, or None if the token has no column
+    if token.column is None:
+        return None
+    return token.column + len(str(token.value))
+
+
+class DiagnosticSink:
+    # Collects the diagnostics of a compilation in the order they were found
+    def __init__(self, diagnostics=()):
+        self.diagnostics = list(diagnostics)
+
+    def report(self, diagnostic):
+        self.diagnostics.append(diagnostic)
+        return diagnostic
+
+    def extend(self, diagnostics):
+        self.diagnostics.extend(diagnostics)
+
+    def __iter__(self):
+        return iter(self.diagnostics)
+
+    def __len__(self):
+        return len(self.diagnostics)
+
+    def __getitem__(self, index):
+        return self.diagnostics[index]
+
+    def filter(self, severity=None, phase=None, code=None):
+        # Those matching every criterion given; severity keeps that severity and anything worse
+        limit = severities.index(severity) if severity else len(severities)
+        return DiagnosticSink(diagnostic for diagnostic in self.diagnostics
+                              if severities.index(diagnostic.severity) <= limit
+                              and (phase is None or diagnostic.phase == phase)
+                              and (code is None or diagnostic.code == code))
+
+    def unique(self):
+        # Without repeats, keeping the first of each
+        return DiagnosticSink(dict.fromkeys(self.diagnostics))
+
+    @property
+    def errors(self):
+        return [diagnostic for diagnostic in self.diagnostics if diagnostic.severity == 'error']
+
+    def format(self, path=None):
+        return "\n".join(diagnostic.format(path) for diagnostic in self.diagnostics)
+
+    def to_json(self):
+        return json.dumps([diagnostic.to_dict() for diagnostic in self.diagnostics], indent=2)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls(Diagnostic.from_dict(data) for data in json.loads(text))
@@ -1,10 +1,17 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
 import customtkinter as ctk
-from youlexical import lex, SymbolTable  # Importing the lexical analysis and symbol table classes
-from codegenerationgui import CodeGenerator  # Importing the CodeGenerator class
-from sylvasyntax import SyntaxAnalyzer, Token  # Importing the SyntaxAnalyzer class
-from sylvasemantic import SemanticAnalyzer  # Importing the SemanticAnalyzer class
+from background import CompileWorker  # Compiles off the main loop, recompiling only what an edit touched
+from compilecache import CompilationCache
+from intermediatecode import is_temporary
+from bytecode import decode
+from vm import VM, VMError
+from pipeline import CompilationResult
+from instrumentation import profile
+
+# Compiled results of sources seen before, shared with every other run on this machine
+cache = CompilationCache()
+worker = CompileWorker(cache=cache)
 
 # Initialize the main window
 root = ctk.CTk()
@@ -50,18 +57,109 @@ output_label.grid(row=0, column=0, padx=10, pady=5, sticky="w")
 output_text = ctk.CTkTextbox(output_errors_frame, width=300, height=150, state="disabled")
 output_text.grid(row=1, column=0, padx=10, pady=5, sticky="nsew")
 
-# Errors Text Area
+# Errors Text Area, with a menu choosing which phase's diagnostics it lists
 errors_label = ctk.CTkLabel(output_errors_frame, text="Errors")
 errors_label.grid(row=2, column=0, padx=10, pady=5, sticky="w")
 
+phase_filters = {"All phases": None, "Lexical": 'lex', "Syntax": 'parse', "Semantic": 'analyze'}
+errors_filter = ctk.CTkOptionMenu(output_errors_frame, values=list(phase_filters), width=120,
+                                  command=lambda choice: show_diagnostics(last_job) if last_job else None)
+errors_filter.grid(row=2, column=0, padx=10, pady=5, sticky="e")
+
 errors_text = ctk.CTkTextbox(output_errors_frame, width=300, height=150, state="disabled")
 errors_text.grid(row=3, column=0, padx=10, pady=5, sticky="nsew")
 
 
+# Compilation runs on the worker thread; each request names the outputs its callback needs,
+# and the callback runs back on the main loop once they are ready
+def request(outputs, callback, task=None):
+    worker.submit(editor_text.get("1.0", tk.END), outputs, callback, task)
+
+
+def poll_worker():
+    worker.poll()
+    root.after(50, poll_worker)
+
+
+def show_message(message):
+    errors_text.configure(state="normal")
+    errors_text.delete("1.0", tk.END)
+    errors_text.insert(tk.END, message)
+    errors_text.configure(state="disabled")
+
+
+# Diagnostics are marked in the editor where they were found
+editor_text.tag_config("diagnostic", background="#ffd6d6", underline=True)
+last_job = None  # The last job whose diagnostics were shown, for re-filtering
+
+
+def highlight(diagnostics, source):
+    editor_text.tag_remove("diagnostic", "1.0", tk.END)
+    if source != editor_text.get("1.0", tk.END):
+        return  # Edited since; the spans no longer line up
+    line_count = source.count('\n') + 1
+    for diagnostic in diagnostics:
+        if diagnostic.line is None or diagnostic.column is None or not 0 < diagnostic.line <= line_count:
+            continue
+        end_line = min(diagnostic.end_line, line_count)
+        end_column = diagnostic.end_column or diagnostic.column + 1
+        if end_line == diagnostic.line:
+            end_column = max(end_column, diagnostic.column + 1)  # At least one character
+        editor_text.tag_add("diagnostic", f"{diagnostic.line}.{diagnostic.column - 1}",
+                            f"{end_line}.{end_column - 1}")
+
+
+# Lists the diagnostics of the chosen phase in the Errors pane, once each, and marks them in
+# the editor; returns whether there were any errors at all
+def show_errors(job):
+    global last_job
+    if job.error is not None:
+        show_message(f"Internal compiler error: {job.error}")
+        return True
+    last_job = job
+    diagnostics = job.result.diagnostics.unique()
+    shown = diagnostics.filter(phase=phase_filters[errors_filter.get()])
+    errors_text.configure(state="normal")
+    errors_text.delete("1.0", tk.END)
+    for diagnostic in shown:
+        errors_text.insert(tk.END, diagnostic.format() + "\n")
+    errors_text.configure(state="disabled")
+    highlight(shown, job.result.source)
+    return bool(diagnostics.errors)
+
+
+# Diagnostics while typing, once the editor has been quiet for a moment
+pending_check = None
+
+
+def on_edit(event=None):
+    global pending_check
+    if pending_check is not None:
+        root.after_cancel(pending_check)
+    pending_check = root.after(400, check_code)
+
+
+def check_code():
+    global pending_check
+    pending_check = None
+    request(['semantic_results'], show_diagnostics)
+
+
+def show_diagnostics(job):
+    if not show_errors(job):
+        show_message("No errors")
+
+
 # Function to show symbol table in a new window
 def show_symbol_table():
-    code = editor_text.get("1.0", tk.END)
-    tokens, symbol_table = lex(code)
+    request(['symbol_table'], open_symbol_table)
+
+
+def open_symbol_table(job):
+    if job.error is not None:
+        show_errors(job)
+        return
+    symbol_table = job.result.symbol_table
 
     symbol_table_window = ctk.CTkToplevel(root)
     symbol_table_window.title("Symbol Table")
@@ -89,10 +187,13 @@ def show_symbol_table():
 
 # Function to show assembly code in a new window
 def show_assembly_code():
-    code = editor_text.get("1.0", tk.END)
-    tokens, symbol_table = lex(code)
-    code_generator = CodeGenerator(tokens, symbol_table)
-    assembly_code = code_generator.generate_code()
+    request(['semantic_results', 'assembly'], open_assembly_code)
+
+
+def open_assembly_code(job):
+    if show_errors(job):
+        return
+    assembly_code = job.result.assembly
 
     assembly_code_window = ctk.CTkToplevel(root)
     assembly_code_window.title("Assembly Code")
@@ -104,39 +205,102 @@ def show_assembly_code():
     assembly_text.configure(state="disabled")
 
 
-# Function to run the code
+# Function to run the code; the program also runs on the worker, so a long loop never blocks the window
 def run_code():
-    code = editor_text.get("1.0", tk.END)
-    raw_tokens, symbol_table = lex(code)
-    tokens = [Token(line, type, value) for line, type, value in raw_tokens]
+    show_message("Running...")
+    request(['semantic_results', 'bytecode'], show_run, execute)
 
-    syntax_analyzer = SyntaxAnalyzer(tokens, symbol_table)
-    syntax_results = syntax_analyzer.parse()
 
-    errors_text.configure(state="normal")
-    errors_text.delete("1.0", tk.END)
+def execute(result):
+    if result.errors:
+        return None
+    if result.bytecode is None:
+        return None, VMError("The program calls a function that is not defined")
+    machine = VM(decode(result.bytecode), time_limit=5)
+    try:
+        return machine, machine.run()
+    except VMError as error:
+        return machine, error
+
 
-    if syntax_results:
-        for result, message in syntax_results:
-            errors_text.insert(tk.END, message + "\n")
-        errors_text.configure(state="disabled")
+def show_run(job):
+    if show_errors(job):
+        return
+    machine, memory = job.value
+    output_text.configure(state="normal")
+    output_text.delete("1.0", tk.END)
+    if isinstance(memory, VMError):
+        show_message(f"Runtime error: {memory}")
+    else:
+        for name, value in memory.items():
+            if not is_temporary(name):
+                output_text.insert(tk.END, f"{name} = {value}\n")
+        show_message(f"Code executed successfully without errors in {machine.steps} instructions.")
+    output_text.configure(state="disabled")
+
+
+# Function to compile the code without running it
+def compile_code():
+    show_message("Compiling...")
+    request(['semantic_results', 'bytecode'], show_compiled)
+
+
+def show_compiled(job):
+    if show_errors(job):
         return
+    show_message(f"Compiled successfully: {len(job.result.instructions)} instructions.")
 
-    semantic_analyzer = SemanticAnalyzer(tokens, symbol_table)
-    semantic_results = semantic_analyzer.analyze()
 
-    if semantic_results:
-        for message in semantic_results:
-            errors_text.insert(tk.END, message + "\n")
-        errors_text.configure(state="disabled")
-        return
+# Function to profile a full build of the code: where the time went, span by span
+def show_profile():
+    show_message("Profiling...")
+    request(['semantic_results'], open_profile, profile_build)
 
 
-    errors_text.insert(tk.END, "Code executed successfully without errors.")
-    errors_text.configure(state="disabled")
+def profile_build(result):
+    if result.errors:
+        return None
+    # A fresh result without the cache, so every phase really runs
+    with profile() as profiler:
+        CompilationResult(result.source).artifact()
+    return profiler
 
-    errors_text.insert(tk.END, "Code executed successfully without errors.")
-    errors_text.configure(state="disabled")
+
+def open_profile(job):
+    if show_errors(job):
+        return
+    profiler = job.value
+    show_message("Profile ready.")
+
+    profile_window = ctk.CTkToplevel(root)
+    profile_window.title("Profile")
+    profile_window.geometry("600x500")
+
+    spans_tree = ttk.Treeview(profile_window, columns=("Calls", "Total (ms)", "Self (ms)"))
+    spans_tree.heading("#0", text="Span", anchor=tk.W)
+    spans_tree.column("#0", width=280, stretch=tk.YES)
+    for col in ("Calls", "Total (ms)", "Self (ms)"):
+        spans_tree.column(col, width=90, minwidth=90, stretch=tk.NO)
+        spans_tree.heading(col, text=col, anchor=tk.W)
+    spans_tree.pack(expand=True, fill=tk.BOTH, padx=10, pady=10)
+    for name, (calls, total, self_time) in profiler.summary().items():
+        spans_tree.insert("", "end", text=name, values=(calls, f"{total / 1e6:.3f}", f"{self_time / 1e6:.3f}"))
+
+    counters_tree = ttk.Treeview(profile_window, columns=("Value",), height=6)
+    counters_tree.heading("#0", text="Counter", anchor=tk.W)
+    counters_tree.heading("Value", text="Value", anchor=tk.W)
+    counters_tree.pack(fill=tk.X, padx=10, pady=5)
+    for name, value in sorted(profiler.counters.items()):
+        counters_tree.insert("", "end", text=name, values=(value,))
+
+    def save_trace():
+        path = filedialog.asksaveasfilename(parent=profile_window, defaultextension=".json",
+                                            filetypes=[("Chrome trace", "*.json")])
+        if path:
+            profiler.save(path)
+
+    save_button = ctk.CTkButton(profile_window, text="Save Trace", width=100, command=save_trace)
+    save_button.pack(pady=10)
 
 
 # Run and Compile Buttons
@@ -146,7 +310,7 @@ button_frame.pack(pady=10)
 run_button = ctk.CTkButton(button_frame, text="Run", width=100, command=run_code)
 run_button.grid(row=0, column=0, padx=10)
 
-compile_button = ctk.CTkButton(button_frame, text="Compile", width=100)
+compile_button = ctk.CTkButton(button_frame, text="Compile", width=100, command=compile_code)
 compile_button.grid(row=0, column=1, padx=10)
 
 # Errors, Symbol Table, and Assembly Code Buttons
@@ -159,5 +323,11 @@ symbol_table_button.grid(row=0, column=1, padx=10)
 assembly_button = ctk.CTkButton(bottom_frame, text="Assembly Code", width=100, command=show_assembly_code)
 assembly_button.grid(row=0, column=2, padx=10)
 
+profile_button = ctk.CTkButton(bottom_frame, text="Profile", width=100, command=show_profile)
+profile_button.grid(row=0, column=3, padx=10)
+
+editor_text.bind("<KeyRelease>", on_edit)
+
 # Start the main loop
+poll_worker()
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,130 @@
+from enum import IntEnum
+from intermediatecode import Const
+
+
+class Opcode(IntEnum):
+    LABEL = 0  # Marks an address; never encoded as an instruction of its own
+    LOAD = 1
+    STORE = 2
+    MOV = 3
+    ADD = 4
+    SUB = 5
+    MUL = 6
+    DIV = 7
+    MOD = 8
+    LT = 9
+    LE = 10
+    GT = 11
+    GE = 12
+    EQ = 13
+    NE = 14
+    JZ = 15
+    JMP = 16
+    CALL = 17
+    RET = 18
+    PUSH = 19
+    POP = 20
+
+
+arithmetic_opcodes = {Opcode.ADD, Opcode.SUB, Opcode.MUL, Opcode.DIV, Opcode.MOD, Opcode.LT, Opcode.LE,
+                      Opcode.GT, Opcode.GE, Opcode.EQ, Opcode.NE}
+
+
+class Register(str):
+    # A register operand. Variables may be spelled like registers, so a 'value' slot holds a
+    # register only if its operand is a Register; a plain string there is a memory name.
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"Register({str(self)!r})"
+
+
+register_numbers = {Register(f'R{number}'): number for number in range(8)}
+
+# What each operand slot may hold. A value is a register, a memory name or a constant;
+# a label is a jump target and a function is resolved to its "<name>_start" label.
+operand_slots = {
+    Opcode.LABEL: ('label',),
+    Opcode.LOAD: ('register', 'value'),
+    Opcode.STORE: ('register', 'memory'),
+    Opcode.MOV: ('register', 'register'),
+    Opcode.JZ: ('register', 'label'),
+    Opcode.JMP: ('label',),
+    Opcode.CALL: ('function',),
+    Opcode.RET: (),
+    Opcode.PUSH: ('value',),
+    Opcode.POP: ('register',),
+}
+for _opcode in arithmetic_opcodes:
+    operand_slots[_opcode] = ('register', 'value')
+
+
+class Instruction:
+    # One line of assembly: a label (Opcode.LABEL, name) or an opcode with its operands.
+    # Registers, names and labels are strings; literal operands are Const objects.
+    __slots__ = ('opcode', 'operands')
+
+    def __init__(self, opcode, *operands):
+        self.opcode = opcode
+        self.operands = operands
+
+    def __eq__(self, other):
+        return isinstance(other, Instruction) and self.opcode == other.opcode and self.operands == other.operands
+
+    def __hash__(self):
+        return hash((self.opcode, self.operands))
+
+    def __repr__(self):
+        return f"Instruction({self.opcode.name}, {', '.join(map(repr, self.operands))})"
+
+    def __str__(self):
+        if self.opcode == Opcode.LABEL:
+            return f"{self.operands[0]}:"
+        if not self.operands:
+            return self.opcode.name
+        return f"{self.opcode.name} {', '.join(map(str, self.operands))}"
+
+
+def literal(text):
+    # The operand written as text, as a Const when it is a literal and unchanged when it is a name
+    if text.startswith('"'):
+        return Const(text[1:-1], text)
+    if text in ('True', 'False'):
+        return Const(text == 'True', text)
+    for kind in (int, float):
+        try:
+            return Const(kind(text), text)
+        except ValueError:
+            pass
+    return text
+
+
+def parse_assembly(text):
+    # In assembly text R0-R7 always name registers
+    instructions = []
+    for number, line in enumerate(text.split('\n'), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.endswith(':'):
+            instructions.append(Instruction(Opcode.LABEL, line[:-1]))
+            continue
+        name, _, rest = line.partition(' ')
+        if name not in Opcode.__members__:
+            raise ValueError(f"Unknown opcode {name} on line {number}")
+        # String literals may contain commas, so only split before the first quote
+        operands = []
+        while rest:
+            rest = rest.strip()
+            if rest.startswith('"'):
+                operands.append(literal(rest))
+                break
+            operand, _, rest = rest.partition(',')
+            operand = operand.strip()
+            operands.append(Register(operand) if operand in register_numbers else literal(operand))
+        instructions.append(Instruction(Opcode[name], *operands))
+    return instructions
+
+
+def render_assembly(instructions):
+    return "\n".join(str(instruction) for instruction in instructions)
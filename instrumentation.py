@@ -0,0 +1,126 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from tabulate import tabulate
+
+# The profiler collecting spans and counters, or None. Instrumented code only checks this, so
+# with nothing being profiled a span costs one extra call and a counter one global lookup.
+# Whatever runs while a profiler is active is recorded, on any thread.
+active = None
+
+
+class Profiler:
+    # Spans are (name, category, thread, start, duration, self time) in nanoseconds from the
+    # profiler's start; self time leaves out the spans nested inside
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.spans = []
+        self.counters = Counter()
+        self.stacks = {}  # thread id -> nanoseconds spent in the children of each open span
+        self.lock = threading.Lock()
+
+    def enter(self):
+        self.stacks.setdefault(threading.get_ident(), []).append(0)
+
+    def exit(self, name, category, start):
+        end = time.perf_counter_ns()
+        thread = threading.get_ident()
+        stack = self.stacks[thread]
+        children = stack.pop()
+        duration = end - start
+        if stack:
+            stack[-1] += duration
+        with self.lock:
+            self.spans.append((name, category, thread, start - self.origin, duration, duration - children))
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def summary(self):
+        # name -> [calls, total, self] in nanoseconds, slowest self time first
+        totals = {}
+        for name, category, thread, start, duration, self_time in self.spans:
+            entry = totals.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] += self_time
+        return dict(sorted(totals.items(), key=lambda item: item[1][2], reverse=True))
+
+    def chrome_trace(self):
+        # The Trace Event Format read by chrome://tracing and Perfetto
+        pid = os.getpid()
+        events = [{'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': thread,
+                   'ts': start / 1000, 'dur': duration / 1000}
+                  for name, category, thread, start, duration, self_time in self.spans]
+        end = max((start + duration for *_, start, duration, self_time in self.spans), default=0)
+        for name, value in self.counters.items():
+            events.append({'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end / 1000, 'args': {name: value}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'counters': dict(self.counters)}}
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.chrome_trace(), file)
+
+    def __str__(self):
+        rows = [[name, calls, round(total / 1e6, 3), round(self_time / 1e6, 3)]
+                for name, (calls, total, self_time) in self.summary().items()]
+        spans = tabulate(rows, ["Span", "Calls", "Total (ms)", "Self (ms)"], tablefmt='grid')
+        counters = tabulate(sorted(self.counters.items()), ["Counter", "Value"], tablefmt='grid')
+        return f"{spans}\n{counters}"
+
+
+@contextmanager
+def profile(profiler=None):
+    # Profiles everything inside the with block; yields the profiler
+    global active
+    profiler = profiler or Profiler()
+    previous, active = active, profiler
+    try:
+        yield profiler
+    finally:
+        active = previous
+
+
+def span(name, category='compiler'):
+    # Decorator timing every call of a function while a profiler is active
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            profiler = active
+            if profiler is None:
+                return function(*args, **kwargs)
+            profiler.enter()
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.exit(name, category, start)
+        return timed
+    return decorate
+
+
+def timed(name, function, category='compiler'):
+    # function itself when nothing is being profiled, and otherwise a version of it recording
+    # spans for the active profiler. For code run too often to pay even span's extra call.
+    profiler = active
+    if profiler is None:
+        return function
+
+    @functools.wraps(function)
+    def timed_call(*args, **kwargs):
+        profiler.enter()
+        start = time.perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.exit(name, category, start)
+    return timed_call
+
+
+def count(name, amount=1):
+    if active is not None:
+        active.count(name, amount)
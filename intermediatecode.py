@@ -0,0 +1,316 @@
+import re
+from sylvaast import NodeVisitor, BinaryOp
+from instrumentation import span
+
+binary_operators = {'+', '-', '*', '/', '%', '<', '<=', '>', '>=', '==', '!='}
+negated_comparisons = {'<': '>=', '<=': '>', '>': '<=', '>=': '<', '==': '!=', '!=': '=='}
+
+
+class Const:
+    __slots__ = ('value', 'text')
+
+    def __init__(self, value, text):
+        self.value = value
+        self.text = text
+
+    def __eq__(self, other):
+        return isinstance(other, Const) and self.text == other.text
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __str__(self):
+        return self.text
+
+
+def constant(value):
+    if isinstance(value, bool):
+        return Const(value, 'True' if value else 'False')
+    if isinstance(value, str):
+        return Const(value, f'"{value}"')
+    return Const(value, str(value))
+
+
+def operand(token):
+    # Literal tokens become constants, identifiers stay plain variable names
+    if token.type == 'IDENTIFIER':
+        return token.value
+    if token.type == 'NUMERIC_LITERAL':
+        return Const(int(token.value), token.value)
+    if token.type == 'FLOAT_LITERAL':
+        return Const(float(token.value), token.value)
+    if token.type == 'STRING_LITERAL':
+        return Const(token.value[1:-1], token.value)
+    if token.type == 'BOOL_LITERAL':
+        return Const(token.value == 'True', token.value)
+    return token.value  # Whatever a malformed expression started with, as the old generator did
+
+
+def evaluate(operator, left, right):
+    # Shared by constant folding and anything that executes the generated code
+    if operator == '+':
+        return left + right
+    elif operator == '-':
+        return left - right
+    elif operator == '*':
+        return left * right
+    elif operator == '/':
+        if isinstance(left, int) and isinstance(right, int):
+            return left // right
+        return left / right
+    elif operator == '%':
+        return left % right
+    elif operator == '<':
+        return int(left < right)
+    elif operator == '<=':
+        return int(left <= right)
+    elif operator == '>':
+        return int(left > right)
+    elif operator == '>=':
+        return int(left >= right)
+    elif operator == '==':
+        return int(left == right)
+    elif operator == '!=':
+        return int(left != right)
+    raise ValueError(f"Unknown operator {operator}")
+
+
+def is_temporary(name):
+    return isinstance(name, str) and name.startswith('$')
+
+
+class Quad:
+    # op is a binary operator, or one of: copy, label, jump, iffalse, param, call, func, receive, return
+    __slots__ = ('op', 'dest', 'arg1', 'arg2')
+
+    def __init__(self, op, dest=None, arg1=None, arg2=None):
+        self.op = op
+        self.dest = dest
+        self.arg1 = arg1
+        self.arg2 = arg2
+
+    def uses(self):
+        if self.op in binary_operators:
+            return (self.arg1, self.arg2)
+        if self.op in ('copy', 'iffalse', 'param'):
+            return (self.arg1,)
+        return ()
+
+    def defines(self):
+        if self.op in binary_operators or self.op in ('copy', 'receive'):
+            return self.dest
+        return None
+
+    def __str__(self):
+        if self.op in binary_operators:
+            return f"{self.dest} = {self.arg1} {self.op} {self.arg2}"
+        elif self.op == 'copy':
+            return f"{self.dest} = {self.arg1}"
+        elif self.op == 'label':
+            return f"{self.dest}:"
+        elif self.op == 'jump':
+            return f"goto {self.dest}"
+        elif self.op == 'iffalse':
+            return f"iffalse {self.arg1} goto {self.dest}"
+        elif self.op == 'param':
+            return f"param {self.arg1}"
+        elif self.op == 'call':
+            return f"call {self.dest}, {self.arg1}"
+        elif self.op == 'func':
+            return f"func {self.dest}"
+        elif self.op == 'receive':
+            return f"receive {self.dest}"
+        return self.op
+
+
+# Three-address code ends a basic block at every label and after every transfer of control
+block_enders = {'jump', 'iffalse', 'return', 'call'}
+
+
+def split_blocks(code):
+    blocks = []
+    block = []
+    for quad in code:
+        if quad.op in ('label', 'func') and block:
+            blocks.append(block)
+            block = []
+        block.append(quad)
+        if quad.op in block_enders:
+            blocks.append(block)
+            block = []
+    if block:
+        blocks.append(block)
+    return blocks
+
+
+def block_successors(blocks):
+    # Indexes of the blocks control can reach next from each block
+    labels = {block[0].dest: index for index, block in enumerate(blocks) if block[0].op == 'label'}
+    successors = []
+    for index, block in enumerate(blocks):
+        last = block[-1]
+        targets = []
+        if last.op in ('jump', 'iffalse') and last.dest in labels:
+            targets.append(labels[last.dest])
+        if last.op not in ('jump', 'return') and index + 1 < len(blocks):
+            targets.append(index + 1)
+        successors.append(targets)
+    return successors
+
+
+class FreshNames:
+    # Temporaries and labels numbered past every one already in the code, for copies of code
+    # that must not share names with the original
+    def __init__(self, code):
+        self.temp_count = 0
+        self.label_count = 0
+        for quad in code:
+            for value in (quad.dest, quad.arg1, quad.arg2):
+                if isinstance(value, str):
+                    match = numbered.fullmatch(value)
+                    if match and match.group(1) == '$t':
+                        self.temp_count = max(self.temp_count, int(match.group(2)))
+                    elif match and quad.op in ('label', 'jump', 'iffalse'):
+                        self.label_count = max(self.label_count, int(match.group(2)))
+
+    def temp(self):
+        self.temp_count += 1
+        return f"$t{self.temp_count}"
+
+    def label(self):
+        self.label_count += 1
+        return f"L{self.label_count}"
+
+
+numbered = re.compile(r'(\$t|L)(\d+)')
+
+
+def renamed_copy(code, fresh):
+    # A copy of code that can sit next to the original: the labels it defines and the
+    # temporaries it assigns get fresh names, everywhere they appear in it
+    renamed = {}
+    for quad in code:
+        if quad.op == 'label':
+            renamed[quad.dest] = fresh.label()
+        elif is_temporary(quad.defines()):
+            renamed[quad.dest] = fresh.temp()
+    copied = []
+    for quad in code:
+        dest = quad.dest
+        if quad.op in ('label', 'jump', 'iffalse') or is_temporary(dest):
+            dest = renamed.get(dest, dest)
+        arg1 = renamed.get(quad.arg1, quad.arg1) if is_temporary(quad.arg1) else quad.arg1
+        arg2 = renamed.get(quad.arg2, quad.arg2) if is_temporary(quad.arg2) else quad.arg2
+        copied.append(Quad(quad.op, dest, arg1, arg2))
+    return copied
+
+
+class IntermediateCodeGenerator(NodeVisitor):
+    def __init__(self, program):
+        self.program = program
+        self.code = []
+        self.label_count = 0
+        self.temp_count = 0
+
+    @span('IntermediateCodeGenerator.generate')
+    def generate(self):
+        self.visit(self.program)
+        return self.code
+
+    def new_label(self):
+        self.label_count += 1
+        return f"L{self.label_count}"
+
+    def new_temp(self):
+        self.temp_count += 1
+        return f"$t{self.temp_count}"
+
+    def emit(self, op, dest=None, arg1=None, arg2=None):
+        self.code.append(Quad(op, dest, arg1, arg2))
+
+    def lower_expression(self, expression, dest=None):
+        # Returns the operand holding the value; with dest given the result is assigned to it
+        if isinstance(expression, BinaryOp):
+            left = self.lower_expression(expression.left)
+            right = self.lower_expression(expression.right)
+            target = dest or self.new_temp()
+            self.emit(expression.operator.value, target, left, right)
+            return target
+        value = operand(expression)
+        if dest is not None:
+            self.emit('copy', dest, value)
+            return dest
+        return value
+
+    def lower_condition(self, condition, false_label, negate=False):
+        operator = condition.operator.value
+        if negate:
+            operator = negated_comparisons[operator]
+        temp = self.new_temp()
+        self.emit(operator, temp, operand(condition.left), operand(condition.right))
+        self.emit('iffalse', false_label, temp)
+
+    def lower_block(self, body):
+        for statement in body:
+            self.visit(statement)
+
+    def visit_Declaration(self, node):
+        self.lower_expression(node.value, node.name.value)
+
+    def visit_Assignment(self, node):
+        self.lower_expression(node.value, node.target.value)
+
+    def visit_IfStatement(self, node):
+        end_label = None
+        for index, branch in enumerate(node.branches):
+            next_label = None
+            if branch.condition:
+                next_label = self.new_label()
+                self.lower_condition(branch.condition, next_label, negate=branch.kind == 'if not')
+            self.lower_block(branch.body)
+            if index < len(node.branches) - 1:
+                end_label = end_label or self.new_label()
+                self.emit('jump', end_label)
+            if next_label:
+                self.emit('label', next_label)
+        if end_label:
+            self.emit('label', end_label)
+
+    def visit_WhileLoop(self, node):
+        start_label = self.new_label()
+        end_label = self.new_label()
+        self.emit('label', start_label)
+        self.lower_condition(node.condition, end_label)
+        self.lower_block(node.body)
+        self.emit('jump', start_label)
+        self.emit('label', end_label)
+
+    def visit_ForLoop(self, node):
+        start_label = self.new_label()
+        end_label = self.new_label()
+        if node.init:
+            self.visit(node.init)
+        self.emit('label', start_label)
+        self.lower_condition(node.condition, end_label)
+        self.lower_block(node.body)
+        if node.variable:
+            name = node.variable.value
+            self.emit('+' if node.step.type == 'INCREMENT' else '-', name, name, Const(1, '1'))
+        self.emit('jump', start_label)
+        self.emit('label', end_label)
+
+    def visit_Function(self, node):
+        # The body is emitted in place, so straight-line code jumps over it
+        function_name = node.name.value
+        self.emit('jump', f"{function_name}_end")
+        self.emit('func', function_name)
+        for j, param in enumerate(node.params):
+            self.emit('receive', param.name.value, j)
+        self.lower_block(node.body)
+        self.emit('return')
+        self.emit('label', f"{function_name}_end")
+
+    def visit_Call(self, node):
+        for j, arg in enumerate(node.args):
+            self.emit('param', None, operand(arg), j)
+        self.emit('call', node.name.value, len(node.args))
@@ -0,0 +1,164 @@
+from intermediatecode import Const, binary_operators, negated_comparisons, evaluate, is_temporary
+from dataflow import natural_loops
+
+
+class LoopShape:
+    # A natural loop laid out as one run of blocks, first to last, that control only enters
+    # by falling into first from the block before it, the preheader. As for and while loops
+    # are lowered, first tests the condition, `label; test = a < b; iffalse test exit`, and
+    # last jumps back to it; the loop is left for the label just after last. A rotated loop
+    # tests at the bottom instead: last ends with `test = a >= b; iffalse test first` and is
+    # left by falling through, so it always runs at least once.
+    __slots__ = ('cfg', 'first', 'last', 'rotated', 'label', 'test')
+
+    def __init__(self, cfg, first, last, rotated, test):
+        self.cfg = cfg
+        self.first = first
+        self.last = last
+        self.rotated = rotated
+        self.label = cfg.blocks[first][0].dest
+        self.test = test  # The comparison the loop is tested with
+
+    @property
+    def preheader(self):
+        return self.first - 1
+
+    @property
+    def body(self):
+        # The blocks run on every iteration past the test at the top, if there is one
+        return range(self.first if self.rotated else self.first + 1, self.last + 1)
+
+    def quads(self):
+        # (block, offset, quad) for everything in the loop
+        for index in range(self.first, self.last + 1):
+            for offset, quad in enumerate(self.cfg.blocks[index]):
+                yield index, offset, quad
+
+    def definitions(self):
+        counts = {}
+        for _, _, quad in self.quads():
+            defined = quad.defines()
+            if defined is not None:
+                counts[defined] = counts.get(defined, 0) + 1
+        return counts
+
+    def calls(self):
+        return any(quad.op == 'call' for _, _, quad in self.quads())
+
+    def induction_variables(self, dominators):
+        # Variables stepped by a constant whole number once per iteration: name -> (block,
+        # offset, step). The one assignment in the loop is `name = name + step` or
+        # `name = name - step`, in a block every iteration runs.
+        counts = self.definitions()
+        variables = {}
+        for index, offset, quad in self.quads():
+            name = quad.dest
+            if quad.op not in ('+', '-') or counts.get(name) != 1 or not dominators.dominates(index, self.last):
+                continue
+            if quad.arg1 == name and whole_number(quad.arg2):
+                step = quad.arg2.value if quad.op == '+' else -quad.arg2.value
+            elif quad.op == '+' and quad.arg2 == name and whole_number(quad.arg1):
+                step = quad.arg1.value
+            else:
+                continue
+            variables[name] = (index, offset, step)
+        return variables
+
+    def trip_count(self, dominators, limit):
+        # How many times a loop still tested at the top runs, if its test compares an induction
+        # variable the preheader sets to a whole number with a constant and that is at most limit
+        if self.rotated:
+            return None
+        variables = self.induction_variables(dominators)
+        left, right = self.test.arg1, self.test.arg2
+        if left in variables and isinstance(right, Const):
+            name = left
+        elif right in variables and isinstance(left, Const):
+            name = right
+        else:
+            return None
+        value = None
+        for quad in reversed(self.cfg.blocks[self.preheader]):
+            if quad.defines() == name:
+                value = quad.arg1 if quad.op == 'copy' and whole_number(quad.arg1) else None
+                break
+        if value is None:
+            return None
+        value = value.value
+        step = variables[name][2]
+        for trips in range(limit + 1):
+            operands = (value, right.value) if name == left else (left.value, value)
+            try:
+                if not evaluate(self.test.op, *operands):
+                    return trips
+            except TypeError:
+                return None
+            value += step
+        return None
+
+
+def whole_number(value):
+    return isinstance(value, Const) and isinstance(value.value, int) and not isinstance(value.value, bool)
+
+
+def loop_shapes(cfg, dominators):
+    # The natural loops laid out as LoopShape expects, innermost first
+    shapes = []
+    for loop in natural_loops(cfg, dominators):
+        first, last = loop.header, max(loop.blocks)
+        if loop.latches != [last] or len(loop.blocks) != last - first + 1 or first == 0:
+            continue
+        if sorted(cfg.predecessors[first]) != [first - 1, last]:
+            continue
+        blocks = cfg.blocks
+        header, latch = blocks[first], blocks[last]
+        if header[0].op != 'label':
+            continue
+        entering = blocks[first - 1][-1]
+        if entering.op == 'iffalse' and entering.dest == header[0].dest:
+            continue
+        inside = {blocks[index][0].dest for index in loop.blocks if blocks[index][0].op == 'label'}
+        if latch[-1].op == 'jump' and len(header) == 3 and last + 1 < len(blocks):
+            rotated = False
+            test, leave = header[1], header[2]
+            exit_label = blocks[last + 1][0].dest if blocks[last + 1][0].op == 'label' else None
+            if leave.op != 'iffalse' or leave.dest != exit_label or exit_label is None:
+                continue
+        elif latch[-1].op == 'iffalse' and len(latch) >= 2:
+            rotated = True
+            test, leave = latch[-2], latch[-1]
+            exit_label = None
+        else:
+            continue
+        if test.op not in negated_comparisons or not is_temporary(test.dest) or leave.arg1 != test.dest:
+            continue
+        shape = LoopShape(cfg, first, last, rotated, test)
+        if all(quad.op not in ('func', 'return') and (quad.op not in ('jump', 'iffalse') or quad.dest in inside
+                                                      or quad is leave)
+               for _, _, quad in shape.quads()):
+            shapes.append(shape)
+    return shapes
+
+
+def invariants(shape, dominators):
+    # The assignments of a loop with no calls that give the same value on every iteration and
+    # can run once before it instead: their operands are constants, or names the loop never
+    # assigns or only assigns by another of these. Each runs on every iteration, and is the
+    # loop's one assignment to its name; a named variable also must not be read in the loop,
+    # where it could still hold its value from before. Returns their (block, offset) places.
+    counts = shape.definitions()
+    read = {value for _, _, quad in shape.quads() for value in quad.uses() if isinstance(value, str)}
+    hoisted = {}  # name -> place
+    for index in shape.body:
+        if not dominators.dominates(index, shape.last):
+            continue
+        for offset, quad in enumerate(shape.cfg.blocks[index]):
+            if quad.op not in binary_operators and quad.op != 'copy':
+                continue
+            if quad is shape.test or counts.get(quad.dest) != 1:
+                continue
+            if not is_temporary(quad.dest) and quad.dest in read:
+                continue
+            if all(not isinstance(value, str) or value not in counts or value in hoisted for value in quad.uses()):
+                hoisted[quad.dest] = (index, offset)
+    return list(hoisted.values())
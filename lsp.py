@@ -0,0 +1,393 @@
+import asyncio
+import bisect
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from session import CompilationSession
+
+debounce_delay = 0.2  # Seconds a document must go unedited before its diagnostics are worked out
+analysis_threads = 4
+
+# JSON-RPC and LSP error codes
+parse_error = -32700
+method_not_found = -32601
+internal_error = -32603
+request_cancelled = -32800
+content_modified = -32801
+
+lsp_severities = {'error': 1, 'warning': 2, 'note': 3}
+
+
+def utf16_offset(line, character):
+    # The index into line of an LSP character position, which counts UTF-16 code units
+    if line.isascii():
+        return min(character, len(line))
+    units = 0
+    for index, char in enumerate(line):
+        if units >= character:
+            return index
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+
+def utf16_length(text):
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+class Snapshot:
+    # A document as of one analysis: its CompilationResult. Lines there count from 1 and LSP
+    # lines from 0.
+    __slots__ = ('version', 'result')
+
+    def __init__(self, version, result):
+        self.version = version
+        self.result = result
+
+    def position(self, number, column):
+        # The LSP position of a line number and column counting from 1
+        if number is None or not 0 < number <= len(self.result.lines):
+            return {'line': 0, 'character': 0}
+        text = self.result.lines[number - 1]
+        return {'line': number - 1, 'character': utf16_length(text[:(column or 1) - 1])}
+
+    def token_at(self, line, character):
+        # The token under an LSP position, or None. A position just past a name, where the
+        # cursor sits after typing it, still counts as on it.
+        if not 0 <= line < len(self.result.lines):
+            return None
+        number = line + 1
+        tokens = self.result.tokens
+        first = bisect.bisect_left(tokens, number, key=lambda token: token.line)
+        column = utf16_offset(self.result.lines[line], character) + 1
+        found = None
+        for token in tokens[first:]:
+            if token.line != number or token.column > column:
+                break
+            if column <= token.column + len(str(token.value)) and (found is None or token.type == 'IDENTIFIER'):
+                found = token
+        return found
+
+    def token_range(self, token):
+        start = self.position(token.line, token.column)
+        return {'start': start, 'end': self.position(token.line, token.column + len(str(token.value)))}
+
+    def diagnostics(self):
+        published = []
+        for diagnostic in self.result.diagnostics.unique():
+            start = self.position(diagnostic.line, diagnostic.column)
+            if diagnostic.end_column is not None:
+                end = self.position(diagnostic.end_line, diagnostic.end_column)
+            else:
+                end = start
+            published.append({'range': {'start': start, 'end': end}, 'severity': lsp_severities[diagnostic.severity],
+                              'code': diagnostic.code, 'source': 'sylva', 'message': diagnostic.message})
+        return published
+
+    def entry(self, token):
+        # The symbol table entry a name refers to: the latest declaration of it at or above its
+        # line, which is the innermost one in scope there, or else the first
+        entries = self.result.symbol_table.index.get(token.value)
+        if not entries:
+            return None
+        above = [entry for entry in entries if entry['Line of Declaration'] <= token.line]
+        return above[-1] if above else entries[0]
+
+    def declaration(self, entry):
+        # The token declaring an entry
+        number = entry['Line of Declaration']
+        first = bisect.bisect_left(self.result.tokens, number, key=lambda token: token.line)
+        for token in self.result.tokens[first:]:
+            if token.line != number:
+                break
+            if token.type == 'IDENTIFIER' and token.value == entry['Name']:
+                return token
+        return None
+
+    def describe(self, entry):
+        # Hover text for an entry, in Markdown
+        if entry['Entry Type'] == 'function':
+            heading = f"func {entry['Name']}"
+        else:
+            heading = f"{entry['Type']} {entry['Name']}"
+        lines = [f"```sylva\n{heading}\n```"]
+        details = f"Declared on line {entry['Line of Declaration']}"
+        if entry['Scope'] != 'global':
+            details += f" in function {entry['Scope']}"
+        if entry['Size'] is not None:
+            details += f", {entry['Size']} bytes"
+        lines.append(details)
+        used = sorted(set(entry['Lines of Usage']))
+        if used:
+            lines.append(f"Used on line{'s' if len(used) > 1 else ''} {', '.join(map(str, used))}")
+        return "\n\n".join(lines)
+
+
+class Document:
+    # One open buffer. Edits only change the text; the session catches up on a worker thread,
+    # one analysis at a time, and the snapshot is the newest analysis finished.
+    def __init__(self, uri, text, version):
+        self.uri = uri
+        self.text = text
+        self.version = version
+        self.session = CompilationSession()
+        self.snapshot = None
+        self.lock = asyncio.Lock()
+        self.pending = None  # The debounced diagnostics task, if one is waiting or running
+
+    def apply(self, change):
+        # One contentChanges entry: the whole text, or a range replaced
+        if 'range' not in change:
+            self.text = change['text']
+            return
+        start, end = change['range']['start'], change['range']['end']
+        self.text = self.text[:self.offset(start)] + change['text'] + self.text[self.offset(end):]
+
+    def offset(self, position):
+        # The index into text of an LSP position
+        line = position['line']
+        start = 0
+        for _ in range(line):
+            newline = self.text.find('\n', start)
+            if newline < 0:
+                return len(self.text)
+            start = newline + 1
+        end = self.text.find('\n', start)
+        if end < 0:
+            end = len(self.text)
+        return start + utf16_offset(self.text[start:end], position['character'])
+
+    def analyze(self, version, text):
+        # Runs on a worker thread, under the document's lock
+        self.session.update(text)
+        result = self.session.result()
+        result.output('semantic_results')
+        return Snapshot(version, result)
+
+    async def current(self, executor):
+        # The snapshot of the text as it is now, analyzing it first if need be
+        async with self.lock:
+            if self.snapshot is None or self.snapshot.version != self.version:
+                loop = asyncio.get_running_loop()
+                self.snapshot = await loop.run_in_executor(executor, self.analyze, self.version, self.text)
+            return self.snapshot
+
+
+class ContentModified(Exception):
+    pass
+
+
+class LanguageServer:
+    # A Language Server Protocol server over any pair of asyncio streams, stdio by default.
+    # Notifications are handled in the order they arrive; each request runs as a task of its
+    # own, so a slow one never holds up the rest and $/cancelRequest can stop it. Diagnostics
+    # are published once a document has gone debounce_delay without an edit, and a request
+    # that was answering for a document edited since gets ContentModified instead.
+    def __init__(self, reader, writer, executor=None):
+        self.reader = reader
+        self.writer = writer
+        self.executor = executor or ThreadPoolExecutor(analysis_threads, thread_name_prefix="sylva-lsp")
+        self.documents = {}
+        self.requests = {}  # id -> task answering it
+        self.shutting_down = False
+        self.handlers = {
+            'initialize': self.initialize,
+            'shutdown': self.shutdown,
+            'textDocument/hover': self.hover,
+            'textDocument/definition': self.definition,
+        }
+        self.notifications = {  # Any other notification is ignored
+            '$/cancelRequest': self.cancel,
+            'textDocument/didOpen': self.did_open,
+            'textDocument/didChange': self.did_change,
+            'textDocument/didClose': self.did_close,
+        }
+
+    async def read_message(self):
+        # One message framed by its headers, or None once the stream ends
+        length = None
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.decode('ascii').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        if length is None:
+            return {}
+        return json.loads(await self.reader.readexactly(length))
+
+    def send(self, message):
+        body = json.dumps(message, separators=(',', ':')).encode('utf-8')
+        self.writer.write(f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body)
+
+    def respond(self, id, result=None, error=None):
+        message = {'jsonrpc': '2.0', 'id': id}
+        if error is not None:
+            message['error'] = {'code': error[0], 'message': error[1]}
+        else:
+            message['result'] = result
+        self.send(message)
+
+    def notify(self, method, params):
+        self.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    async def serve(self):
+        # Runs until the client sends exit or closes the stream; returns the exit code
+        try:
+            while True:
+                try:
+                    message = await self.read_message()
+                except (ValueError, asyncio.IncompleteReadError):
+                    self.respond(None, error=(parse_error, "Invalid message"))
+                    continue
+                if message is None:
+                    return 1
+                method = message.get('method')
+                if method == 'exit':
+                    return 0 if self.shutting_down else 1
+                if 'id' in message and method is not None:
+                    task = asyncio.create_task(self.answer(message))
+                    task.add_done_callback(lambda task, id=message['id']: self.finished(id, task))
+                    self.requests[message['id']] = task
+                elif method in self.notifications:
+                    self.notifications[method](message.get('params') or {})
+                await self.writer.drain()
+        finally:
+            for task in list(self.requests.values()):
+                task.cancel()
+            for document in self.documents.values():
+                if document.pending is not None:
+                    document.pending.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def answer(self, message):
+        id = message['id']
+        handler = self.handlers.get(message['method'])
+        try:
+            if handler is None:
+                self.respond(id, error=(method_not_found, f"Unknown method {message['method']}"))
+            else:
+                self.respond(id, await handler(message.get('params') or {}))
+        except ContentModified:
+            self.respond(id, error=(content_modified, "Document changed"))
+        except Exception as error:
+            self.respond(id, error=(internal_error, f"{type(error).__name__}: {error}"))
+        await self.writer.drain()
+
+    def finished(self, id, task):
+        # A request cancelled before it could answer still gets a response
+        self.requests.pop(id, None)
+        if task.cancelled() and not self.writer.is_closing():
+            self.respond(id, error=(request_cancelled, "Request cancelled"))
+
+    def cancel(self, params):
+        task = self.requests.get(params.get('id'))
+        if task is not None:
+            task.cancel()
+
+    async def initialize(self, params):
+        return {
+            'capabilities': {
+                'textDocumentSync': {'openClose': True, 'change': 2},  # Incremental
+                'hoverProvider': True,
+                'definitionProvider': True,
+            },
+            'serverInfo': {'name': 'sylva'},
+        }
+
+    async def shutdown(self, params):
+        self.shutting_down = True
+        return None
+
+    def did_open(self, params):
+        item = params['textDocument']
+        document = self.documents[item['uri']] = Document(item['uri'], item['text'], item.get('version', 0))
+        self.schedule(document)
+
+    def did_change(self, params):
+        document = self.documents.get(params['textDocument']['uri'])
+        if document is None:
+            return
+        for change in params['contentChanges']:
+            document.apply(change)
+        document.version = params['textDocument'].get('version', document.version + 1)
+        self.schedule(document)
+
+    def did_close(self, params):
+        document = self.documents.pop(params['textDocument']['uri'], None)
+        if document is not None:
+            if document.pending is not None:
+                document.pending.cancel()
+            self.notify('textDocument/publishDiagnostics', {'uri': document.uri, 'diagnostics': []})
+
+    def schedule(self, document):
+        # Restarts the wait before publishing; an analysis already running for an older
+        # version finishes, but its diagnostics are dropped
+        if document.pending is not None:
+            document.pending.cancel()
+        document.pending = asyncio.create_task(self.publish(document))
+
+    async def publish(self, document):
+        await asyncio.sleep(debounce_delay)
+        snapshot = await asyncio.shield(document.current(self.executor))
+        if snapshot.version == document.version and self.documents.get(document.uri) is document:
+            self.notify('textDocument/publishDiagnostics', {'uri': document.uri, 'version': snapshot.version,
+                                                            'diagnostics': snapshot.diagnostics()})
+            await self.writer.drain()
+
+    async def lookup(self, params):
+        # The snapshot and the token a position request points at
+        document = self.documents.get(params['textDocument']['uri'])
+        if document is None:
+            return None, None
+        version = document.version
+        snapshot = await document.current(self.executor)
+        if document.version != version:
+            raise ContentModified()
+        position = params['position']
+        return snapshot, snapshot.token_at(position['line'], position['character'])
+
+    async def hover(self, params):
+        snapshot, token = await self.lookup(params)
+        if token is None or token.type != 'IDENTIFIER':
+            return None
+        entry = snapshot.entry(token)
+        if entry is None:
+            return None
+        return {'contents': {'kind': 'markdown', 'value': snapshot.describe(entry)},
+                'range': snapshot.token_range(token)}
+
+    async def definition(self, params):
+        snapshot, token = await self.lookup(params)
+        if token is None or token.type != 'IDENTIFIER':
+            return None
+        entry = snapshot.entry(token)
+        declaration = snapshot.declaration(entry) if entry is not None else None
+        if declaration is None:
+            return None
+        return {'uri': params['textDocument']['uri'], 'range': snapshot.token_range(declaration)}
+
+
+async def stdio_streams():
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout.buffer)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+async def serve_stdio():
+    reader, writer = await stdio_streams()
+    return await LanguageServer(reader, writer).serve()
+
+
+def main():
+    return asyncio.run(serve_stdio())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,15 @@
-from youlexical import lex, SymbolTable
-from sylvasyntax import Token, SyntaxAnalyzer
+from sylvalexical import lex, SymbolTable
+from sylvasyntax import SyntaxAnalyzer
 from sylvasemantic import SemanticAnalyzer
 from codegeneration import CodeGenerator
-from intermediatecode import IntermediateCodeGenerator  # Importing the IntermediateCodeGenerator class
+from intermediatecode import IntermediateCodeGenerator, is_temporary  # Importing the IntermediateCodeGenerator class
+from optimizer import PassManager
+from callgraph import CallGraph
+from peephole import PeepholeOptimizer
+from instructions import render_assembly
+from bytecode import encode, decode
+from vm import VM
+from diagnostics import DiagnosticSink
 
 def main():
     code = """
@@ -41,10 +48,12 @@ def main():
     add(3,5);
     sum(7,9);
     """
-    raw_tokens, symbol_table = lex(code)
-    for token in raw_tokens:
-        print(f"Line {token[0]}: {token[1]} - {token[2]}")
-    tokens = [Token(line, type, value) for line, type, value in raw_tokens]
+    lex_results = DiagnosticSink()
+    tokens, symbol_table = lex(code, lex_results)
+    for token in tokens:
+        print(f"Line {token.line}: {token.type} - {token.value}")
+    for diagnostic in lex_results:
+        print(diagnostic.format())
 
     print(symbol_table)
 
@@ -53,30 +62,55 @@ def main():
     syntax_results = analyzer.parse()
 
     # Semantic analysis
-    semantic_analyzer = SemanticAnalyzer(tokens, symbol_table)
+    semantic_analyzer = SemanticAnalyzer(analyzer.program, symbol_table)
     semantic_results = semantic_analyzer.analyze()
 
     print("Syntax Analysis Results:")
     if not syntax_results:
         print("No errors")
     else:
-        for result, message in syntax_results:
-            print(message)
+        for diagnostic in syntax_results:
+            print(diagnostic.format())
 
     print("\nSemantic Analysis Results:")
     if not semantic_results:
         print("No errors")
     else:
-        for message in semantic_results:
-            print(message)
+        for diagnostic in semantic_results:
+            print(diagnostic.format())
 
 
 
+    # Intermediate code and optimization
+    intermediate_code = IntermediateCodeGenerator(analyzer.program).generate()
+    print("\nCall Graph:")
+    print(CallGraph(intermediate_code, symbol_table))
+    optimizer = PassManager(symbol_table=symbol_table)
+    intermediate_code = optimizer.run(intermediate_code)
+    print("\nIntermediate Code:")
+    for quad in intermediate_code:
+        print(quad)
+    print("\nOptimization Passes:")
+    print(optimizer)
+
     # Code generation
-    code_generator = CodeGenerator(tokens, symbol_table)
-    assembly_code = code_generator.generate_code()
+    code_generator = CodeGenerator(intermediate_code, symbol_table)
+    peephole = PeepholeOptimizer()
+    instructions = peephole.optimize(code_generator.generate())
     print("\nGenerated Assembly Code:")
-    print(assembly_code)
+    print(render_assembly(instructions))
+    print("\nPeephole Rules:")
+    print(peephole)
+    bytecode = encode(instructions)
+    print(f"\nBytecode: {len(bytecode)} bytes")
+
+    # Execution
+    machine = VM(decode(bytecode))
+    memory = machine.run()
+    print(f"\nExecution ({machine.steps} instructions):")
+    for name, value in memory.items():
+        if not is_temporary(name):
+            print(f"{name} = {value}")
 
 if __name__ == "__main__":
     main()
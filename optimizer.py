@@ -0,0 +1,452 @@
+import time
+from tabulate import tabulate
+from intermediatecode import (Quad, Const, FreshNames, binary_operators, negated_comparisons, constant, evaluate,
+                               is_temporary, split_blocks, block_successors, renamed_copy)
+from codegeneration import CodeGenerator
+from registerallocation import function_variables
+from dataflow import ControlFlowGraph, Dominators, Liveness, ConstantPropagation, name_bits, folded, varying
+from loops import loop_shapes, invariants
+from callgraph import CallGraph, inline_call
+from instructions import Opcode, render_assembly
+from instrumentation import span
+
+
+max_loop_steps = 10000  # Instructions a loop may take while being worked out before it is left to run
+inline_size_limit = 8  # Functions this small are inlined at every call, being about the size of the call itself
+inline_growth_limit = 16  # Instructions inlining may add to the program for each call it saves a run
+max_unroll_trips = 8  # Loops known to run at most this many times are unrolled; 0 turns unrolling off
+unroll_size_limit = 64  # Instructions an unrolled loop may take up
+
+
+@span('fold_constants', 'optimizer')
+def fold_constants(code):
+    folded = []
+    for quad in code:
+        if quad.op in binary_operators and isinstance(quad.arg1, Const) and isinstance(quad.arg2, Const):
+            left, right = quad.arg1.value, quad.arg2.value
+            if not isinstance(left, bool) and not isinstance(right, bool):
+                try:
+                    quad = Quad('copy', quad.dest, constant(evaluate(quad.op, left, right)))
+                except (TypeError, ZeroDivisionError):
+                    pass
+        elif quad.op == 'iffalse' and isinstance(quad.arg1, Const):
+            if quad.arg1.value:
+                continue  # Never taken
+            quad = Quad('jump', quad.dest)
+        folded.append(quad)
+    return folded
+
+
+@span('propagate_copies', 'optimizer')
+def propagate_copies(code):
+    # Block-local: a call can change any variable, so copies never survive one
+    propagated = []
+    for block in split_blocks(code):
+        copies = {}
+        for quad in block:
+            if quad.op in binary_operators or quad.op in ('copy', 'iffalse', 'param'):
+                arg1 = copies.get(quad.arg1, quad.arg1) if isinstance(quad.arg1, str) else quad.arg1
+                arg2 = quad.arg2
+                if quad.op in binary_operators and isinstance(arg2, str):
+                    arg2 = copies.get(arg2, arg2)
+                quad = Quad(quad.op, quad.dest, arg1, arg2)
+            defined = quad.defines()
+            if defined is not None:
+                for name in [name for name, value in copies.items() if name == defined or value == defined]:
+                    del copies[name]
+                if quad.op == 'copy' and quad.arg1 != defined:
+                    copies[defined] = quad.arg1
+            propagated.append(quad)
+    return propagated
+
+
+@span('eliminate_dead_stores', 'optimizer')
+def eliminate_dead_stores(code):
+    # A store goes when nothing can read the value before it is overwritten or the program
+    # ends, on any path; temporaries are assigned once, so theirs go when nothing reads them.
+    # Variables are global and observable once the program ends. A call runs a function body
+    # from anywhere, so the variables those touch only go when overwritten later in the same
+    # block with no read or call between.
+    excluded = function_variables(code)
+    used = set()
+    names = {}
+    for quad in code:
+        for value in quad.uses():
+            if is_temporary(value):
+                used.add(value)
+            elif isinstance(value, str) and value not in excluded:
+                names.setdefault(value)
+        defined = quad.defines()
+        if defined is not None and not is_temporary(defined) and defined not in excluded:
+            names.setdefault(defined)
+    cfg = ControlFlowGraph.from_code(code)
+    bits = name_bits(cfg, names)
+    liveness = Liveness(cfg, bits, (1 << len(bits)) - 1)
+    kept = []
+    for index, block in enumerate(cfg.blocks):
+        live_out = liveness.live_out[index]
+        read = set()  # Read later in the block before being written again
+        written = set()
+        overwritten = set()  # Function variables written later with no call between
+        live_block = []
+        for quad in reversed(block):
+            if quad.op in binary_operators or quad.op == 'copy':
+                dest = quad.dest
+                if is_temporary(dest):
+                    if dest not in used:
+                        continue
+                elif dest in bits:
+                    if dest not in read and (dest in written or not live_out & bits[dest]):
+                        continue
+                elif dest in overwritten and dest not in read:
+                    continue
+            if quad.op == 'call':
+                overwritten.clear()
+            defined = quad.defines()
+            if defined is not None:
+                written.add(defined)
+                read.discard(defined)
+                if defined in excluded:
+                    overwritten.add(defined)
+            read.update(quad.uses())
+            live_block.append(quad)
+        kept.extend(reversed(live_block))
+    return kept
+
+
+@span('propagate_constants', 'optimizer')
+def propagate_constants(code):
+    # Replaces every read of a variable known to hold one constant with that constant, turns
+    # tests it decides into jumps, drops blocks control never reaches, and works out loops
+    # whose every input is known, leaving only the values they end with. Variables a function
+    # body touches can change at any call, so they are never treated as known.
+    excluded = function_variables(code)
+    names = set()
+    for quad in code:
+        defined = quad.defines()
+        if defined is not None and defined not in excluded:
+            names.add(defined)
+    cfg = ControlFlowGraph.from_code(code)
+    constants = ConstantPropagation(cfg, names)
+    loops = evaluated_loops(cfg, constants, names)
+    propagated = []
+    index = 0
+    while index < len(cfg.blocks):
+        if index in loops:
+            end, copies = loops[index]
+            propagated.extend(copies)
+            index = end
+            continue
+        if constants.executable[index]:
+            for offset, quad in enumerate(cfg.blocks[index]):
+                quad = substituted(quad, constants, index, offset)
+                if quad is not None:
+                    propagated.append(quad)
+        index += 1
+    return propagated
+
+
+def substituted(quad, constants, index, offset):
+    # The quad with its known operands replaced, None if it is a test that is never taken
+    if quad.op in binary_operators:
+        left = constants.value(index, offset, 0)
+        right = constants.value(index, offset, 1)
+        arg1 = left if left is not varying else quad.arg1
+        arg2 = right if right is not varying else quad.arg2
+        if isinstance(arg1, Const) and isinstance(arg2, Const):
+            value = folded(quad.op, arg1, arg2)
+            if value is not varying:
+                return Quad('copy', quad.dest, value)
+        return Quad(quad.op, quad.dest, arg1, arg2)
+    if quad.op in ('copy', 'iffalse', 'param'):
+        value = constants.value(index, offset, 0)
+        if value is varying:
+            return quad
+        if quad.op == 'iffalse':
+            return None if value.value else Quad('jump', quad.dest)
+        return Quad(quad.op, quad.dest, value, quad.arg2)
+    return quad
+
+
+def evaluated_loops(cfg, constants, names):
+    # Loops worked out at compile time: first block -> (block after the loop, copies that
+    # replace it). A loop here is a run of blocks from a label to the jump back to it, or the
+    # test jumping back to it once rotated, left only for the block just after that, doing
+    # nothing but arithmetic on variables whose values are all known on the way in.
+    loops = {}
+    labels = {block[0].dest: index for index, block in enumerate(cfg.blocks) if block[0].op == 'label'}
+    for last, block in enumerate(cfg.blocks):
+        quad = block[-1]
+        first = labels.get(quad.dest) if quad.op in ('jump', 'iffalse') else None
+        if first is None or first > last or first == 0 or not constants.executable[first]:
+            continue
+        if set(cfg.predecessors[first]) != {first - 1, last} or last + 1 >= len(cfg.blocks):
+            continue
+        region = [quad for index in range(first, last + 1) for quad in cfg.blocks[index]]
+        exit_label = cfg.blocks[last + 1][0].dest if cfg.blocks[last + 1][0].op == 'label' else None
+        inside = {cfg.blocks[index][0].dest for index in range(first, last + 1) if cfg.blocks[index][0].op == 'label'}
+        if not all(quad.op in binary_operators or quad.op in ('copy', 'label', 'jump', 'iffalse') for quad in region):
+            continue
+        if not all(quad.dest in inside or quad.dest == exit_label for quad in region if quad.op in ('jump', 'iffalse')):
+            continue
+        copies = run_loop(region, lambda name: constants.value_after(first - 1, name) if name in names else varying)
+        if copies is not None and not any(first <= index <= last for index in loops):
+            loops[first] = (last + 1, copies)
+    return loops
+
+
+def run_loop(region, entry_value):
+    # Executes a loop on known values; returns copies of what it leaves in each variable it
+    # assigns, or None if it reads anything unknown or is still going after max_loop_steps
+    labels = {quad.dest: position for position, quad in enumerate(region) if quad.op == 'label'}
+    values = {}
+    assigned = {}
+    position = 0
+    for _ in range(max_loop_steps):
+        if position == len(region):
+            return [Quad('copy', name, values[name]) for name in assigned]
+        quad = region[position]
+        position += 1
+        operands = []
+        for value in quad.uses():
+            if isinstance(value, str):
+                if value not in values:
+                    values[value] = entry_value(value)
+                value = values[value]
+                if not isinstance(value, Const):
+                    return None
+            operands.append(value)
+        if quad.op in binary_operators:
+            result = folded(quad.op, *operands)
+            if result is varying:
+                return None
+            values[quad.dest] = result
+        elif quad.op == 'copy':
+            values[quad.dest] = operands[0]
+        elif quad.op == 'iffalse':
+            if not operands[0].value:
+                if quad.dest not in labels:
+                    return [Quad('copy', name, values[name]) for name in assigned]
+                position = labels[quad.dest]
+            continue
+        elif quad.op == 'jump':
+            position = labels.get(quad.dest, len(region))
+            continue
+        else:
+            continue
+        assigned[quad.dest] = True
+    return None
+
+
+@span('unroll_loops', 'optimizer')
+def unroll_loops(code):
+    # Replaces a loop known to run only a few times with that many copies of its body. The
+    # count comes from an induction variable the preheader sets to a constant and the test
+    # compares with one; a variable a function body touches only counts if the loop makes no
+    # calls. Unrolled loops no longer test or jump back at all. propagate_constants already
+    # works out loops whose inputs are all known, so the loops left here are those whose
+    # counter a function body also assigns, which it never treats as known.
+    if not max_unroll_trips:
+        return code
+    cfg = ControlFlowGraph.from_code(code)
+    dominators = Dominators(cfg)
+    excluded = function_variables(code)
+    fresh = FreshNames(code)
+    replaced = {}
+    taken = set()
+    for shape in loop_shapes(cfg, dominators):
+        blocks = range(shape.preheader, shape.last + 1)
+        if taken.intersection(blocks):
+            continue
+        trips = shape.trip_count(dominators, max_unroll_trips)
+        if trips is None or (shape.calls() and excluded.intersection(shape.test.uses())):
+            continue
+        body = [quad for index in shape.body for quad in cfg.blocks[index]][:-1]
+        if trips * len(body) > unroll_size_limit:
+            continue
+        unrolled = list(cfg.blocks[shape.preheader])
+        for _ in range(trips):
+            unrolled.extend(renamed_copy(body, fresh))
+        replaced[shape.preheader] = (shape.last + 1, unrolled)
+        taken.update(blocks)
+    return rewritten(cfg, replaced)
+
+
+@span('hoist_invariants', 'optimizer')
+def hoist_invariants(code):
+    # Loop-invariant code motion. A loop tested at the top is rotated first: the test is
+    # copied in front of it as a guard, and moved to the bottom, reversed, to jump back while
+    # the loop goes on, which saves the jump back on every iteration. Behind the guard the
+    # loop always runs at least once, so the assignments giving the same value on every
+    # iteration are moved out in front of it, to run once. Loops that make calls are left
+    # alone, as the function called could read or change anything.
+    cfg = ControlFlowGraph.from_code(code)
+    dominators = Dominators(cfg)
+    fresh = FreshNames(code)
+    replaced = {}
+    taken = set()
+    for shape in loop_shapes(cfg, dominators):
+        blocks = range(shape.preheader, shape.last + 1)
+        if taken.intersection(blocks) or shape.calls():
+            continue
+        places = set(invariants(shape, dominators))
+        if shape.rotated and not places:
+            continue
+        hoisted = [quad for index, offset, quad in shape.quads() if (index, offset) in places]
+        kept = [quad for index, offset, quad in shape.quads() if (index, offset) not in places and index in shape.body]
+        guard = []
+        if not shape.rotated:
+            test = shape.test
+            temp = fresh.temp()
+            guard = [Quad(test.op, temp, test.arg1, test.arg2), Quad('iffalse', cfg.blocks[shape.last + 1][0].dest, temp)]
+            kept = [Quad('label', shape.label)] + kept[:-1] + [
+                Quad(negated_comparisons[test.op], test.dest, test.arg1, test.arg2),
+                Quad('iffalse', shape.label, test.dest)]
+        replaced[shape.preheader] = (shape.last + 1, preheaded(cfg.blocks[shape.preheader], guard + hoisted) + kept)
+        taken.update(blocks)
+    return rewritten(cfg, replaced)
+
+
+def preheaded(block, quads):
+    # A loop's preheader with quads added where control leaves it for the loop
+    if block[-1].op == 'jump':
+        return block[:-1] + quads + block[-1:]
+    return block + quads
+
+
+def rewritten(cfg, replaced):
+    # The code of cfg with runs of blocks swapped out: first block -> (block after, quads)
+    if not replaced:
+        return [quad for block in cfg.blocks for quad in block]
+    code = []
+    index = 0
+    while index < len(cfg.blocks):
+        if index in replaced:
+            index, quads = replaced[index]
+            code.extend(quads)
+        else:
+            code.extend(cfg.blocks[index])
+            index += 1
+    return code
+
+
+@span('inline_functions', 'optimizer')
+def inline_functions(code, symbol_table=None):
+    # Replaces calls with copies of the function body where that pays for itself, then drops
+    # every function the top-level code can no longer reach through calls. A function is
+    # inlined when it is small, or when the copies beyond the one its removal pays for are
+    # few instructions for the calls they save, counting ten calls for a site inside a loop.
+    # Inlined bodies keep their own calls, which later rounds inline in turn.
+    graph = CallGraph(code, symbol_table)
+    inlined = set()
+    for name, definition in graph.definitions.items():
+        sites = len(graph.sites.get(name, ()))
+        if sites and graph.inlinable(name) and (
+                definition.size <= inline_size_limit
+                or definition.size * (sites - 1) <= inline_growth_limit * graph.frequency[name]):
+            inlined.add(name)
+    fresh = FreshNames(code)
+    result = []
+    for quad in code:
+        if quad.op == 'call' and quad.dest in inlined:
+            definition = graph.definitions[quad.dest]
+            count = len(definition.params)
+            params = result[len(result) - count:] if count else []
+            if quad.arg1 == count and len(params) == count and all(
+                    param.op == 'param' and param.arg2 == j for j, param in enumerate(params)):
+                del result[len(result) - count:]
+                result.extend(inline_call(definition, [param.arg1 for param in params], fresh))
+                continue
+        result.append(quad)
+    graph = CallGraph(result, symbol_table)
+    dropped = sorted(graph.region(name) for name in graph.unreachable() if not graph.definitions[name].nested)
+    if not dropped:
+        return result
+    kept = []
+    position = 0
+    for start, end in dropped:
+        kept.extend(result[position:start])
+        position = max(position, end + 1)
+    kept.extend(result[position:])
+    return kept
+
+
+@span('remove_unreachable_blocks', 'optimizer')
+def remove_unreachable_blocks(code):
+    blocks = split_blocks(code)
+    successors = block_successors(blocks)
+    # Program start and every function entry are reachable from outside the straight-line code
+    worklist = [0] + [index for index, block in enumerate(blocks) if block[0].op == 'func']
+    reachable = set()
+    while worklist:
+        index = worklist.pop()
+        if index in reachable or index >= len(blocks):
+            continue
+        reachable.add(index)
+        worklist.extend(successors[index])
+    return [quad for index, block in enumerate(blocks) if index in reachable for quad in block]
+
+
+default_passes = [
+    ('Inlining', inline_functions),
+    ('Constant Folding', fold_constants),
+    ('Constant Propagation', propagate_constants),
+    ('Loop Unrolling', unroll_loops),
+    ('Loop-Invariant Code Motion', hoist_invariants),
+    ('Copy Propagation', propagate_copies),
+    ('Dead Store Elimination', eliminate_dead_stores),
+    ('Unreachable Block Removal', remove_unreachable_blocks),
+]
+symbol_table_passes = {inline_functions}  # Passes given the symbol table along with the code
+
+
+class PassManager:
+    # With measure off the report leaves out the assembly columns, which cost a full code
+    # generation after every pass; compiling only needs the optimized code.
+    def __init__(self, passes=None, symbol_table=None, max_rounds=4, measure=True):
+        self.passes = passes if passes is not None else default_passes
+        self.symbol_table = symbol_table
+        self.max_rounds = max_rounds
+        self.measuring = measure
+        self.measurements = {}  # IR text -> (assembly instructions, code size), as most passes change nothing
+        self.report = []
+
+    def measure(self, code, text=None):
+        if not self.measuring:
+            return None, None
+        text = text if text is not None else tuple(str(quad) for quad in code)
+        if text not in self.measurements:
+            assembly = CodeGenerator(code, self.symbol_table).generate()
+            instructions = sum(1 for instruction in assembly if instruction.opcode != Opcode.LABEL)
+            self.measurements[text] = (instructions, len(render_assembly(assembly)))
+        return self.measurements[text]
+
+    @span('PassManager.run')
+    def run(self, code):
+        # Repeats the pipeline while it keeps shrinking the code: folding feeds propagation and back
+        text = tuple(str(quad) for quad in code)
+        instructions, size = self.measure(code, text)
+        self.report = [{'Round': 0, 'Pass': 'Input', 'IR Instructions': len(code),
+                        'Assembly Instructions': instructions, 'Code Size': size, 'Time (ms)': 0.0}]
+        for round_number in range(1, self.max_rounds + 1):
+            before = text
+            for name, optimization in self.passes:
+                start = time.perf_counter()
+                if optimization in symbol_table_passes:
+                    code = optimization(code, self.symbol_table)
+                else:
+                    code = optimization(code)
+                elapsed = (time.perf_counter() - start) * 1000
+                text = tuple(str(quad) for quad in code)
+                instructions, size = self.measure(code, text)
+                self.report.append({'Round': round_number, 'Pass': name, 'IR Instructions': len(code),
+                                    'Assembly Instructions': instructions, 'Code Size': size,
+                                    'Time (ms)': round(elapsed, 3)})
+            if text == before:
+                break
+        return code
+
+    def __str__(self):
+        headers = ["Round", "Pass", "IR Instructions", "Assembly Instructions", "Code Size", "Time (ms)"]
+        rows = [[row[header] for header in headers] for row in self.report]
+        return tabulate(rows, headers, tablefmt='grid')
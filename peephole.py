@@ -0,0 +1,170 @@
+from tabulate import tabulate
+from instructions import Instruction, Opcode, arithmetic_opcodes, register_numbers
+from instrumentation import span
+
+
+def writes(instruction):
+    # Register an instruction overwrites, if any
+    if instruction.opcode in (Opcode.LOAD, Opcode.MOV, Opcode.POP) or instruction.opcode in arithmetic_opcodes:
+        return instruction.operands[0]
+    return None
+
+
+def reads(instruction):
+    opcode, operands = instruction.opcode, instruction.operands
+    if opcode in (Opcode.LOAD, Opcode.MOV):
+        return {operands[1]} & register_numbers.keys()
+    if opcode in arithmetic_opcodes:
+        return {operands[0], operands[1]} & register_numbers.keys()
+    if opcode in (Opcode.STORE, Opcode.JZ, Opcode.PUSH):
+        return {operands[0]} & register_numbers.keys()
+    if opcode in (Opcode.CALL, Opcode.RET):
+        return set(register_numbers)  # Arguments and anything the caller still needs
+    return set()
+
+
+def jump_target(instruction):
+    if instruction.opcode == Opcode.JMP:
+        return instruction.operands[0]
+    if instruction.opcode == Opcode.JZ:
+        return instruction.operands[1]
+    return None
+
+
+# Each rule looks at a window of consecutive instructions and returns its replacement, or None
+# to leave it alone. The context holds whole-program facts the rules need about labels.
+
+def overwritten_register(window, context):
+    first, second = window
+    register = writes(first)
+    if register and first.opcode != Opcode.POP and second.opcode in (Opcode.LOAD, Opcode.MOV) \
+            and writes(second) == register and register not in reads(second):
+        return [second]
+    return None
+
+
+def store_then_load(window, context):
+    first, second = window
+    if first.opcode == Opcode.STORE and second.opcode == Opcode.LOAD and first.operands[1] == second.operands[1]:
+        if first.operands[0] == second.operands[0]:
+            return [first]
+        return [first, Instruction(Opcode.MOV, second.operands[0], first.operands[0])]
+    return None
+
+
+def load_then_store(window, context):
+    first, second = window
+    if first.opcode == Opcode.LOAD and second.opcode == Opcode.STORE and first.operands == second.operands:
+        return [first]
+    return None
+
+
+def self_move(window, context):
+    instruction = window[0]
+    if instruction.opcode == Opcode.MOV and instruction.operands[0] == instruction.operands[1]:
+        return []
+    return None
+
+
+def jump_to_next(window, context):
+    first, second = window
+    if second.opcode == Opcode.LABEL and jump_target(first) == second.operands[0]:
+        return [second]
+    return None
+
+
+def jump_to_jump(window, context):
+    instruction = window[0]
+    target = jump_target(instruction)
+    final = context['jump_chains'].get(target)
+    if target is None or final is None or final == target:
+        return None
+    operands = list(instruction.operands)
+    operands[-1] = final
+    return [Instruction(instruction.opcode, *operands)]
+
+
+def unreachable_after_jump(window, context):
+    first, second = window
+    if first.opcode in (Opcode.JMP, Opcode.RET) and second.opcode != Opcode.LABEL:
+        return [first]
+    return None
+
+
+def unused_label(window, context):
+    instruction = window[0]
+    if instruction.opcode == Opcode.LABEL and instruction.operands[0] not in context['referenced']:
+        return []
+    return None
+
+
+default_rules = [
+    ('Self Move', 1, self_move),
+    ('Overwritten Register', 2, overwritten_register),
+    ('Store Then Load', 2, store_then_load),
+    ('Load Then Store', 2, load_then_store),
+    ('Jump To Next', 2, jump_to_next),
+    ('Jump To Jump', 1, jump_to_jump),
+    ('Unreachable After Jump', 2, unreachable_after_jump),
+    ('Unused Label', 1, unused_label),
+]
+
+
+class PeepholeOptimizer:
+    def __init__(self, rules=None, max_passes=50):
+        self.rules = rules if rules is not None else default_rules
+        self.max_passes = max_passes
+        self.hits = {name: 0 for name, window, rule in self.rules}
+        self.passes = 0
+
+    def context(self, instructions):
+        referenced = set()
+        for instruction in instructions:
+            target = jump_target(instruction)
+            if target:
+                referenced.add(target)
+            elif instruction.opcode == Opcode.CALL:
+                referenced.add(f"{instruction.operands[0]}_start")
+        # Where a label leads when the first instruction after it is an unconditional jump
+        jump_chains = {}
+        for index, instruction in enumerate(instructions[:-1]):
+            following = instructions[index + 1]
+            if instruction.opcode == Opcode.LABEL and following.opcode == Opcode.JMP:
+                jump_chains[instruction.operands[0]] = following.operands[0]
+        for label in jump_chains:
+            seen = {label}
+            final = jump_chains[label]
+            while final in jump_chains and final not in seen:
+                seen.add(final)
+                final = jump_chains[final]
+            jump_chains[label] = final
+        return {'referenced': referenced, 'jump_chains': jump_chains}
+
+    @span('PeepholeOptimizer.optimize')
+    def optimize(self, instructions):
+        instructions = list(instructions)
+        for _ in range(self.max_passes):
+            self.passes += 1
+            changed = False
+            context = self.context(instructions)
+            index = 0
+            while index < len(instructions):
+                for name, size, rule in self.rules:
+                    window = instructions[index:index + size]
+                    if len(window) < size:
+                        continue
+                    replacement = rule(window, context)
+                    if replacement is not None and replacement != window:
+                        instructions[index:index + size] = replacement
+                        self.hits[name] += 1
+                        changed = True
+                        index = max(index - 1, 0) - 1  # The new neighbours may match earlier rules
+                        break
+                index += 1
+            if not changed:
+                break
+        return instructions
+
+    def __str__(self):
+        rows = [[name, hits] for name, hits in self.hits.items()]
+        return tabulate(rows, ["Rule", "Hits"], tablefmt='grid')
@@ -0,0 +1,147 @@
+import time
+from sylvalexical import lex
+from sylvasyntax import SyntaxAnalyzer
+from sylvasemantic import SemanticAnalyzer
+from intermediatecode import IntermediateCodeGenerator
+from optimizer import PassManager
+from codegeneration import CodeGenerator
+from peephole import PeepholeOptimizer
+from instructions import render_assembly
+from bytecode import encode
+from diagnostics import DiagnosticSink
+
+# Outputs kept in the on-disk cache; everything else is recomputed from them when asked for
+artifact_outputs = ['tokens', 'symbol_table', 'lex_results', 'syntax_results', 'semantic_results', 'assembly',
+                    'bytecode']
+
+
+def generate_instructions(program, symbol_table):
+    intermediate_code = IntermediateCodeGenerator(program).generate()
+    intermediate_code = PassManager(symbol_table=symbol_table, measure=False).run(intermediate_code)
+    return PeepholeOptimizer().optimize(CodeGenerator(intermediate_code, symbol_table).generate())
+
+
+class CompilationResult:
+    # Everything the compiler produces for one version of a source. Each phase runs the first
+    # time one of its outputs is asked for and never again, so every view of the same buffer
+    # shares one lex, one parse and one code generation.
+    producers = {
+        'tokens': 'lex',
+        'symbol_table': 'lex',
+        'lex_results': 'lex',
+        'program': 'parse',
+        'syntax_results': 'parse',
+        'semantic_results': 'analyze',
+        'instructions': 'generate',
+        'assembly': 'render',
+        'bytecode': 'assemble',
+    }
+
+    def __init__(self, source, version=0, outputs=None, cache=None):
+        self.source = source
+        self.version = version
+        self.outputs = dict(outputs or {})
+        self.timings = {}  # phase -> seconds it took here
+        self.nested = 0.0
+        self.cache = cache
+        self.cached = all(name in self.outputs for name in artifact_outputs)
+
+    def output(self, name):
+        if name not in self.outputs:
+            phase = self.producers[name]
+            outer, self.nested = self.nested, 0.0
+            start = time.perf_counter()
+            getattr(self, phase)()
+            elapsed = time.perf_counter() - start
+            self.timings[phase] = elapsed - self.nested  # Phases it had to run first are timed on their own
+            self.nested = outer + elapsed
+            if self.cache is not None and not self.cached and all(key in self.outputs for key in artifact_outputs):
+                self.cache.put(self.source, self.artifact())
+                self.cached = True
+        return self.outputs[name]
+
+    def lex(self):
+        diagnostics = DiagnosticSink()
+        self.outputs['tokens'], self.outputs['symbol_table'] = lex(self.source, diagnostics)
+        self.outputs['lex_results'] = diagnostics.diagnostics
+
+    def parse(self):
+        analyzer = SyntaxAnalyzer(self.tokens, self.symbol_table)
+        syntax_results = analyzer.parse()
+        self.outputs.setdefault('syntax_results', syntax_results)
+        self.outputs['program'] = analyzer.program
+
+    def analyze(self):
+        self.outputs['semantic_results'] = SemanticAnalyzer(self.program, self.symbol_table).analyze()
+
+    def generate(self):
+        self.outputs['instructions'] = generate_instructions(self.program, self.symbol_table)
+
+    def render(self):
+        self.outputs['assembly'] = render_assembly(self.instructions)
+
+    def assemble(self):
+        try:
+            self.outputs['bytecode'] = encode(self.instructions)
+        except ValueError:
+            self.outputs['bytecode'] = None  # Calls a function that was never defined; the analyzers report it
+
+    @property
+    def tokens(self):
+        return self.output('tokens')
+
+    @property
+    def symbol_table(self):
+        return self.output('symbol_table')
+
+    @property
+    def program(self):
+        return self.output('program')
+
+    @property
+    def lex_results(self):
+        return self.output('lex_results')
+
+    @property
+    def syntax_results(self):
+        return self.output('syntax_results')
+
+    @property
+    def semantic_results(self):
+        return self.output('semantic_results')
+
+    @property
+    def instructions(self):
+        return self.output('instructions')
+
+    @property
+    def assembly(self):
+        return self.output('assembly')
+
+    @property
+    def bytecode(self):
+        return self.output('bytecode')
+
+    @property
+    def diagnostics(self):
+        # Every phase's diagnostics in one sink, lexing first. Semantic checks only mean
+        # something once the program parses, so they are left out while there are syntax errors.
+        diagnostics = DiagnosticSink(self.lex_results)
+        diagnostics.extend(self.syntax_results or self.semantic_results)
+        return diagnostics
+
+    @property
+    def errors(self):
+        return [diagnostic.message for diagnostic in self.diagnostics.errors]
+
+    def artifact(self):
+        return {name: self.output(name) for name in artifact_outputs}
+
+
+def compile_source(code, cache=None):
+    # Runs every phase and returns the result. With a cache, unchanged sources skip straight
+    # to the stored artifact.
+    artifact = cache.get(code) if cache is not None else None
+    result = CompilationResult(code, outputs=artifact, cache=cache)
+    result.artifact()
+    return result
@@ -0,0 +1,144 @@
+from intermediatecode import is_temporary
+from dataflow import ControlFlowGraph, Liveness, name_bits
+from instrumentation import span
+
+argument_registers = ['R0', 'R1', 'R2', 'R3']  # Call arguments; R0 is also the scratch register
+
+
+def function_variables(code):
+    # Names touched inside func bodies. A call runs that code from anywhere, so they stay in memory
+    names = set()
+    inside = False
+    for quad in code:
+        if quad.op == 'func':
+            inside = True
+        if inside:
+            names.update(value for value in quad.uses() if isinstance(value, str))
+            if quad.defines() is not None:
+                names.add(quad.defines())
+        if quad.op == 'return':
+            inside = False
+    return names
+
+
+class LinearScanAllocator:
+    def __init__(self, registers):
+        self.registers = list(registers)
+        self.intervals = {}  # name -> [first position, last position] the value is live
+        self.weights = {}  # name -> uses and definitions weighted by loop depth
+        self.live_at_entry = set()
+        self.allocation = {}
+        self.spilled = set()
+
+    def liveness(self, code, candidates):
+        # Each variable is one bit of an int. Named variables are global, so they are all live
+        # when the program ends; nothing is live after a return, as function bodies are excluded.
+        bits = name_bits(None, candidates)
+        exit_live = 0
+        for name, bit in bits.items():
+            if not is_temporary(name):
+                exit_live |= bit
+        cfg = ControlFlowGraph.from_code(code)
+        exits = [index for index in cfg.exits if cfg.blocks[index][-1].op != 'return']
+        live = Liveness(cfg, bits, exit_live, exits)
+        return cfg.blocks, cfg.successors, bits, live.live_in, live.live_out
+
+    def loop_depths(self, blocks, successors, starts):
+        # A jump back to an earlier block closes a loop over every position in between
+        total = starts[-1] + len(blocks[-1]) if blocks else 0
+        delta = [0] * (total + 1)
+        for index, targets in enumerate(successors):
+            for target in targets:
+                if target <= index:
+                    delta[starts[target]] += 1
+                    delta[starts[index] + len(blocks[index])] -= 1
+        depths = []
+        depth = 0
+        for position in range(total):
+            depth += delta[position]
+            depths.append(depth)
+        return depths
+
+    @span('LinearScanAllocator.allocate')
+    def allocate(self, code):
+        excluded = function_variables(code)
+        candidates = []
+        seen = set()
+        for quad in code:
+            names = [value for value in quad.uses() if isinstance(value, str)]
+            if quad.defines() is not None:
+                names.append(quad.defines())
+            for name in names:
+                if name not in seen and name not in excluded:
+                    seen.add(name)
+                    candidates.append(name)
+
+        blocks, successors, bits, live_in, live_out = self.liveness(code, candidates)
+        starts = []
+        position = 0
+        for block in blocks:
+            starts.append(position)
+            position += len(block)
+        depths = self.loop_depths(blocks, successors, starts)
+
+        def extend(name, position):
+            interval = self.intervals.get(name)
+            if interval is None:
+                self.intervals[name] = [position, position]
+            elif position < interval[0]:
+                interval[0] = position
+            elif position > interval[1]:
+                interval[1] = position
+
+        def each_bit(live):
+            while live:
+                bit = live & -live
+                live ^= bit
+                yield bit, candidates[bit.bit_length() - 1]
+
+        # Named variables stay live across most blocks, so only the first and the last block a
+        # value is live in can move its interval: each is found once going forward, in the same
+        # order the intervals were always created in, and once going backward
+        unseen = (1 << len(candidates)) - 1
+        for index, block in enumerate(blocks):
+            first = (live_in[index] | live_out[index]) & unseen
+            unseen &= ~first
+            for bit, name in each_bit(first):
+                extend(name, starts[index] if live_in[index] & bit else starts[index] + len(block) - 1)
+            for offset, quad in enumerate(block):
+                position = starts[index] + offset
+                names = [value for value in quad.uses() if isinstance(value, str)]
+                if quad.defines() is not None:
+                    names.append(quad.defines())
+                for name in names:
+                    if name in bits:
+                        extend(name, position)
+                        self.weights[name] = self.weights.get(name, 0) + 10 ** min(depths[position], 6)
+        unseen = (1 << len(candidates)) - 1
+        for index in range(len(blocks) - 1, -1, -1):
+            last = (live_in[index] | live_out[index]) & unseen
+            unseen &= ~last
+            for bit, name in each_bit(last):
+                extend(name, starts[index] + len(blocks[index]) - 1 if live_out[index] & bit else starts[index])
+        if blocks:
+            self.live_at_entry = {name for name, bit in bits.items() if live_in[0] & bit}
+
+        free = list(self.registers)
+        active = []  # (end, name), kept sorted by end
+        for name, (start, end) in sorted(self.intervals.items(), key=lambda item: item[1][0]):
+            while active and active[0][0] < start:
+                free.append(self.allocation[active.pop(0)[1]])
+            if free:
+                self.allocation[name] = free.pop(0)
+            else:
+                # Spill whichever of the competing values is used least, counting loop nesting
+                victim = min(active + [(end, name)], key=lambda item: self.weights.get(item[1], 0))
+                if victim[1] == name:
+                    self.spilled.add(name)
+                    continue
+                active.remove(victim)
+                self.allocation[name] = self.allocation.pop(victim[1])
+                self.spilled.add(victim[1])
+            active.append((end, name))
+            active.sort()
+        return self.allocation
@@ -0,0 +1,224 @@
+from sylvalexical import Token, SymbolTable, ScopeTracker, lex_line, indentation, invalid_token
+from sylvasyntax import SyntaxAnalyzer, error_results
+from sylvaast import Program, shift_lines
+from pipeline import CompilationResult
+
+
+class Statement:
+    # One top-level statement as the parser found it. start and end are token positions, end
+    # being where the next statement starts. The parser may have read past end, up to
+    # SyntaxAnalyzer.last_read(), so its result depends on every source line from first_line to
+    # the line of that token, last_line (None when the parser read past the end of the file).
+    # errors are the Diagnostics the parser recorded in it, message the first one's.
+    __slots__ = ('start', 'end', 'first_line', 'last_line', 'node', 'result', 'message', 'errors')
+
+    def __init__(self, start, end, first_line, last_line, node, result, message, errors=()):
+        self.start = start
+        self.end = end
+        self.first_line = first_line
+        self.last_line = last_line
+        self.node = node
+        self.result = result
+        self.message = message
+        self.errors = errors
+
+
+class CompilationSession:
+    # Keeps the tokens of every line and the statements of the last parse, so an edit only
+    # re-lexes the lines it touched and re-parses the statements that read them.
+    # Everything downstream of parsing is rebuilt on demand, once per version, by result().
+    def __init__(self, code="", cache=None):
+        self.cache = cache
+        self.source = ""
+        self.lines = []
+        self.shapes = []  # per source line: (tokens as lex_line returns them, invalid text) or None if blank
+        self.line_tokens = []  # per source line: its Token objects
+        self.tokens = []
+        self.statements = []
+        self.line_cache = {}  # stripped line text -> lex_line result
+        self.version = 0
+        self.relexed_lines = 0
+        self.reparsed_statements = 0
+        self._result = None
+        self.update(code)
+
+    def lex(self, line):
+        line = line.strip()
+        if not line:
+            return None
+        shape = self.line_cache.get(line)
+        if shape is None:
+            shape = lex_line(line)
+            self.line_cache[line] = shape
+            self.relexed_lines += 1
+        return shape
+
+    def update(self, code):
+        # Diffs the new buffer against the old one and re-lexes only the lines in between
+        if code == self.source:
+            return False
+        lines = code.split('\n')
+        old = self.lines
+        prefix = 0
+        limit = min(len(lines), len(old))
+        while prefix < limit and lines[prefix] == old[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and lines[-1 - suffix] == old[-1 - suffix]:
+            suffix += 1
+        self.edit(prefix, len(old) - suffix, lines[prefix:len(lines) - suffix])
+        self.source = code
+        return True
+
+    def edit(self, start, stop, new_lines):
+        # Replaces source lines [start, stop) with new_lines
+        old_shapes = self.shapes[start:stop]
+        old_indents = [indentation(line) for line, shape in zip(self.lines[start:stop], old_shapes) if shape]
+        shapes = [self.lex(line) for line in new_lines]
+        self.lines[start:stop] = new_lines
+        self.source = '\n'.join(self.lines)
+        if shapes == old_shapes and old_indents == [indentation(line) for line, shape in zip(new_lines, shapes) if shape]:
+            return  # Only trailing whitespace or nothing at all changed; every result still holds
+        self.version += 1
+        if len(self.line_cache) > 4 * len(self.lines) + 1024:
+            self.line_cache = {}
+
+        old_token_starts = self.token_starts()
+        old_tokens = self.tokens
+        line_shift = len(shapes) - (stop - start)
+        self.shapes[start:stop] = shapes
+        self.line_tokens[start:stop] = [[] for _ in shapes]
+        self.renumber(start, start + len(shapes), line_shift)
+        token_delta = len(self.tokens) - len(old_tokens)
+        self.reparse(start, stop, line_shift, old_token_starts[stop], token_delta)
+
+    def token_starts(self):
+        starts = [0]
+        for tokens in self.line_tokens:
+            starts.append(starts[-1] + len(tokens))
+        return starts
+
+    def renumber(self, start, stop, line_shift):
+        # Rebuilds the Token objects of the edited lines, and of every later line if lines were
+        # added or removed, then the flat token list
+        for index in range(start, len(self.shapes) if line_shift else stop):
+            shape = self.shapes[index]
+            if shape:
+                column = indentation(self.lines[index]) + 1
+                self.line_tokens[index] = [Token(index + 1, token_type, value, column + offset)
+                                           for token_type, value, declared, offset in shape[0]]
+        self.tokens = [token for tokens in self.line_tokens for token in tokens]
+
+    def source_line(self, position):
+        # The index of the source line holding the token at position, or None past the last token
+        if position >= len(self.tokens):
+            return None
+        return self.tokens[position].line - 1
+
+    def reparse(self, start, stop, line_shift, old_suffix_start, token_delta):
+        # Statements whose lines all sit above the edit are kept, parsing restarts after them,
+        # and once a statement ends where an old one below the edit began, the rest is reused
+        kept = []
+        for statement in self.statements:
+            if statement.last_line is None or statement.last_line >= start:
+                break
+            kept.append(statement)
+        resume = {}
+        for index, statement in enumerate(self.statements):
+            if statement.first_line >= stop and statement.start >= old_suffix_start:
+                resume[statement.start + token_delta] = index
+
+        analyzer = SyntaxAnalyzer(self.tokens)
+        analyzer.pos = kept[-1].end if kept else 0
+        statements = kept
+        while analyzer.current_token():
+            if analyzer.pos in resume:
+                statements.extend(self.shift(self.statements[resume[analyzer.pos]:], token_delta, line_shift,
+                                             analyzer))
+                break
+            statements.append(self.parse_statement(analyzer))
+        self.statements = statements
+
+    def parse_statement(self, analyzer):
+        statement_start = analyzer.pos
+        body = analyzer.program.body
+        count = len(body)
+        errors = len(analyzer.errors)
+        result, message = analyzer.parse_statement()
+        node = body[count] if len(body) > count else None
+        self.reparsed_statements += 1
+        return Statement(statement_start, analyzer.pos, self.source_line(statement_start),
+                         self.source_line(analyzer.last_read()), node, result, message, analyzer.errors[errors:])
+
+    def shift(self, statements, token_delta, line_shift, analyzer):
+        # Old statements below the edit with their positions moved. Failed ones are parsed
+        # again when line numbers moved, since their messages quote them, or when positions
+        # moved, since their errors hold them.
+        for statement in statements:
+            if (line_shift or token_delta) and not statement.result:
+                analyzer.pos = statement.start + token_delta
+                yield self.parse_statement(analyzer)
+                continue
+            if line_shift and statement.node is not None:
+                statement.node = shift_lines(statement.node, line_shift)
+            statement.start += token_delta
+            statement.end += token_delta
+            statement.first_line += line_shift
+            if statement.last_line is not None:
+                statement.last_line += line_shift
+            yield statement
+
+    @property
+    def program(self):
+        return Program([statement.node for statement in self.statements if statement.node is not None])
+
+    @property
+    def syntax_results(self):
+        return error_results([error for statement in self.statements for error in statement.errors])
+
+    def result(self):
+        # The CompilationResult of the current buffer, made once per version. Lexing and parsing
+        # are already done here, so it only runs the phases after them.
+        if self._result is None or self._result.version != self.version:
+            outputs = self.cache.get(self.source) if self.cache is not None else None
+            self._result = SessionResult(self, outputs)
+        return self._result
+
+
+def replay_symbol_table(shapes):
+    # Builds the symbol table lexing would have, from line results alone
+    symbol_table = SymbolTable()
+    tracker = ScopeTracker(symbol_table)
+    for number, shape in enumerate(shapes, 1):
+        if shape:
+            for token_type, value, declared, offset in shape[0]:
+                tracker.record(number, token_type, value, declared)
+    return symbol_table
+
+
+def replay_lex_results(lines, shapes):
+    # The diagnostics lexing would have reported, from line results alone
+    diagnostics = []
+    for number, (line, shape) in enumerate(zip(lines, shapes), 1):
+        if shape:
+            tokens, invalid = shape
+            if invalid is not None:
+                column = indentation(line) + len(line.strip()) - len(invalid) + 1
+                diagnostics.append(invalid_token(number, column, invalid))
+    return diagnostics
+
+
+class SessionResult(CompilationResult):
+    # A result whose tokens and parse come from the session. It keeps its own copy of the line
+    # results, so it still describes its version after the session moves on.
+    def __init__(self, session, outputs=None):
+        super().__init__(session.source, session.version, outputs, session.cache)
+        self.shapes = list(session.shapes)
+        self.lines = list(session.lines)
+        self.outputs['tokens'] = session.tokens
+        self.outputs['program'] = session.program
+        self.outputs['syntax_results'] = session.syntax_results
+
+    def lex(self):
+        self.outputs['symbol_table'] = replay_symbol_table(self.shapes)
+        self.outputs['lex_results'] = replay_lex_results(self.lines, self.shapes)
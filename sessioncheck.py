@@ -0,0 +1,84 @@
+import argparse
+import random
+import sys
+from benchmarks.generator import shapes, generate_program
+from pipeline import CompilationResult
+from session import CompilationSession
+
+# Text random edits put in: whole statements, the pieces a statement is typed in, and
+# the tokens whose lookahead decides how the parser reads what comes before them
+fragments = [';', '(', ')', ');', 'then(', ': then(', 'else: then(', 'if not(n1 < 2): then(', 'if(n1 < 2): then(',
+             'num', 'num x = 1;', 'x = 3;', 'num z', 'z = ', '"s"', '1.5', 'True', 'f9(1);', 'func g(num a):',
+             'for(num i = 0, i < 3, i++):', 'while(n1 > 0):', '', '    ']
+
+
+def random_edit(rng, source):
+    # Replaces up to three lines with up to three others, splits a line between two of its
+    # words, or types a fragment into the middle of a line
+    lines = source.split('\n')
+    start = rng.randint(0, len(lines))
+    choice = rng.random()
+    if choice < 0.2 and start < len(lines) and ' ' in lines[start]:
+        words = lines[start].split(' ')
+        cut = rng.randint(1, len(words) - 1)
+        replacement = [' '.join(words[:cut]), ' '.join(words[cut:])]
+        stop = start + 1
+    elif choice < 0.4 and start < len(lines):
+        line = lines[start]
+        cut = rng.randint(0, len(line))
+        replacement = [line[:cut] + rng.choice(fragments) + line[cut:]]
+        stop = start + 1
+    else:
+        stop = min(len(lines), start + rng.randint(0, 3))
+        replacement = []
+        for _ in range(rng.randint(0, 3)):
+            if lines and rng.random() < 0.4:
+                replacement.append(rng.choice(lines))
+            else:
+                replacement.append(' '.join(rng.choice(fragments) for _ in range(rng.randint(1, 2))))
+    return '\n'.join(lines[:start] + replacement + lines[stop:])
+
+
+def check_session(seed, statements=12, edits=20, shape='mixed'):
+    # Edits a generated program at random and, after every edit, compares what the session
+    # reports with a full compile of the same text. Returns the first difference as
+    # (edit, source, expected, got), or None.
+    rng = random.Random(seed)
+    source = generate_program(statements, seed, shape)
+    session = CompilationSession(source)
+    for edit in range(edits):
+        source = random_edit(rng, source)
+        session.update(source)
+        expected, got = CompilationResult(source), session.result()
+        expected_diagnostics, got_diagnostics = expected.diagnostics.diagnostics, got.diagnostics.diagnostics
+        if expected_diagnostics != got_diagnostics:
+            return edit, source, expected_diagnostics, got_diagnostics
+        if not expected.diagnostics.errors and expected.assembly != got.assembly:
+            return edit, source, expected.assembly, got.assembly
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the incremental session against full compiles "
+                                                 "over randomly edited programs.")
+    parser.add_argument('--seeds', type=int, default=200, help="programs to edit")
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--statements', type=int, default=12, help="statements per generated program")
+    parser.add_argument('--edits', type=int, default=20, help="edits per program")
+    parser.add_argument('--shape', choices=list(shapes), default='mixed')
+    args = parser.parse_args(argv)
+
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        difference = check_session(seed, args.statements, args.edits, args.shape)
+        if difference is not None:
+            edit, source, expected, got = difference
+            print(f"Seed {seed}, edit {edit}: the session differs from a full compile of\n{source}")
+            print(f"Expected: {expected}")
+            print(f"Got: {got}")
+            return 1
+    print(f"{args.seeds} programs, {args.seeds * args.edits} edits: the session matched every full compile")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import copy
+from sylvalexical import Token
+
+# Syntax tree built by SyntaxAnalyzer. Names, literals and operators stay as the lexer's Token
+# tuples, so every node keeps the source line of each piece without copying it.
+
+
+class Node:
+    __slots__ = ('line',)
+
+
+class Program(Node):
+    __slots__ = ('body',)
+
+    def __init__(self, body=None, line=1):
+        self.body = body if body is not None else []
+        self.line = line
+
+
+class Declaration(Node):
+    __slots__ = ('datatype', 'name', 'value')
+
+    def __init__(self, datatype, name, value, line):
+        self.datatype = datatype
+        self.name = name
+        self.value = value
+        self.line = line
+
+
+class Parameter(Node):
+    __slots__ = ('datatype', 'name')
+
+    def __init__(self, datatype, name, line):
+        self.datatype = datatype
+        self.name = name
+        self.line = line
+
+
+class Assignment(Node):
+    __slots__ = ('target', 'value')
+
+    def __init__(self, target, value, line):
+        self.target = target
+        self.value = value
+        self.line = line
+
+
+class BinaryOp(Node):
+    __slots__ = ('operator', 'left', 'right')
+
+    def __init__(self, operator, left, right, line):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.line = line
+
+
+class Condition(Node):
+    __slots__ = ('left', 'operator', 'right')
+
+    def __init__(self, left, operator, right, line):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.line = line
+
+
+class Branch(Node):
+    __slots__ = ('kind', 'condition', 'body')  # kind is 'if', 'if not' or 'else' (no condition)
+
+    def __init__(self, kind, condition, body, line):
+        self.kind = kind
+        self.condition = condition
+        self.body = body
+        self.line = line
+
+
+class IfStatement(Node):
+    __slots__ = ('branches',)
+
+    def __init__(self, branches, line):
+        self.branches = branches
+        self.line = line
+
+
+class ForLoop(Node):
+    __slots__ = ('init', 'condition', 'variable', 'step', 'body')
+
+    def __init__(self, init, condition, variable, step, body, line):
+        self.init = init
+        self.condition = condition
+        self.variable = variable  # None when the iteration block is empty
+        self.step = step
+        self.body = body
+        self.line = line
+
+
+class WhileLoop(Node):
+    __slots__ = ('condition', 'body')
+
+    def __init__(self, condition, body, line):
+        self.condition = condition
+        self.body = body
+        self.line = line
+
+
+class Function(Node):
+    __slots__ = ('name', 'params', 'body')
+
+    def __init__(self, name, params, body, line):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.line = line
+
+
+class Call(Node):
+    __slots__ = ('name', 'args')
+
+    def __init__(self, name, args, line):
+        self.name = name
+        self.args = args
+        self.line = line
+
+
+def iter_fields(node):
+    for cls in type(node).__mro__:
+        for field in cls.__dict__.get('__slots__', ()):
+            if field != 'line':
+                yield field, getattr(node, field)
+
+
+def iter_children(node):
+    for field, value in iter_fields(node):
+        if isinstance(value, (Node, Token)):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, (Node, Token)):
+                    yield item
+
+
+def first_operand(expression):
+    # Leftmost leaf of an expression tree: the token the old token-scanning phases looked at
+    while isinstance(expression, BinaryOp):
+        expression = expression.left
+    return expression
+
+
+def leaf_tokens(node):
+    # Every token under a node, field by field
+    for child in iter_children(node):
+        if isinstance(child, Token):
+            yield child
+        else:
+            yield from leaf_tokens(child)
+
+
+def shift_lines(node, delta):
+    # A copy of the subtree moved delta lines down the source, for a statement that is
+    # unchanged but sits below lines that were added or removed
+    def shifted(value):
+        if isinstance(value, Token):
+            return value._replace(line=value.line + delta)
+        if isinstance(value, Node):
+            return shift_lines(value, delta)
+        if isinstance(value, list):
+            return [shifted(item) for item in value]
+        return value
+
+    moved = copy.copy(node)
+    for field, value in iter_fields(node):
+        setattr(moved, field, shifted(value))
+    moved.line = node.line + delta
+    return moved
+
+
+class NodeVisitor:
+    def visit(self, node):
+        method = getattr(self, 'visit_' + type(node).__name__, None)
+        if method is None:
+            return self.generic_visit(node)
+        return method(node)
+
+    def generic_visit(self, node):
+        if isinstance(node, Node):
+            for child in iter_children(node):
+                self.visit(child)
+
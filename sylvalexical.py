@@ -1,5 +1,15 @@
 import re
+import sys
+from collections import namedtuple
 from tabulate import tabulate
+from instrumentation import span, count
+from diagnostics import Diagnostic
+
+# One token shape for every phase: a slotted tuple giving the parser token.line / token.type /
+# token.value. line is the source line the token is on, counting from 1 and blank lines
+# included; column is where the token starts in it, counting from 1, or None for a token made
+# without one.
+Token = namedtuple('Token', ['line', 'type', 'value', 'column'], defaults=(None,))
 
 token_types = [
     ('KEYWORD', r'\bif\s+not\b'),
@@ -29,6 +39,9 @@ token_types = [
 class SymbolTable:
     def __init__(self):
         self.table = []
+        self.index = {}  # name -> every entry declared with that name, in declaration order
+        self.scopes = {'global': {}}  # scope name -> {name: entry} for the names declared in it
+        self.scope_chain = ['global']  # innermost scope last
 
     def add_entry(self, name, type, line, usage=None, entry_type='variable'):
         entry = {
@@ -39,9 +52,22 @@ class SymbolTable:
             'Line of Declaration': line,
             'Line of Usage': usage,
             'Address': len(self.table) + 1,
-            'Entry Type': entry_type
+            'Entry Type': entry_type,
+            'Scope': self.scope_chain[-1],
+            'Lines of Usage': [] if usage is None else [usage]
         }
         self.table.append(entry)
+        self.index.setdefault(name, []).append(entry)
+        self.scopes[self.scope_chain[-1]].setdefault(name, entry)
+
+    def push_scope(self, name):
+        self.scopes.setdefault(name, {})
+        self.scope_chain.append(name)
+
+    def pop_scope(self):
+        if len(self.scope_chain) > 1:
+            return self.scope_chain.pop()
+        return None
 
     def determine_size(self, type):
         if type == 'num':
@@ -55,13 +81,23 @@ class SymbolTable:
         return 0
 
     def update_usage(self, name, line):
-        for entry in self.table:
-            if entry['Name'] == name:
-                entry['Line of Usage'] = line
+        for entry in self.index.get(name, ()):
+            entry['Line of Usage'] = line
+            entry['Lines of Usage'].append(line)
 
     def lookup(self, name):
-        for entry in self.table:
-            if entry['Name'] == name:
+        count('symbol lookups')
+        entries = self.index.get(name)
+        if entries:
+            return entries[0]
+        return None
+
+    def resolve(self, name):
+        # Scope-aware lookup: the innermost declaration visible from the current scope chain
+        count('symbol lookups')
+        for scope in reversed(self.scope_chain):
+            entry = self.scopes[scope].get(name)
+            if entry:
                 return entry
         return None
 
@@ -76,48 +112,132 @@ class SymbolTable:
 
 
 
-def lex(code):
-    tokens = []
-    line_number = 1
+def build_master_pattern(token_types, first=0):
+    # One alternation of named groups, tried left to right just like the old per-pattern loop.
+    # Tokens are matched at an offset instead of on a re-sliced line, so a leading word boundary
+    # would look at the previous token; the sliced line always started a token at position 0.
+    parts = []
+    for index in range(first, len(token_types)):
+        pattern = token_types[index][1]
+        if pattern.startswith(r'\b'):
+            pattern = pattern[2:]
+        parts.append(f'(?P<T{index}>{pattern})')
+    return re.compile('|'.join(parts))
+
+
+# After a data type or 'func' the next token only tries the patterns listed after the one that
+# matched, so there is one alternation per starting index.
+master_patterns = [build_master_pattern(token_types, first) for first in range(len(token_types))]
+group_types = {f'T{index}': (index, token_type) for index, (token_type, pattern) in enumerate(token_types)}
+identifier_pattern = re.compile(r'[a-zA-Z_]\w*')
+whitespace_pattern = re.compile(r'\s*')
+
+
+@span('lex')
+def lex(code, diagnostics=None):
     symbol_table = SymbolTable()
-    for line in code.split('\n'):
+    tokens = list(lex_stream(code.split('\n'), symbol_table, diagnostics))
+    return tokens, symbol_table
+
+
+def lex_line(line):
+    # Tokens of one stripped, non-empty line as (type, value, declared, offset) tuples, where
+    # declared is the data type or 'function' for a name being declared and offset is where the
+    # token starts in the line. Nothing here depends on other lines, so the result can be reused
+    # for as long as the line's text is unchanged.
+    # Also returns the text from the first character that could not be lexed, or None.
+    tokens = []
+    pos = 0
+    end = len(line)
+    first = 0
+    identifier_match = identifier_pattern.match
+    skip_whitespace = whitespace_pattern.match
+    intern = sys.intern  # identifiers repeat constantly, so every token shares one string per name
+    attempts = 0
+    while pos < end:
+        attempts += 1
+        match = master_patterns[first].match(line, pos)
+        if not match:
+            count('regex attempts', attempts)
+            return tokens, line[pos:]
+        index, token_type = group_types[match.lastgroup]
+        value = match.group()
+        pos = match.end()
+        first = 0
+        if token_type == 'DATA_TYPE' or (token_type == 'KEYWORD' and value == 'func'):
+            tokens.append((token_type, value, None, match.start()))
+            pos = skip_whitespace(line, pos).end()
+            attempts += 1
+            id_match = identifier_match(line, pos)
+            if id_match:
+                declared = value if token_type == 'DATA_TYPE' else 'function'
+                tokens.append(('IDENTIFIER', intern(id_match.group()), declared, pos))
+                pos = skip_whitespace(line, id_match.end()).end()
+            first = index + 1
+        elif token_type != 'WHITESPACE' and token_type != 'NEWLINE':
+            if token_type == 'IDENTIFIER':
+                value = intern(value)
+            tokens.append((token_type, value, None, match.start()))
+    count('regex attempts', attempts)
+    return tokens, None
+
+
+class ScopeTracker:
+    # Applies the symbol table side of lexing to one line's tokens at a time
+    def __init__(self, symbol_table):
+        self.symbol_table = symbol_table
+        self.open_functions = []  # [paren depth, closed paren groups] per func whose scope is still pushed
+
+    def record(self, line_number, token_type, value, declared):
+        symbol_table = self.symbol_table
+        if declared == 'function':
+            symbol_table.add_entry(value, 'function', line_number, entry_type='function')
+            symbol_table.push_scope(value)
+            self.open_functions.append([0, 0])
+        elif declared is not None:
+            symbol_table.add_entry(value, declared, line_number)
+        elif token_type == 'IDENTIFIER':
+            symbol_table.update_usage(value, line_number)
+        elif self.open_functions and (token_type == 'LEFT_PAREN' or token_type == 'RIGHT_PAREN'):
+            # The scope closes with the parenthesis ending the then(...) body, the
+            # second group after the parameter list
+            function = self.open_functions[-1]
+            if token_type == 'LEFT_PAREN':
+                function[0] += 1
+            else:
+                function[0] -= 1
+                if function[0] == 0:
+                    function[1] += 1
+                    if function[1] == 2:
+                        self.open_functions.pop()
+                        symbol_table.pop_scope()
+
+
+def indentation(line):
+    return len(line) - len(line.lstrip())
+
+
+def invalid_token(line_number, column, invalid):
+    # The diagnostic for the text lex_line could not lex, starting at column
+    return Diagnostic('error', 'L001', 'lex', f"Invalid token on line {line_number}: {invalid}",
+                      line_number, column, line_number, column + len(invalid))
+
+
+def lex_stream(lines, symbol_table=None, diagnostics=None):
+    # Yields tokens one source line at a time, so a file object is never read into memory whole.
+    # Declarations and usages are recorded in symbol_table before their token is yielded, and
+    # text that cannot be lexed is reported to diagnostics, a DiagnosticSink, if one is given.
+    if symbol_table is None:
+        symbol_table = SymbolTable()
+    tracker = ScopeTracker(symbol_table)
+    for line_number, line in enumerate(lines, 1):
+        start = indentation(line) + 1
         line = line.strip()
         if line:
-            while line:
-                match = None
-                for token_type, pattern in token_types:
-                    regex = re.compile(pattern)
-                    match = regex.match(line)
-                    if match:
-                        value = match.group(0)
-                        if token_type == 'KEYWORD' and value == 'func':
-                            tokens.append((line_number, token_type, value))
-                            line = line[match.end():].strip()
-                            id_match = re.match(r'[a-zA-Z_]\w*', line)
-                            if id_match:
-                                function_name = id_match.group(0)
-                                tokens.append((line_number, 'IDENTIFIER', function_name))
-                                symbol_table.add_entry(function_name, 'function', line_number, entry_type='function')
-                                line = line[id_match.end():].strip()
-                            continue
-                        elif token_type == 'DATA_TYPE':
-                            tokens.append((line_number, token_type, value))
-                            line = line[match.end():].strip()
-                            id_match = re.match(r'[a-zA-Z_]\w*', line)
-                            if id_match:
-                                identifier = id_match.group(0)
-                                tokens.append((line_number, 'IDENTIFIER', identifier))
-                                symbol_table.add_entry(identifier, value, line_number)
-                                line = line[id_match.end():].strip()
-                            continue
-                        elif token_type == 'IDENTIFIER':
-                            symbol_table.update_usage(value, line_number)
-                        if token_type != 'WHITESPACE' and token_type != 'NEWLINE':
-                            tokens.append((line_number, token_type, value))
-                        line = line[match.end():]
-                        break
-                if not match:
-                    print(f"Invalid token on line {line_number}: {line}")
-                    break
-            line_number += 1
-    return tokens, symbol_table
+            tokens, invalid = lex_line(line)
+            count('tokens', len(tokens))
+            for token_type, value, declared, offset in tokens:
+                tracker.record(line_number, token_type, value, declared)
+                yield Token(line_number, token_type, value, start + offset)
+            if invalid is not None and diagnostics is not None:
+                diagnostics.report(invalid_token(line_number, start + len(line) - len(invalid), invalid))
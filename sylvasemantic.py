@@ -1,58 +1,88 @@
-class SemanticAnalyzer:
-    def __init__(self, tokens, symbol_table):
-        self.tokens = tokens
+from sylvaast import NodeVisitor, IfStatement, WhileLoop, ForLoop, Function, first_operand, leaf_tokens
+from intermediatecode import operand, evaluate
+from dataflow import ControlFlowGraph, FlowGraphBuilder, ReachingDefinitions, DefiniteAssignment, name_bits
+from instrumentation import span
+from diagnostics import Diagnostic
+
+
+class SemanticAnalyzer(NodeVisitor):
+    def __init__(self, program, symbol_table):
+        self.program = program
         self.symbol_table = symbol_table
+        self.results = []
 
+    @span('SemanticAnalyzer.analyze')
     def analyze(self):
-        results = []
-        i = 0
-        while i < len(self.tokens):
-            token = self.tokens[i]
-            if token.type == 'DATA_TYPE':
-                declaration_result = self.check_declaration(i)
-                if declaration_result:
-                    results.append(declaration_result)
-                i += 4  # Skip to next token after declaration and assignment
-            elif token.type == 'IDENTIFIER':
-                if self.is_function_call(i):
-                    function_call_result = self.check_function_call(token)
-                    if function_call_result:
-                        results.append(function_call_result)
-                else:
-                    usage_result = self.check_variable_usage(token)
-                    if usage_result:
-                        results.append(usage_result)
-            i += 1
-        return results
+        self.results = []
+        self.visit(self.program)
+        self.results.extend(self.check_flow())
+        return self.results
+
+    def report(self, result):
+        if result:
+            self.results.append(result)
+
+    def visit_Token(self, token):
+        if token.type == 'IDENTIFIER':
+            self.report(self.check_variable_usage(token))
 
-    def check_declaration(self, index):
-        datatype = self.tokens[index].value
-        variable_name = self.tokens[index + 1].value
-        assignment_operator = self.tokens[index + 2].type
-        value_token = self.tokens[index + 3]
+    def error(self, code, message, token):
+        return Diagnostic.spanning('error', code, 'analyze', message, token)
 
+    def warning(self, code, message, first, last=None):
+        return Diagnostic.spanning('warning', code, 'analyze', message, first, last)
+
+    def visit_Declaration(self, node):
+        self.report(self.check_declaration(node))
+        self.visit(node.value)
+
+    def visit_Parameter(self, node):
+        self.report(self.check_redeclaration(node.datatype.value, node.name))
+
+    def visit_Function(self, node):
+        for param in node.params:
+            self.visit(param)
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_Call(self, node):
+        self.report(self.check_function_call(node.name))
+        for arg in node.args:
+            self.visit(arg)
+
+    def check_redeclaration(self, datatype, name):
+        variable_name = name.value
         existing_entry = self.symbol_table.lookup(variable_name)
         if existing_entry:
             if existing_entry['Type'] != datatype and existing_entry['Entry Type'] == 'variable':
-                return f"Semantic Error: Variable '{variable_name}' already declared with type '{existing_entry['Type']}' at line {existing_entry['Line of Declaration']}"
+                return self.error('S001', f"Semantic Error: Variable '{variable_name}' already declared with type '{existing_entry['Type']}' at line {existing_entry['Line of Declaration']}", name)
+        return None
+
+    def check_declaration(self, node):
+        datatype = node.datatype.value
+        variable_name = node.name.value
+        value_token = first_operand(node.value)
+
+        redeclaration = self.check_redeclaration(datatype, node.name)
+        if redeclaration:
+            return redeclaration
 
         # Type checking
-        if assignment_operator == 'ASSIGNMENT':
-            if datatype == 'num' and value_token.type != 'NUMERIC_LITERAL':
-                return f"Semantic Error: Variable '{variable_name}' of type 'num' assigned non-numeric value at line {value_token.line}"
-            elif datatype == 'line' and value_token.type != 'STRING_LITERAL':
-                return f"Semantic Error: Variable '{variable_name}' of type 'line' assigned non-string value at line {value_token.line}"
-            elif datatype == 'binal' and value_token.type != 'BOOL_LITERAL':
-                return f"Semantic Error: Variable '{variable_name}' of type 'binal' assigned non-boolean value at line {value_token.line}"
-            elif datatype == 'point' and value_token.type != 'FLOAT_LITERAL':
-                return f"Semantic Error: Variable '{variable_name}' of type 'point' assigned non-float value at line {value_token.line}"
+        if datatype == 'num' and value_token.type != 'NUMERIC_LITERAL':
+            return self.error('S002', f"Semantic Error: Variable '{variable_name}' of type 'num' assigned non-numeric value at line {value_token.line}", value_token)
+        elif datatype == 'line' and value_token.type != 'STRING_LITERAL':
+            return self.error('S002', f"Semantic Error: Variable '{variable_name}' of type 'line' assigned non-string value at line {value_token.line}", value_token)
+        elif datatype == 'binal' and value_token.type != 'BOOL_LITERAL':
+            return self.error('S002', f"Semantic Error: Variable '{variable_name}' of type 'binal' assigned non-boolean value at line {value_token.line}", value_token)
+        elif datatype == 'point' and value_token.type != 'FLOAT_LITERAL':
+            return self.error('S002', f"Semantic Error: Variable '{variable_name}' of type 'point' assigned non-float value at line {value_token.line}", value_token)
         return None
 
     def check_variable_usage(self, token):
         variable_name = token.value
         entry = self.symbol_table.lookup(variable_name)
         if not entry:
-            return f"Semantic Error: Variable '{variable_name}' not declared before use at line {token.line}"
+            return self.error('S003', f"Semantic Error: Variable '{variable_name}' not declared before use at line {token.line}", token)
         elif entry['Entry Type'] != 'variable':
             return None
         return None
@@ -61,10 +91,102 @@ class SemanticAnalyzer:
         function_name = token.value
         entry = self.symbol_table.lookup(function_name)
         if not entry:
-            return f"Semantic Error: Function '{function_name}' not declared before use at line {token.line}"
+            return self.error('S004', f"Semantic Error: Function '{function_name}' not declared before use at line {token.line}", token)
         elif entry['Entry Type'] != 'function':
-            return f"Semantic Error: '{function_name}' is not a function but used as one at line {token.line}"
+            return self.error('S005', f"Semantic Error: '{function_name}' is not a function but used as one at line {token.line}", token)
         return None
 
-    def is_function_call(self, index):
-        return index + 1 < len(self.tokens) and self.tokens[index + 1].type == 'LEFT_PAREN'
+    @span('SemanticAnalyzer.check_flow')
+    def check_flow(self):
+        # Checks that follow the paths control can take: a function may be called from
+        # anywhere, so its body assumes every variable is assigned and every definition reaches
+        builder = FlowGraphBuilder(self.program)
+        cfg = builder.build()
+        functions = list(builder.functions.values())
+        tested = {branch[1].left.value for branch in builder.branches}
+        removed = self.decided_edges(builder, ReachingDefinitions(cfg, functions, tested))
+        reached = self.reached_blocks(builder, cfg, removed)
+        if removed or len(reached) < len(cfg.blocks):
+            # Code that never runs assigns nothing
+            successors = [[target for target in targets if (index, target) not in removed] if index in reached else []
+                          for index, targets in enumerate(cfg.successors)]
+            cfg = ControlFlowGraph(cfg.blocks, successors, cfg.entries)
+        variables = {}
+        for name, bit in name_bits(cfg).items():
+            entry = self.symbol_table.lookup(name)
+            if entry and entry['Entry Type'] == 'variable':
+                variables[name] = bit
+        certain = DefiniteAssignment(cfg, variables, functions)
+        possible = DefiniteAssignment(cfg, variables, functions, every_path=False)
+
+        results = []
+        for index in sorted(reached):
+            for (step, assigned), (_, maybe) in zip(certain.walk(index), possible.walk(index)):
+                for token in step.reads:
+                    bit = variables.get(token.value)
+                    if bit is None or assigned & bit:
+                        continue
+                    if maybe & bit:
+                        results.append(self.warning('S007', f"Semantic Warning: Variable '{token.value}' may be used before it is assigned at line {token.line}", token))
+                    else:
+                        results.append(self.error('S006', f"Semantic Error: Variable '{token.value}' used before it is assigned at line {token.line}", token))
+        results.extend(self.check_reached(self.program.body, builder.starts, reached))
+        results.sort(key=lambda diagnostic: (diagnostic.line, diagnostic.column or 0))
+        return results
+
+    def decided_edges(self, builder, reaching):
+        # The outcomes never taken of tests whose variable only ever holds literals that
+        # decide them the same way
+        removed = set()
+        for test, condition, passes_when, passed, failed in builder.branches:
+            outcome = self.condition_outcome(condition, reaching, test)
+            if outcome is not None:
+                removed.add((test, failed) if outcome == passes_when else (test, passed))
+        return removed
+
+    def reached_blocks(self, builder, cfg, removed):
+        # Blocks that can run: from the program start, and into each function running code calls
+        reached = set()
+        starts = cfg.entries[:1]
+        while starts:
+            found = cfg.reachable(starts, removed) - reached
+            reached |= found
+            starts = [builder.functions[name] for index in found for name in builder.calls.get(index, ())
+                      if name in builder.functions and builder.functions[name] not in reached]
+        return reached
+
+    def condition_outcome(self, condition, reaching, test):
+        # True or False when every definition reaching the test gives the same answer, else None
+        if condition.left.type != 'IDENTIFIER' or condition.right.type == 'IDENTIFIER':
+            return None
+        *_, (_, definitions) = reaching.walk(test)
+        values = [step.value for step in reaching.definitions(condition.left.value, definitions)]
+        if not values or None in values:
+            return None
+        try:
+            right = operand(condition.right).value
+            outcomes = {bool(evaluate(condition.operator.value, operand(value).value, right)) for value in values}
+        except (TypeError, ValueError, AttributeError):
+            return None
+        return outcomes.pop() if len(outcomes) == 1 else None
+
+    def check_reached(self, statements, starts, reached):
+        results = []
+        run = []
+        for statement in statements + [None]:
+            if statement is not None and starts.get(statement) not in reached:
+                if isinstance(statement, Function):
+                    results.append(self.warning('S008', f"Semantic Warning: Function '{statement.name.value}' is never called at line {statement.name.line}", statement.name))
+                else:
+                    run.append(statement)
+                continue
+            if run:
+                tokens = [token for node in run for token in leaf_tokens(node)]
+                results.append(self.warning('S008', f"Semantic Warning: Code at line {tokens[0].line} is never reached", tokens[0], tokens[-1]))
+                run = []
+            if isinstance(statement, IfStatement):
+                for branch in statement.branches:
+                    results.extend(self.check_reached(branch.body, starts, reached))
+            elif isinstance(statement, (WhileLoop, ForLoop, Function)):
+                results.extend(self.check_reached(statement.body, starts, reached))
+        return results
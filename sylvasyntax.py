@@ -1,295 +1,624 @@
-class Token:
-    def __init__(self, line, type, value):
-        self.line = line
-        self.type = type
-        self.value = value
+from itertools import islice
+from sylvalexical import Token
+from instrumentation import span, timed
+from diagnostics import Diagnostic, token_end
+from sylvaast import (Program, Declaration, Parameter, Assignment, BinaryOp, Condition, Branch,
+                      IfStatement, ForLoop, WhileLoop, Function, Call)
+
+operand_types = {'NUMERIC_LITERAL', 'FLOAT_LITERAL', 'STRING_LITERAL', 'BOOL_LITERAL', 'IDENTIFIER'}
+operator_precedence = {'==': 1, '!=': 1, '<': 1, '<=': 1, '>': 1, '>=': 1,
+                       '+': 2, '-': 2, '*': 3, '/': 3, '%': 3}
+
+# Token kinds the parser works with. Each keyword has a kind of its own, so a single integer
+# comparison checks both the type and the value of a token. END stands for the end of input.
+(END, OTHER, KEYWORD, DATA_TYPE, BOOL_LITERAL, IDENTIFIER, ASSIGNMENT, COMPARISON, INCREMENT, DECREMENT,
+ ARITHMETIC_OPERATOR, LOGICAL_OPERATOR, BITWISE_OPERATOR, LEFT_PAREN, RIGHT_PAREN, FLOAT_LITERAL,
+ NUMERIC_LITERAL, STRING_LITERAL, STATEMENT_END, SEPARATOR, COLON,
+ IF, IF_NOT, WHILE, FOR, FUNC, ELSE, THEN) = range(28)
+
+type_kinds = {'KEYWORD': KEYWORD, 'DATA_TYPE': DATA_TYPE, 'BOOL_LITERAL': BOOL_LITERAL, 'IDENTIFIER': IDENTIFIER,
+              'ASSIGNMENT': ASSIGNMENT, 'COMPARISON': COMPARISON, 'INCREMENT': INCREMENT, 'DECREMENT': DECREMENT,
+              'ARITHMETIC_OPERATOR': ARITHMETIC_OPERATOR, 'LOGICAL_OPERATOR': LOGICAL_OPERATOR,
+              'BITWISE_OPERATOR': BITWISE_OPERATOR, 'LEFT_PAREN': LEFT_PAREN, 'RIGHT_PAREN': RIGHT_PAREN,
+              'FLOAT_LITERAL': FLOAT_LITERAL, 'NUMERIC_LITERAL': NUMERIC_LITERAL, 'STRING_LITERAL': STRING_LITERAL,
+              'STATEMENT_END': STATEMENT_END, 'SEPARATOR': SEPARATOR, 'COLON': COLON}
+keyword_kinds = {'if': IF, 'if not': IF_NOT, 'while': WHILE, 'for': FOR, 'func': FUNC, 'else': ELSE, 'then': THEN}
+
+# (type, value) each kind stands for in diagnostics, worded as the old type and value checks were
+kind_names = {kind: (token_type, None) for token_type, kind in type_kinds.items()}
+kind_names.update({kind: ('KEYWORD', keyword) for keyword, kind in keyword_kinds.items()})
+kind_names[SEPARATOR] = ('SEPARATOR', ',')
+kind_names[END] = ('END', None)
+kind_names[OTHER] = ('OTHER', None)
+
+# FIRST set of every statement, plus the second token where the first is not enough to decide:
+# a statement starting with a name is a call only when '(' follows it
+statement_first = {
+    'analyze_declaration': {DATA_TYPE},
+    'analyze_condition': {IF},
+    'analyze_for_loop': {FOR},
+    'analyze_while_loop': {WHILE},
+    'analyze_function_statement': {FUNC},
+    'analyze_function_call': {IDENTIFIER},
+}
+statement_second = {'analyze_function_call': LEFT_PAREN}
+
+
+def build_dispatch_table(first_sets):
+    # Token kind -> the one statement it can start; two statements sharing a FIRST kind is an error
+    table = {}
+    for handler, first in first_sets.items():
+        for kind in first:
+            if kind in table:
+                raise ValueError(f"{handler} and {table[kind]} both start with {kind_names[kind][0]}")
+            table[kind] = handler
+    return table
+
+
+statement_table = build_dispatch_table(statement_first)
+
+# Fixed runs of tokens, checked one after another by expect_sequence
+# The '(' after 'then' is left to open_paren
+then_opening = (RIGHT_PAREN, COLON, THEN)  # '): then' closing a header
+else_opening = (COLON, THEN)
+expression_kinds = {NUMERIC_LITERAL, ARITHMETIC_OPERATOR, FLOAT_LITERAL, COMPARISON, STRING_LITERAL, BOOL_LITERAL,
+                    IDENTIFIER}
+then_value_kinds = {STRING_LITERAL, FLOAT_LITERAL, NUMERIC_LITERAL, BOOL_LITERAL}
+argument_kinds = {STRING_LITERAL, NUMERIC_LITERAL, FLOAT_LITERAL, IDENTIFIER}
+# The same sets as token types, for loops that scan the buffer without making kinds first
+expression_types = {kind_names[kind][0] for kind in expression_kinds}
+then_value_types = {kind_names[kind][0] for kind in then_value_kinds}
+
+# After an error the parser skips ahead to a synchronizing token and carries on from there.
+# These keywords only ever begin a statement, and so does a data type outside a header's
+# parentheses, so skipping never runs past them into the next statement.
+statement_keywords = {IF, WHILE, FOR, FUNC}
+branch_keywords = {IF_NOT, ELSE}
+block_follow = {STATEMENT_END, RIGHT_PAREN}  # an assignment in a then block ends at ';' or the block's ')'
+header_follow = {THEN}  # a header ends at '): then('
+statement_follow = {STATEMENT_END}
+# What may follow the '(' of a then block, a condition, a for header and a parameter list
+block_first = {IDENTIFIER, RIGHT_PAREN}
+condition_first = {IDENTIFIER}
+for_first = {DATA_TYPE}
+parameters_first = {DATA_TYPE, RIGHT_PAREN}
+max_syntax_errors = 100
+
+
+def token_kind(token):
+    kind = type_kinds.get(token.type, OTHER)
+    if kind == KEYWORD:
+        return keyword_kinds.get(token.value, KEYWORD)
+    return kind
+
+
+class TokenStream:
+    # Gives the parser indexed access to tokens that are pulled from an iterator on demand.
+    # Tokens before a released position are dropped, so lexing a file with lex_stream and
+    # parsing it never holds more than one statement's tokens, plus one batch read ahead.
+    read_ahead = 256
+    def __init__(self, tokens):
+        self.streaming = not isinstance(tokens, list)
+        if self.streaming:
+            self.buffer = []
+            self.iterator = iter(tokens)
+        else:
+            self.buffer = tokens
+            self.iterator = None
+        self.offset = 0
+
+    def fill(self, index):
+        # Pulls tokens a batch at a time until buffer index exists; returns whether it does
+        while index >= len(self.buffer):
+            if self.iterator is None:
+                return False
+            size = len(self.buffer)
+            self.buffer.extend(islice(self.iterator, self.read_ahead))
+            if len(self.buffer) == size:
+                self.iterator = None
+        return True
+
+    def get(self, index):
+        index -= self.offset
+        if index < len(self.buffer) or self.fill(index):
+            return self.buffer[index]
+        return None
+
+    def release(self, index):
+        if self.streaming:
+            del self.buffer[:index - self.offset]
+            self.offset = index
+
+
+class ParseFailure(SyntaxError):
+    # A syntax error with the code of the diagnostic it becomes
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class StatementAbandoned(ParseFailure):
+    # Raised once an error has been reported and the rest of the statement cannot be checked
+    def __init__(self):
+        super().__init__("Statement abandoned", None)
+
+
+def error_results(errors, max_errors=max_syntax_errors):
+    # The first max_errors diagnostics, with a note after them if there were more
+    results = errors[:max_errors]
+    if len(errors) > max_errors:
+        last = errors[max_errors - 1] if max_errors else errors[0]
+        results.append(Diagnostic('note', 'P006', 'parse', f"Too many syntax errors; stopped after {max_errors}",
+                                  last.end_line, last.end_column))
+    return results
+
 
 class SyntaxAnalyzer:
-    def __init__(self, tokens, symbol_table=None):
-        self.tokens = tokens
+    # Statements are dispatched through statement_table on the kind of their first token and
+    # every check compares integer kinds. An error is recorded in self.errors as a Diagnostic
+    # spanning the offending token and any skipped after it, and the parser
+    # synchronizes on the follow set of whatever it was in (a then block, a header or the
+    # statement), so one pass reports every error once instead of a cascade after the first.
+    def __init__(self, tokens, symbol_table=None, max_errors=max_syntax_errors):
+        self.tokens = TokenStream(tokens)
         self.pos = 0
         self.symbol_table = symbol_table
+        self.program = Program()
+        # Statements are timed only while profiling; a decorator would cost every parse a call each
+        self.handlers = {handler: timed(f'SyntaxAnalyzer.{handler}', getattr(self, handler))
+                         for handler in statement_first}
+        self.errors = []
+        self.max_errors = max_errors
+        self.statement_start = 0
+        self.statement_errors = 0
+        self.error_start = 0
+        self.furthest = 0  # Furthest position peek() has looked at in the current statement
 
     def current_token(self):
-        if self.pos < len(self.tokens):
-            return self.tokens[self.pos]
-        return None
+        return self.tokens.get(self.pos)
+
+    def current_line(self):
+        token = self.current_token()
+        return token.line if token else 'EOF'
 
     def next_token(self):
         self.pos += 1
         return self.current_token()
 
-    def expect(self, expected_type, expected_value=None):
+    def peek(self, ahead=0):
+        # Kind of the token ahead of the current one, END past the last token
+        stream = self.tokens
+        index = self.pos + ahead
+        if index > self.furthest:
+            self.furthest = index
+        index -= stream.offset
+        if index < len(stream.buffer) or stream.fill(index):
+            token = stream.buffer[index]
+            kind = type_kinds.get(token.type, OTHER)
+            if kind == KEYWORD:
+                return keyword_kinds.get(token.value, KEYWORD)
+            return kind
+        return END
+
+    def expect(self, kind):
+        stream = self.tokens
+        index = self.pos - stream.offset
+        if index >= len(stream.buffer) and not stream.fill(index):
+            raise self.mismatch(kind)
+        token = stream.buffer[index]
+        actual = type_kinds.get(token.type, OTHER)
+        if actual == KEYWORD:
+            actual = keyword_kinds.get(token.value, KEYWORD)
+        if actual != kind:
+            raise self.mismatch(kind)
+        self.pos += 1
+        return token
+
+    def mismatch(self, kind):
+        # The error for finding something other than kind at the current token
+        expected_type, expected_value = kind_names[kind]
         token = self.current_token()
-        if not token:
-            raise SyntaxError(f"Unexpected end of input. Expected {expected_type} {expected_value}")
+        if token is None:
+            return ParseFailure(f"Unexpected end of input. Expected {expected_type} {expected_value}", 'P002')
+        return ParseFailure(f"Expected {expected_value or expected_type} at line {token.line}, got {token.value}", 'P001')
+
+    def open_paren(self, following):
+        # The '(' opening a header or block. When it is missing, or one wrong token stands in
+        # its place, and what comes next is one of following, the error is reported and parsing
+        # carries on as if the '(' were there.
+        kind = self.peek()
+        if kind == LEFT_PAREN:
+            self.pos += 1
+        elif kind in following:
+            self.report(self.mismatch(LEFT_PAREN))
+        elif kind != END and self.peek(1) in following:
+            self.report(self.mismatch(LEFT_PAREN))
+            self.pos += 1
+        else:
+            raise self.mismatch(LEFT_PAREN)
+
+    def starts_statement(self, kind):
+        # Whether the token of kind at self.pos can only begin a new statement
+        return kind in statement_keywords or (kind == DATA_TYPE and self.peek(1) == IDENTIFIER)
 
-        if token.type != expected_type or (expected_value and token.value != expected_value):
-            expected = expected_value if expected_value else expected_type
-            raise SyntaxError(f"Expected {expected} at line {token.line}, got {token.value}")
+    def expect_sequence(self, kinds):
+        for kind in kinds:
+            self.expect(kind)
 
+    def advance(self):
+        # Takes the current token, whose kind the caller has already checked
+        token = self.tokens.get(self.pos)
         self.pos += 1
         return token
 
-    def match(self, expected_type, expected_value=None):
+    def match(self, kind):
+        return self.peek() == kind
+
+    def statement_handler(self):
+        # Name of the method parsing the statement at self.pos, or None
+        handler = statement_table.get(self.peek())
+        if handler is not None and handler in statement_second and self.peek(1) != statement_second[handler]:
+            return None
+        return handler
+
+    def report(self, error):
+        # Records a ParseFailure at the current token, or just past the last one at the end of
+        # input; synchronize() extends it over the tokens it skips
         token = self.current_token()
-        if not token:
-            return False
-        return token.type == expected_type and (expected_value is None or token.value == expected_value)
-
-    def analyze_statement(self):
-        statement_type = self.identify_statement_type()
-        if statement_type == 'declaration':
-            return self.analyze_declaration()
-        elif statement_type == 'if_statement':
-            return self.analyze_condition()
-        elif statement_type == 'for_loop':
-            return self.analyze_for_loop()
-        elif statement_type == 'while_loop':
-            return self.analyze_while_loop()
-        elif statement_type == 'function':
-            return self.analyze_function_statement()
-        elif statement_type == 'function_call':
-            return self.analyze_function_call()
+        if token is not None:
+            diagnostic = Diagnostic.spanning('error', error.code, 'parse', str(error), token)
+        elif self.pos > self.tokens.offset:
+            last = self.tokens.get(self.pos - 1)
+            diagnostic = Diagnostic('error', error.code, 'parse', str(error), last.line, token_end(last))
         else:
-            raise SyntaxError(f"Syntax error: Unexpected statement at line {self.current_token().line}")
+            diagnostic = Diagnostic('error', error.code, 'parse', str(error))
+        self.errors.append(diagnostic)
+        self.error_start = self.pos
 
-    def identify_statement_type(self):
-        token = self.current_token()
-        if token:
-            if token.type == 'KEYWORD':
-                if token.value == 'if':
-                    return 'if_statement'
-                elif token.value == 'for':
-                    return 'for_loop'
-                elif token.value == 'while':
-                    return 'while_loop'
-                elif token.value == 'func':
-                    return 'function'
-            elif token.type == 'DATA_TYPE':
-                return 'declaration'
-            elif token.type == 'IDENTIFIER':
-                next_token = self.tokens[self.pos + 1] if self.pos + 1 < len(self.tokens) else None
-                if next_token and next_token.type == 'LEFT_PAREN':
-                    return 'function_call'
-        return 'unknown'
+    def fail(self, error):
+        # What a statement handler returns after error: (False, the statement's first message)
+        if not isinstance(error, StatementAbandoned):
+            self.report(error)
+        return False, self.errors[self.statement_errors].message
+
+    def open_groups(self, stop):
+        # The parentheses open at position stop, innermost last, counted from the start of the
+        # statement: True for a then block, False for a header. Also returns the kind before stop.
+        groups = []
+        previous = END
+        for position in range(self.statement_start, stop):
+            kind = self.peek(position - self.pos)
+            if kind == LEFT_PAREN:
+                groups.append(previous == THEN)
+            elif kind == RIGHT_PAREN and groups:
+                groups.pop()
+            previous = kind
+        return groups, previous
+
+    def synchronize(self, follow, depth=0):
+        # Skips tokens after an error up to one in follow with depth parentheses open ('then'
+        # at any depth), which is consumed if it is ';' and returned. Stops early, returning
+        # None, at the end of input, at a ';' closing the statement or at a token that can
+        # only begin a new statement.
+        groups, previous = self.open_groups(self.pos)
+        kind = self.peek()
+        while kind != END and kind not in statement_keywords:
+            if kind == DATA_TYPE and (not groups or groups[-1]) and self.starts_statement(kind):
+                break
+            if kind in branch_keywords and groups and groups[-1]:
+                break  # The then block around it is missing its ')'
+            if kind in follow and (kind == THEN or len(groups) == depth):
+                if kind == STATEMENT_END:
+                    self.pos += 1
+                self.close_error()
+                return kind
+            if kind == STATEMENT_END and not groups:
+                break
+            if kind == LEFT_PAREN:
+                groups.append(previous == THEN)
+            elif kind == RIGHT_PAREN and groups:
+                groups.pop()
+            previous = kind
+            self.pos += 1
+            kind = self.peek()
+        self.close_error()
+        return None
+
+    def close_error(self):
+        if self.pos > self.error_start:
+            error = self.errors[-1]
+            last = self.tokens.get(self.pos - 1)
+            error.end_line = last.line
+            error.end_column = token_end(last)
+
+    def declaration(self):
+        datatype = self.expect(DATA_TYPE)
+        name = self.expect(IDENTIFIER)
+        self.expect(ASSIGNMENT)
+        value = self.expression()
+        if not value:
+            raise ParseFailure(f"Syntax Error: Invalid expression after assignment operator at line {self.current_line()}",
+                               'P004')
+        return Declaration(datatype, name, value, datatype.line)
 
     def analyze_declaration(self):
         try:
-            self.expect('DATA_TYPE')
-            self.expect('IDENTIFIER')
-            self.expect('ASSIGNMENT')
-            if not self.expression():
-                raise SyntaxError(f"Syntax Error: Invalid expression after assignment operator at line {self.current_token().line}")
-            self.expect('STATEMENT_END')
+            node = self.declaration()
+            self.expect(STATEMENT_END)
+            self.program.body.append(node)
             return True, "Declaration statement is correct"
-        except SyntaxError as e:
-            return False, str(e)
+        except ParseFailure as e:
+            return self.fail(e)
 
-    def analyze_condition(self):
+    def header(self, opening, parse=None, default=None):
+        # Parses a header with parse, then the opening of its then block. After an error the
+        # parser picks up again at 'then', so the block is still checked; default stands in
+        # for the header.
         try:
-            self.expect('KEYWORD', 'if')
-            self.expect('LEFT_PAREN')
-            self.analyze_condition_block()
-            self.expect('RIGHT_PAREN')
-            self.expect('COLON')
-            self.expect('KEYWORD', 'then')
-            self.expect('LEFT_PAREN')
-            self.analyze_then_block()
-            self.expect('RIGHT_PAREN')
-
-            while self.match('KEYWORD', 'if not') or self.match('KEYWORD', 'else'):
-                if self.match('KEYWORD', 'if not'):
-                    self.next_token()  # Skip 'if not'
-                    self.expect('LEFT_PAREN')
-                    self.analyze_condition_block()
-                    self.expect('RIGHT_PAREN')
-                    self.expect('COLON')
-                    self.expect('KEYWORD', 'then')
-                    self.expect('LEFT_PAREN')
-                    self.analyze_then_block()
-                    self.expect('RIGHT_PAREN')
-                elif self.match('KEYWORD', 'else'):
-                    self.next_token()  # Skip 'else'
-                    self.expect('COLON')
-                    self.expect('KEYWORD', 'then')
-                    self.expect('LEFT_PAREN')
-                    self.analyze_then_block()
-                    self.expect('RIGHT_PAREN')
-
-            self.expect('STATEMENT_END')
-            return True, "Conditional statement is correct"
-        except SyntaxError as e:
-            return False, str(e)
+            value = parse() if parse else default
+            self.expect_sequence(opening)
+        except StatementAbandoned:
+            raise
+        except ParseFailure as e:
+            self.report(e)
+            if self.synchronize(header_follow) is None:
+                raise StatementAbandoned() from e
+            self.expect(THEN)
+            value = default
+        self.open_paren(block_first)
+        return value
+
+    def parenthesized_condition(self):
+        self.open_paren(condition_first)
+        return self.analyze_condition_block()
+
+    def branch(self, kind, keyword, opening, parse=None):
+        # The rest of one if / if not / else branch, from after its keyword to its closing ')'
+        condition = self.header(opening, parse)
+        body = self.analyze_then_block()
+        self.expect(RIGHT_PAREN)
+        return Branch(kind, condition, body, keyword.line)
 
-    def analyze_assignment(self):
+    def analyze_condition(self):
         try:
-            self.expect('IDENTIFIER')
-            self.expect('ASSIGNMENT')
-            self.expression()
-            self.expect('STATEMENT_END')
-            return True, "Assignment statement is correct"
-        except SyntaxError as e:
-            return False, f"Syntax Error: {str(e)}"
+            keyword = self.expect(IF)
+            branches = [self.branch('if', keyword, then_opening, self.parenthesized_condition)]
+
+            kind = self.peek()
+            while kind == IF_NOT or kind == ELSE:
+                keyword = self.advance()  # Skip 'if not' or 'else'
+                if kind == IF_NOT:
+                    branches.append(self.branch('if not', keyword, then_opening, self.parenthesized_condition))
+                else:
+                    branches.append(self.branch('else', keyword, else_opening))
+                kind = self.peek()
+
+            self.expect(STATEMENT_END)
+            self.program.body.append(IfStatement(branches, branches[0].line))
+            return True, "Conditional statement is correct"
+        except ParseFailure as e:
+            return self.fail(e)
 
     def expression(self):
-        valid_types = ['NUMERIC_LITERAL', 'ARITHMETIC_OPERATOR', 'FLOAT_LITERAL', 'COMPARISON', 'STRING_LITERAL', 'BOOL_LITERAL', 'IDENTIFIER']
-        if self.current_token() and self.current_token().type in valid_types:
-            self.pos += 1
-            while self.current_token() and self.current_token().type in valid_types:
-                self.pos += 1
-            return True
-        else:
-            raise SyntaxError(f"Syntax error: Invalid expression at line {self.current_token().line}")
+        stream = self.tokens
+        buffer = stream.buffer
+        start = end = self.pos - stream.offset
+        while (end < len(buffer) or stream.fill(end)) and buffer[end].type in expression_types:
+            end += 1
+        if end == start:
+            raise ParseFailure(f"Syntax error: Invalid expression at line {self.current_line()}", 'P004')
+        self.pos += end - start
+        return self.expression_tree(buffer[start:end])
+
+    def expression_tree(self, run):
+        # Precedence climbing over the run expression() accepted. The grammar takes any run of
+        # operands and operators, so a malformed tail is dropped, and a run that does not start
+        # with an operand keeps its first token, which is all the old code generator looked at.
+        def climb(i, min_precedence):
+            if i >= len(run) or run[i].type not in operand_types:
+                return None, i
+            left = run[i]
+            i += 1
+            while i < len(run) and operator_precedence.get(run[i].value, 0) >= min_precedence:
+                operator = run[i]
+                right, j = climb(i + 1, operator_precedence[operator.value] + 1)
+                if right is None:
+                    break
+                left = BinaryOp(operator, left, right, operator.line)
+                i = j
+            return left, i
 
-    def skip_to_statement_end(self):
-        while self.current_token() and self.current_token().type != 'STATEMENT_END':
-            self.next_token()
-        self.next_token()  # Skip the STATEMENT_END
+        tree, _ = climb(0, 1)
+        return tree if tree is not None else run[0]
+
+    def last_read(self):
+        # Position of the last token the statement just parsed depended on: the one at self.pos,
+        # where the next statement starts, or a token past it that peek() looked ahead to.
+        # Every other read is at or behind self.pos; the four-token look in
+        # analyze_then_block only takes a match, and the checks after it decide anything else.
+        return max(self.pos, self.furthest)
+
+    def parse_statement(self):
+        # Parses the statement starting at self.pos and returns the same (result, message) pair
+        # as the analyzers. A statement with errors leaves no node, and parsing resumes after it.
+        self.statement_start = self.furthest = start = self.pos
+        self.statement_errors = len(self.errors)
+        body = self.program.body
+        count = len(body)
+        handler = self.statement_handler()
+        if handler is not None:
+            result, message = self.handlers[handler]()
+        else:
+            self.report(ParseFailure(f"Unexpected statement at line {self.current_line()}", 'P003'))
+            self.pos += 1
+            result = False
+        if len(self.errors) == self.statement_errors:
+            return result, message
+        del body[count:]
+        # A statement that broke off is skipped to its end; one that recovered is already there
+        if not result and self.synchronize(statement_follow) is None and self.pos == start:
+            self.pos += 1
+        return False, self.errors[self.statement_errors].message
 
+    @span('SyntaxAnalyzer.parse')
     def parse(self):
-        results = []
-        while self.pos < len(self.tokens):
-            statement_type = self.identify_statement_type()
-            if statement_type == 'declaration':
-                result, message = self.analyze_declaration()
-            elif statement_type == 'if_statement':
-                result, message = self.analyze_condition()
-            elif statement_type == 'for_loop':
-                result, message = self.analyze_for_loop()
-            elif statement_type == 'while_loop':
-                result, message = self.analyze_while_loop()
-            elif statement_type == 'function':
-                result, message = self.analyze_function_statement()
-            elif statement_type == 'function_call':
-                result, message = self.analyze_function_call()
-            else:
-                self.skip_to_statement_end()
-                result = False
-                message = f"Unexpected statement at line {self.current_token().line if self.current_token() else 'EOF'}"
-            if not result:
-                results.append((result, message))
-        return results
+        # Stops once there are more errors than it reports
+        while self.peek() != END and len(self.errors) <= self.max_errors:
+            self.parse_statement()
+            self.tokens.release(self.pos)
+        return error_results(self.errors, self.max_errors)
 
     def analyze_for_loop(self):
         try:
-            self.expect('KEYWORD', 'for')
-            self.expect('LEFT_PAREN')
-            self.analyze_declaration()  # Analyze the declarative statement
-            self.expect('SEPARATOR', ',')
-            self.analyze_condition_block()  # Analyze the condition block
-            self.expect('SEPARATOR', ',')
-            self.analyze_iteration_block()  # Analyze the iteration block
-            self.expect('RIGHT_PAREN')
-            self.expect('COLON')
-            self.expect('KEYWORD', 'then')
-            self.expect('LEFT_PAREN')
-            self.analyze_then_block()  # Analyze the then block
-            self.expect('RIGHT_PAREN')
-            self.expect('STATEMENT_END')
+            keyword = self.expect(FOR)
+            init, condition, variable, step = self.header(then_opening, self.for_header, (None,) * 4)
+            body = self.analyze_then_block()  # Analyze the then block
+            self.expect(RIGHT_PAREN)
+            self.expect(STATEMENT_END)
+            self.program.body.append(ForLoop(init, condition, variable, step, body, keyword.line))
             return True, "For loop statement is correct"
-        except SyntaxError as e:
-            return False, str(e)
+        except ParseFailure as e:
+            return self.fail(e)
+
+    def for_header(self):
+        self.open_paren(for_first)
+        init = self.analyze_for_declaration()  # Analyze the declarative statement
+        self.expect(SEPARATOR)
+        condition = self.analyze_condition_block()  # Analyze the condition block
+        self.expect(SEPARATOR)
+        variable, step = self.analyze_iteration_block()  # Analyze the iteration block
+        return init, condition, variable, step
 
     def analyze_while_loop(self):
         try:
-            self.expect('KEYWORD', 'while')
-            self.expect('LEFT_PAREN')
-            self.analyze_condition_block()  # Analyze the condition block
-            self.expect('RIGHT_PAREN')
-            self.expect('COLON')
-            self.expect('KEYWORD', 'then')
-            self.expect('LEFT_PAREN')
-            self.analyze_then_block()  # Analyze the then block
-            self.expect('RIGHT_PAREN')
-            self.expect('STATEMENT_END')
+            keyword = self.expect(WHILE)
+            condition = self.header(then_opening, self.parenthesized_condition)
+            body = self.analyze_then_block()  # Analyze the then block
+            self.expect(RIGHT_PAREN)
+            self.expect(STATEMENT_END)
+            self.program.body.append(WhileLoop(condition, body, keyword.line))
             return True, "While loop statement is correct"
-        except SyntaxError as e:
-            return False, str(e)
+        except ParseFailure as e:
+            return self.fail(e)
+
+    def analyze_for_declaration(self):
+        # The loop header has no ';' after its declaration. Errors here are not reported
+        # themselves; the parser stops where the declaration broke off and the next expect fails.
+        try:
+            node = self.declaration()
+            if self.peek() == STATEMENT_END:
+                self.pos += 1
+            return node
+        except ParseFailure:
+            return None
 
     def analyze_condition_block(self):
-        self.expect('IDENTIFIER')
-        self.expect('COMPARISON')
-        self.expect('NUMERIC_LITERAL')
+        left = self.expect(IDENTIFIER)
+        operator = self.expect(COMPARISON)
+        right = self.expect(NUMERIC_LITERAL)
+        return Condition(left, operator, right, left.line)
 
     def analyze_iteration_block(self):
-        if self.match('IDENTIFIER'):
-            self.expect('IDENTIFIER')
-            if self.match('INCREMENT'):
-                self.expect('INCREMENT')
-            elif self.match('DECREMENT'):
-                self.expect('DECREMENT')
+        if self.peek() == IDENTIFIER:
+            variable = self.advance()
+            kind = self.peek()
+            if kind == INCREMENT or kind == DECREMENT:
+                step = self.advance()
             else:
-                raise SyntaxError(f"Unexpected token in iteration block at line {self.current_token().line}")
+                raise ParseFailure(f"Unexpected token in iteration block at line {self.current_line()}", 'P005')
+            return variable, step
+        return None, None
 
     def analyze_then_block(self):
-        while not self.match('RIGHT_PAREN'):
-            self.expect('IDENTIFIER')
-            self.expect('ASSIGNMENT')
-            if self.match('STRING_LITERAL'):
-                self.expect('STRING_LITERAL')
-            elif self.match('FLOAT_LITERAL'):
-                self.expect('FLOAT_LITERAL')
-            elif self.match('NUMERIC_LITERAL'):
-                self.expect('NUMERIC_LITERAL')
-            elif self.match('BOOL_LITERAL'):
-                self.expect('BOOL_LITERAL')
-            else:
-                raise SyntaxError(f"Unexpected token at line {self.tokens[self.pos].line}")
-            self.expect('STATEMENT_END')
+        body = []
+        stream = self.tokens
+        buffer = stream.buffer
+        block_start = self.pos
+        while True:
+            # Well-formed 'name = literal;' is taken four tokens at a time; anything else goes
+            # through the checks below, which raise the exact error
+            index = self.pos - stream.offset
+            if index + 3 < len(buffer) or stream.fill(index + 3):
+                target, assignment, value, end = buffer[index:index + 4]
+                if (target.type == 'IDENTIFIER' and assignment.type == 'ASSIGNMENT'
+                        and value.type in then_value_types and end.type == 'STATEMENT_END'):
+                    body.append(Assignment(target, value, target.line))
+                    self.pos += 4
+                    continue
+            kind = self.peek()
+            if kind == RIGHT_PAREN or kind in branch_keywords or self.starts_statement(kind):
+                break  # A block that runs into the next branch or statement is missing its ')'
+            try:
+                target = self.expect(IDENTIFIER)
+                self.expect(ASSIGNMENT)
+                if self.peek() in then_value_kinds:
+                    value = self.advance()
+                else:
+                    raise ParseFailure(f"Unexpected token at line {self.current_line()}", 'P005')
+                self.expect(STATEMENT_END)
+                body.append(Assignment(target, value, target.line))
+            except ParseFailure as e:
+                # Resume at the next assignment, or stop at the block's ')'
+                self.report(e)
+                depth = len(self.open_groups(block_start)[0])
+                if self.synchronize(block_follow, depth) is None:
+                    raise StatementAbandoned() from e
+        return body
 
     def analyze_function_statement(self):
         try:
-            self.expect('KEYWORD', 'func')
-            self.expect('IDENTIFIER')  # Function name
-            self.expect('LEFT_PAREN')
-            self.analyze_parameter_block()  # Analyze the parameter block
-            self.expect('RIGHT_PAREN')
-            self.expect('COLON')
-            self.expect('KEYWORD', 'then')
-            self.expect('LEFT_PAREN')
-            self.analyze_then_block()  # Analyze the then block
-            self.expect('RIGHT_PAREN')
-            self.expect('STATEMENT_END')
+            keyword = self.expect(FUNC)
+            name, params = self.header(then_opening, self.function_header, (None, []))
+            body = self.analyze_then_block()  # Analyze the then block
+            self.expect(RIGHT_PAREN)
+            self.expect(STATEMENT_END)
+            self.program.body.append(Function(name, params, body, keyword.line))
             return True, "Function declaration is correct"
-        except SyntaxError as e:
-            return False, str(e)
+        except ParseFailure as e:
+            return self.fail(e)
+
+    def function_header(self):
+        name = self.expect(IDENTIFIER)  # Function name
+        self.open_paren(parameters_first)
+        params = self.analyze_parameter_block()  # Analyze the parameter block
+        return name, params
 
     def analyze_parameter_block(self):
-        if not self.match('RIGHT_PAREN'):
+        params = []
+        if self.peek() != RIGHT_PAREN:
             while True:
-                self.expect('DATA_TYPE')
-                self.expect('IDENTIFIER')
-                if self.match('SEPARATOR', ','):
-                    self.next_token()  # Skip the comma
+                datatype = self.expect(DATA_TYPE)
+                name = self.expect(IDENTIFIER)
+                params.append(Parameter(datatype, name, datatype.line))
+                if self.peek() == SEPARATOR:
+                    self.pos += 1  # Skip the comma
                 else:
                     break
+        return params
 
     def analyze_function_call(self):
         try:
-            self.expect('IDENTIFIER')  # Function name
-            self.expect('LEFT_PAREN')
-            if not self.match('RIGHT_PAREN'):
-                self.analyze_arguments()
-            self.expect('RIGHT_PAREN')
-            self.expect('STATEMENT_END')
+            name = self.expect(IDENTIFIER)  # Function name
+            self.expect(LEFT_PAREN)
+            args = []
+            if self.peek() != RIGHT_PAREN:
+                args = self.analyze_arguments()
+            self.expect(RIGHT_PAREN)
+            self.expect(STATEMENT_END)
+            self.program.body.append(Call(name, args, name.line))
             return True, "Function call is correct"
-        except SyntaxError as e:
-            return False, str(e)
+        except ParseFailure as e:
+            return self.fail(e)
 
     def analyze_arguments(self):
+        args = []
         while True:
-            if self.match('STRING_LITERAL'):
-                self.expect('STRING_LITERAL')
-            elif self.match('NUMERIC_LITERAL'):
-                self.expect('NUMERIC_LITERAL')
-            elif self.match('FLOAT_LITERAL'):
-                self.expect('FLOAT_LITERAL')
-            elif self.match('IDENTIFIER'):
-                self.expect('IDENTIFIER')
+            if self.peek() in argument_kinds:
+                args.append(self.advance())
             else:
-                raise SyntaxError(f"Unexpected token in function arguments at line {self.current_token().line}")
-            if self.match('SEPARATOR', ','):
-                self.next_token()  # Skip the comma
+                raise ParseFailure(f"Unexpected token in function arguments at line {self.current_line()}", 'P005')
+            if self.peek() == SEPARATOR:
+                self.pos += 1  # Skip the comma
             else:
                 break
+        return args
@@ -0,0 +1,202 @@
+import operator
+import time
+from bytecode import Bytecode, encode, decode, words_per_instruction, REGISTER, MEMORY, CONSTANT
+from instructions import Opcode
+from intermediatecode import evaluate
+from instrumentation import span, count
+
+
+class VMError(Exception):
+    pass
+
+
+class Undefined:
+    # What a variable holds before its first assignment. Register allocation may load and
+    # write back a variable that is only assigned on some paths, so reading one is not an error.
+    def __repr__(self):
+        return 'undefined'
+
+
+undefined = Undefined()
+
+
+# Same results as evaluate(), looked up once per instruction instead of on every execution
+operations = {
+    Opcode.ADD: operator.add,
+    Opcode.SUB: operator.sub,
+    Opcode.MUL: operator.mul,
+    Opcode.DIV: lambda left, right: evaluate('/', left, right),
+    Opcode.MOD: operator.mod,
+    Opcode.LT: lambda left, right: int(left < right),
+    Opcode.LE: lambda left, right: int(left <= right),
+    Opcode.GT: lambda left, right: int(left > right),
+    Opcode.GE: lambda left, right: int(left >= right),
+    Opcode.EQ: lambda left, right: int(left == right),
+    Opcode.NE: lambda left, right: int(left != right),
+}
+
+
+class VM:
+    # Runs bytecode on eight registers, a memory of named variables, a data stack for
+    # arguments past R3 and a separate call stack of return addresses.
+    def __init__(self, program, memory=None, max_instructions=1000000, time_limit=None, max_call_depth=1000):
+        if not isinstance(program, Bytecode):
+            program = decode(encode(program))
+        self.bytecode = program
+        self.max_instructions = max_instructions
+        self.time_limit = time_limit  # seconds, or None for no limit
+        self.max_call_depth = max_call_depth
+        self.registers = [0] * 8
+        self.memory = dict(memory or {})
+        self.stack = []
+        self.calls = []
+        self.steps = 0
+        self.elapsed = 0.0
+        # Jump table from opcode to the builder that turns one instruction into a closure
+        self.builders = {
+            Opcode.LOAD: self.build_load,
+            Opcode.STORE: self.build_store,
+            Opcode.MOV: self.build_load,
+            Opcode.JZ: self.build_jz,
+            Opcode.JMP: self.build_jmp,
+            Opcode.CALL: self.build_call,
+            Opcode.RET: self.build_ret,
+            Opcode.PUSH: self.build_push,
+            Opcode.POP: self.build_pop,
+        }
+        for opcode in operations:
+            self.builders[opcode] = self.build_arithmetic
+        self.program = [self.build(address) for address in range(len(program))]
+
+    def build(self, address):
+        base = address * words_per_instruction
+        code = self.bytecode.code
+        opcode = Opcode(code[base])
+        return self.builders[opcode](opcode, code[base + 1], code[base + 2], address + 1)
+
+    def fetcher(self, word):
+        # A function reading the operand's current value
+        kind, index = word & 3, word >> 2
+        registers, memory = self.registers, self.memory
+        if kind == REGISTER:
+            return lambda: registers[index]
+        if kind == CONSTANT:
+            value = self.bytecode.constants[index].value
+            return lambda: value
+        if kind == MEMORY:
+            name = self.bytecode.names[index]
+            return lambda: memory.get(name, undefined)
+        raise VMError(f"Bad operand {word}")
+
+    # Every closure runs one instruction and returns the address of the next one
+
+    def build_load(self, opcode, target, source, following):
+        registers, register = self.registers, target >> 2
+        if source & 3 == CONSTANT:
+            value = self.bytecode.constants[source >> 2].value
+
+            def load():
+                registers[register] = value
+                return following
+        else:
+            fetch = self.fetcher(source)
+
+            def load():
+                registers[register] = fetch()
+                return following
+        return load
+
+    def build_store(self, opcode, source, target, following):
+        registers, memory = self.registers, self.memory
+        register, name = source >> 2, self.bytecode.names[target >> 2]
+
+        def store():
+            memory[name] = registers[register]
+            return following
+        return store
+
+    def build_arithmetic(self, opcode, target, source, following):
+        registers, register = self.registers, target >> 2
+        operation, fetch = operations[opcode], self.fetcher(source)
+
+        def arithmetic():
+            registers[register] = operation(registers[register], fetch())
+            return following
+        return arithmetic
+
+    def build_jz(self, opcode, condition, target, following):
+        registers, register, address = self.registers, condition >> 2, target >> 2
+
+        def jz():
+            return following if registers[register] else address
+        return jz
+
+    def build_jmp(self, opcode, target, unused, following):
+        address = target >> 2
+        return lambda: address
+
+    def build_call(self, opcode, target, unused, following):
+        calls, address, depth = self.calls, target >> 2, self.max_call_depth
+
+        def call():
+            if len(calls) >= depth:
+                raise VMError(f"Call depth exceeded {depth}")
+            calls.append(following)
+            return address
+        return call
+
+    def build_ret(self, opcode, unused, unused_too, following):
+        calls = self.calls
+
+        def ret():
+            if not calls:
+                raise VMError("RET with no call to return to")
+            return calls.pop()
+        return ret
+
+    def build_push(self, opcode, source, unused, following):
+        stack, fetch = self.stack, self.fetcher(source)
+
+        def push():
+            stack.append(fetch())
+            return following
+        return push
+
+    def build_pop(self, opcode, target, unused, following):
+        stack, registers, register = self.stack, self.registers, target >> 2
+
+        def pop():
+            if not stack:
+                raise VMError("POP from an empty stack")
+            registers[register] = stack.pop()
+            return following
+        return pop
+
+    @span('VM.run', 'runtime')
+    def run(self):
+        # Returns the assigned variables once execution falls off the end of the program
+        program, end = self.program, len(self.program)
+        limit = self.max_instructions
+        deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+        start = time.perf_counter()
+        pc = 0
+        steps = self.steps
+        try:
+            while pc < end:
+                pc = program[pc]()
+                steps += 1
+                if steps >= limit and pc < end:
+                    raise VMError(f"Instruction limit of {limit} reached")
+                if deadline is not None and not steps & 4095 and time.perf_counter() > deadline:
+                    raise VMError(f"Time limit of {self.time_limit}s reached")
+        except (ArithmeticError, TypeError) as error:
+            raise VMError(f"{error} at address {pc}") from None
+        finally:
+            count('instructions executed', steps - self.steps)
+            self.steps = steps
+            self.elapsed += time.perf_counter() - start
+        return {name: value for name, value in self.memory.items() if value is not undefined}
+
+
+def execute(instructions, **limits):
+    return VM(instructions, **limits).run()